@@ -1,3 +1,12 @@
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+def default_tenant():
+    return settings.DEFAULT_TENANT
+
+class UserTenant(models.Model):
+    """Model definition for UserTenant, the business unit a user's decisions belong to."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='tenant')
+    tenant = models.CharField(max_length=64, default=default_tenant)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
@@ -8,6 +9,8 @@ from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 from rest_framework.validators import UniqueValidator
 
+from authentication.models import UserTenant
+
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """Serializer for user registration"""
@@ -23,10 +26,11 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     confirm_password = serializers.CharField(write_only=True)
     admin = serializers.BooleanField(default=False)
+    tenant = serializers.SlugField(max_length=64, required=False, write_only=True)
 
     class Meta:
         model = User
-        fields = ("id", "username", "email", "password", "confirm_password", "date_joined", "admin")
+        fields = ("id", "username", "email", "password", "confirm_password", "date_joined", "admin", "tenant")
         read_only_fields = ("id", "date_joined")
 
     def validate(self, attrs):
@@ -35,10 +39,19 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         attrs.pop('confirm_password')
         attrs['password'] = make_password(attrs['password'])
         return attrs
+
+    def validate_tenant(self, value):
+        # Users registering themselves join the default tenant, only admins place users in others
+        request = self.context.get('request')
+        if request is None or not request.user.is_staff:
+            raise serializers.ValidationError("Only admins can set the tenant.")
+        return value
     
     def create(self, validated_data):
         admin = validated_data.pop('admin', False)
+        tenant = validated_data.pop('tenant', settings.DEFAULT_TENANT)
         user = super().create(validated_data)
+        UserTenant.objects.create(user=user, tenant=tenant)
         if admin:
             user.is_superuser = True
             user.is_staff = True
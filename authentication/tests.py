@@ -73,6 +73,45 @@ class TestUserRegistrationAPIView:
         assert user.is_superuser == True
         assert user.is_staff == True
 
+    def test_user_registration_with_tenant(self):
+        """
+        Test to verify that a user registered by an admin belongs to the given tenant, or to the default one
+        """
+        admin = User.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        for username, tenant in (("acmeuser", "acme"), ("defaultuser", None)):
+            user_data = {
+                "username": username,
+                "email": f"{username}@testuser.com",
+                "password": "123123@sdD",
+                "confirm_password": "123123@sdD",
+            }
+            if tenant:
+                user_data["tenant"] = tenant
+            response = client.post(self.url, user_data)
+            assert 201 == response.status_code
+            assert "tenant" not in json.loads(response.content)["user"]
+        assert User.objects.get(username="acmeuser").tenant.tenant == "acme"
+        assert User.objects.get(username="defaultuser").tenant.tenant == "default"
+
+    def test_self_registration_cannot_set_tenant(self):
+        """
+        Test to verify that a user registering themselves can't join another tenant
+        """
+        user_data = {
+            "username": "intruder",
+            "email": "intruder@testuser.com",
+            "password": "123123@sdD",
+            "confirm_password": "123123@sdD",
+            "tenant": "acme",
+        }
+        client = APIClient()
+        response = client.post(self.url, user_data)
+        assert 400 == response.status_code
+        assert "tenant" in json.loads(response.content)
+        assert not User.objects.filter(username="intruder").exists()
+
     def test_unique_username_validation(self):
         """
         Test to verify that a post call with already existing username fails
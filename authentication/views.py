@@ -18,7 +18,7 @@ COMMON_RESPONSES = {
 class UserRegistrationAPIView(CreateAPIView):
     """User registration view"""
 
-    authentication_classes = ()
+    # Authenticated, so admins can register users in a tenant
     permission_classes = ()
     serializer_class = UserRegistrationSerializer
 
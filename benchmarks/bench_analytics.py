@@ -0,0 +1,98 @@
+"""
+Weekly outcome analytics, loop over model instances versus NumPy
+
+Spreads decisions over a year, a share of them completed and evaluated,
+then computes a year of weekly buckets three ways: a Python loop over
+the decisions as model instances, the vectorized computation of
+`decisions.analytics`, and the endpoint with every bucket cached.
+
+Usage: python benchmarks/bench_analytics.py [decisions]
+"""
+import random
+import sys
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from common import test_database, timed
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from decisions import analytics
+from decisions.models import Decision, Evaluation
+
+WEEKS = 52
+
+
+def fill(count, start):
+    random.seed(0)
+    for offset in range(0, count, 10000):
+        decisions = Decision.objects.bulk_create([
+            Decision(title=f'Decision {i}', description='Description', measurable_goal='Goal', status=random.choice(['Pending', 'Completed']))
+            for i in range(offset, min(offset + 10000, count))
+        ])
+        for decision in decisions:
+            decision.created_at = start + timedelta(seconds=random.randrange(WEEKS * 7 * 24 * 3600))
+            if decision.status == 'Completed':
+                decision.completed_at = decision.created_at + timedelta(hours=random.randrange(1, 200))
+                if random.random() < 0.5:
+                    decision.is_evaluated, decision.goal_met = True, random.random() < 0.6
+                    decision.evaluated_at = decision.completed_at + timedelta(hours=random.randrange(1, 500))
+        Decision.objects.bulk_update(decisions, ['created_at', 'completed_at', 'is_evaluated', 'goal_met', 'evaluated_at'])
+        Evaluation.objects.bulk_create([
+            Evaluation(decision=decision, goal_met=decision.goal_met) for decision in decisions if decision.is_evaluated
+        ])
+
+
+def python_loop(since, until):
+    """The straightforward way: every decision and its evaluation as objects"""
+    bounds = analytics.edges(analytics.WEEK, since, until)
+    buckets = defaultdict(lambda: {'created': 0, 'completed': 0, 'evaluated': 0, 'goal_met': 0, 'lags': []})
+
+    bounds = bounds.tolist()
+
+    def bucket_of(instant):
+        index = bisect_right(bounds, instant.timestamp()) - 1
+        return bounds[index] if 0 <= index < len(bounds) - 1 else None
+
+    for decision in Decision.objects.select_related('evaluation'):
+        buckets[bucket_of(decision.created_at)]['created'] += 1
+        if decision.completed_at:
+            buckets[bucket_of(decision.completed_at)]['completed'] += 1
+        evaluation = getattr(decision, 'evaluation', None)
+        if evaluation is not None:
+            bucket = buckets[bucket_of(decision.evaluated_at)]
+            bucket['evaluated'] += 1
+            bucket['goal_met'] += evaluation.goal_met
+            bucket['lags'].append((decision.evaluated_at - decision.created_at).total_seconds() / 3600)
+    for bucket in buckets.values():
+        lags = sorted(bucket.pop('lags'))
+        bucket['p50'] = lags[len(lags) // 2] if lags else None
+    return buckets
+
+
+def vectorized(since, until):
+    bounds = analytics.edges(analytics.WEEK, since, until)
+    return analytics.compute(analytics.load([Decision.objects.filter(tenant='default')], bounds[0], bounds[-1]), bounds)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with test_database():
+        start = timezone.now() - timedelta(weeks=WEEKS)
+        fill(count, start)
+        until = timezone.now().date()
+        since = until - timedelta(weeks=WEEKS - 1)
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_superuser('bench', 'bench@example.com', 'password'))
+        url = f'/api/decisions/analytics?since={since}&until={until}'
+
+        print(f'{count} decisions, {WEEKS} weekly buckets')
+        print(f'{"python loop":>14} {timed(lambda: python_loop(since, until), 3):>10.1f}ms')
+        print(f'{"numpy":>14} {timed(lambda: vectorized(since, until), 3):>10.1f}ms')
+        print(f'{"endpoint cold":>14} {timed(lambda: (cache.clear(), client.get(url)), 3):>10.1f}ms')
+        client.get(url)
+        print(f'{"endpoint warm":>14} {timed(lambda: client.get(url), 20):>10.1f}ms')
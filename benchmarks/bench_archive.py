@@ -0,0 +1,51 @@
+"""
+Hot path latency with a growing archive
+
+The number of hot decisions stays the same while more evaluated history
+is archived, list/search/count latency should not move.
+
+Usage: python benchmarks/bench_archive.py [hot] [history...]
+"""
+import sys
+
+from common import test_database, timed
+
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from decisions.models import ArchivedDecision, ArchivedEvaluation, Decision
+
+
+def fill_archive(start, count):
+    now = timezone.now()
+    for offset in range(0, count, 5000):
+        ids = range(start + offset, start + min(offset + 5000, count))
+        ArchivedDecision.objects.bulk_create([
+            ArchivedDecision(id=i, title=f'Archived {i}', description='Description', measurable_goal='Goal',
+                             status='Completed', created_at=now, updated_at=now)
+            for i in ids
+        ])
+        ArchivedEvaluation.objects.bulk_create([
+            ArchivedEvaluation(decision_id=i, goal_met=True, comments='', evaluated_at=now) for i in ids
+        ])
+
+
+if __name__ == '__main__':
+    hot = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    history = [int(value) for value in sys.argv[2:]] or [0, 100000, 400000]
+    with test_database():
+        Decision.objects.bulk_create([
+            Decision(title=f'Decision {i}', description='Description', measurable_goal='Goal', status='Pending')
+            for i in range(hot)
+        ])
+        client = APIClient()
+        archived = 0
+        print(f'{hot} hot decisions')
+        print(f'{"archived":>10} {"list":>10} {"search":>10} {"status":>10}')
+        for target in history:
+            fill_archive(10 ** 9 + archived, target - archived)
+            archived = target
+            list_ms = timed(lambda: client.get('/api/decisions'), 50)
+            search_ms = timed(lambda: client.get('/api/decisions', {'search': 'Decision 9'}), 50)
+            status_ms = timed(lambda: client.get('/api/decisions', {'status': 'Pending', 'page': 3}), 50)
+            print(f'{archived:>10} {list_ms:>8.2f}ms {search_ms:>8.2f}ms {status_ms:>8.2f}ms')
@@ -0,0 +1,52 @@
+"""
+Autocomplete latency with many decisions
+
+Times `GET /api/decisions/autocomplete` for queries of growing length,
+against the in-process prefix index, or against the trigram and prefix
+indexes when run with the PostgreSQL settings. Compared with a search
+with `?search=`, which scans the titles.
+
+Usage: python benchmarks/bench_autocomplete.py [decisions]
+"""
+import random
+import string
+import sys
+
+from common import test_database, timed
+
+from django.db import connection
+from rest_framework.test import APIClient
+
+from decisions.models import Decision
+
+WORDS = ['budget', 'hiring', 'vendor', 'pipeline', 'pricing', 'roadmap', 'office', 'migration', 'review', 'policy']
+
+
+def fill(count):
+    random.seed(0)
+    for offset in range(0, count, 10000):
+        Decision.objects.bulk_create([
+            Decision(
+                title=' '.join(random.sample(WORDS, 3)) + ' ' + ''.join(random.choices(string.ascii_lowercase, k=6)),
+                description='Description', measurable_goal='Goal',
+            )
+            for _ in range(min(10000, count - offset))
+        ])
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with test_database():
+        fill(count)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE decisions_decision')
+        client = APIClient()
+        url = '/api/decisions/autocomplete'
+        load_ms = timed(lambda: client.get(url, {'q': 'b'}), 1)
+        print(f'{count} decisions on {connection.vendor}, first lookup {load_ms:.1f}ms')
+        print(f'{"query":>22} {"autocomplete":>13} {"search":>10}')
+        for query in ('b', 'bu', 'budget', 'budget hir', 'budget hiring vendor', 'budgte'):
+            autocomplete_ms = timed(lambda: client.get(url, {'q': query}), 200)
+            search_ms = timed(lambda: client.get('/api/decisions', {'search': query}), 5)
+            print(f'{query:>22} {autocomplete_ms:>11.2f}ms {search_ms:>8.2f}ms')
@@ -0,0 +1,98 @@
+"""
+Deleting many decisions, one QuerySet.delete versus the chunked bulk delete job
+
+While the decisions of a filter are deleted, a thread keeps updating a
+decision outside of it, like live traffic. Reported are the time the
+delete took and the longest an update waited, which is how long the
+delete held the database locks at once.
+
+Usage: python benchmarks/bench_bulk_delete.py [--decisions 20000] [--chunk-size 1000]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from common import test_database
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils import timezone
+
+from decisions import tasks
+from decisions.models import Decision, Evaluation
+from jobs.models import Job
+
+
+def populate(count):
+    Decision.objects.all().delete()
+    Decision.objects.bulk_create([
+        Decision(title=f'Decision {i}', description='Description', measurable_goal='Goal', status='Completed')
+        for i in range(count)
+    ], batch_size=5000)
+    Evaluation.objects.bulk_create([
+        Evaluation(decision_id=pk, goal_met=True)
+        for pk in Decision.objects.values_list('pk', flat=True)[:count // 2]
+    ], batch_size=5000)
+    Decision.objects.update(created_at=timezone.now() - timedelta(days=400))
+    return Decision.objects.create(title='Live', description='Description', measurable_goal='Goal')
+
+
+def with_live_traffic(live, delete):
+    waits, stop = [], threading.Event()
+
+    def update():
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                Decision.objects.filter(pk=live.pk).update(title='Live')
+                waits.append(time.perf_counter() - start)
+                time.sleep(0.001)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=update)
+    thread.start()
+    start = time.perf_counter()
+    delete()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    return elapsed, max(waits, default=0)
+
+
+def queryset_delete():
+    Decision.objects.filter(created_at__lt=timezone.now() - timedelta(days=365)).delete()
+
+
+def bulk_delete_job():
+    until_id = Decision.objects.order_by('-pk').values_list('pk', flat=True).first()
+    filters = {'created_before': (timezone.now() - timedelta(days=365)).isoformat()}
+    job = Job.objects.create(kind='decisions.bulk_delete', status=Job.RUNNING)
+    tasks.delete_decisions(job, 'default', filters, until_id)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--decisions', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    if connection.vendor == 'sqlite':
+        # Threads need a database file, the default in-memory test database has table locks
+        path = os.path.join(tempfile.mkdtemp(), 'bench_bulk_delete.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = path
+        # Transactions reading before they write take the write lock upfront, upgrading it later fails on contention
+        connection.settings_dict['OPTIONS'] = {**connection.settings_dict['OPTIONS'], 'timeout': 120, 'transaction_mode': 'IMMEDIATE'}
+
+    with test_database():
+        settings.DECISION_BULK_DELETE_CHUNK_SIZE = args.chunk_size
+        print(f'{args.decisions} decisions, chunks of {args.chunk_size}, pause {settings.DECISION_BULK_DELETE_PAUSE}s')
+        print(f'{"delete":>16} {"took":>8} {"longest update wait":>20}')
+        for name, delete in (('QuerySet.delete', queryset_delete), ('chunked job', bulk_delete_job)):
+            live = populate(args.decisions)
+            elapsed, wait = with_live_traffic(live, delete)
+            assert Decision.objects.count() == 1
+            print(f'{name:>16} {elapsed:>7.2f}s {wait * 1000:>18.1f}ms')
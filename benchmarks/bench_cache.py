@@ -0,0 +1,52 @@
+"""
+Cache backends shared by processes: SQLite versus files and the database
+
+Times hits, misses and sets of small values with `SQLiteCache`, Django's
+`FileBasedCache` and `DatabaseCache` (on the test database, run with the
+PostgreSQL settings to measure it on PostgreSQL), and `LocMemCache` as
+the per process baseline.
+
+Usage: python benchmarks/bench_cache.py [entries]
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from common import test_database, timed
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.commands.createcachetable import Command as CreateCacheTable
+from django.db import DEFAULT_DB_ALIAS
+
+from enterpriseApi.cache import SQLiteCache
+
+VALUE = {'count': 12345, 'exact': True}
+
+
+def measure(name, backend, entries):
+    keys = [f'decisions:count:1:{i:032x}' for i in range(entries)]
+    backend.clear()
+    position = iter(range(10 ** 9))
+    set_ms = timed(lambda: backend.set(keys[next(position) % entries], VALUE, 300), entries) * 1000
+    position = iter(range(10 ** 9))
+    hit_ms = timed(lambda: backend.get(keys[next(position) % entries]), entries) * 1000
+    miss_ms = timed(lambda: backend.get('decisions:count:1:missing'), entries) * 1000
+    print(f'{name:>10} {hit_ms:>9.1f}us {miss_ms:>9.1f}us {set_ms:>9.1f}us')
+
+
+if __name__ == '__main__':
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    directory = Path(tempfile.mkdtemp())
+    options = {'OPTIONS': {'MAX_ENTRIES': entries * 2}}
+    with test_database():
+        create_table = CreateCacheTable()
+        create_table.verbosity = 0
+        create_table.create_table(DEFAULT_DB_ALIAS, 'bench_cache', dry_run=False)
+        print(f'{entries} entries, per operation')
+        print(f'{"backend":>10} {"hit":>11} {"miss":>11} {"set":>11}')
+        measure('locmem', LocMemCache('bench', options), entries)
+        measure('sqlite', SQLiteCache(directory / 'cache.sqlite3', options), entries)
+        measure('file', FileBasedCache(directory / 'files', options), entries)
+        measure('database', DatabaseCache('bench_cache', options), entries)
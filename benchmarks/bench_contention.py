@@ -0,0 +1,102 @@
+"""
+Concurrent updates of the same decisions, optimistic versus pessimistic
+
+Threads update a few hot decisions, each update reads the decision, works
+for `--work-ms` and writes it back. Optimistic updates write with
+`save(expected_version=...)` and start over on `StaleVersion`, pessimistic
+updates lock the row for the whole read-work-write. Both must end with no
+lost update.
+
+On PostgreSQL the row lock is `SELECT ... FOR UPDATE`. SQLite has no row
+locks, so there the lock is a no-op UPDATE of the row which takes the
+database write lock, as `select_for_update()` is ignored.
+
+Usage: python benchmarks/bench_contention.py [--threads 8] [--updates 50] [--hot 2] [--work-ms 2]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import test_database
+
+from django.db import connection, connections, transaction
+from django.db.models import F
+
+from decisions.models import Decision, StaleVersion
+
+
+def optimistic_update(pk, work):
+    retries = 0
+    while True:
+        decision = Decision.objects.get(pk=pk)
+        time.sleep(work)
+        decision.title = f'Updated {time.perf_counter()}'
+        try:
+            decision.save(expected_version=decision.version)
+            return retries
+        except StaleVersion:
+            retries += 1
+
+
+def pessimistic_update(pk, work):
+    with transaction.atomic():
+        if connection.vendor == 'sqlite':
+            Decision.objects.filter(pk=pk).update(version=F('version'))
+            decision = Decision.objects.get(pk=pk)
+        else:
+            decision = Decision.objects.select_for_update().get(pk=pk)
+        time.sleep(work)
+        decision.title = f'Updated {time.perf_counter()}'
+        decision.save()
+    return 0
+
+
+def run(update, pks, threads, updates, work):
+    retries = []
+
+    def worker(index):
+        try:
+            retries.append(sum(update(pks[(index + i) % len(pks)], work) for i in range(updates)))
+        finally:
+            connections.close_all()
+
+    Decision.objects.filter(pk__in=pks).update(version=1)
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    written = sum(Decision.objects.filter(pk__in=pks).values_list('version', flat=True)) - len(pks)
+    assert written == threads * updates, f'{threads * updates - written} lost updates'
+    return threads * updates / elapsed, sum(retries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--updates', type=int, default=50, help="Updates per thread")
+    parser.add_argument('--hot', type=int, default=2, help="Number of decisions updated")
+    parser.add_argument('--work-ms', type=float, default=2.0, help="Time between the read and the write")
+    args = parser.parse_args()
+
+    if connection.vendor == 'sqlite':
+        # Threads need a database file, the default in-memory test database has table locks
+        path = os.path.join(tempfile.mkdtemp(), 'bench_contention.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = path
+        connection.settings_dict['OPTIONS'] = {**connection.settings_dict['OPTIONS'], 'timeout': 60}
+
+    with test_database():
+        pks = [
+            Decision.objects.create(title=f'Decision {i}', description='Description', measurable_goal='Goal').pk
+            for i in range(args.hot)
+        ]
+        print(f'{args.threads} threads x {args.updates} updates of {args.hot} decisions, {args.work_ms}ms of work')
+        print(f'{"strategy":>12} {"updates/s":>10} {"retries":>8}')
+        for name, update in (('optimistic', optimistic_update), ('pessimistic', pessimistic_update)):
+            throughput, retries = run(update, pks, args.threads, args.updates, args.work_ms / 1000)
+            print(f'{name:>12} {throughput:>10.1f} {retries:>8}')
@@ -0,0 +1,73 @@
+"""
+Date range queries with and without the created_at index
+
+Decisions are inserted in created_at order, as they are in production.
+Counts ranges covering a growing share of the table and lists their
+first page through the API, then does the same after dropping the
+index: the BRIN index on PostgreSQL (run with the PostgreSQL settings),
+the B-tree elsewhere. Prints the plan of the narrowest range with the index.
+
+Usage: python benchmarks/bench_date_ranges.py [decisions]
+"""
+import sys
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from common import test_database, timed
+
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from decisions.indexes import DEFAULT_INDEXES, POSTGRES_INDEXES
+from decisions.models import Decision
+
+SHARES = (0.001, 0.01, 0.1)
+
+
+def fill(count, start):
+    for offset in range(0, count, 10000):
+        decisions = Decision.objects.bulk_create([
+            Decision(title=f'Decision {i}', description='Description', measurable_goal='Goal')
+            for i in range(offset, min(offset + 10000, count))
+        ])
+        # auto_now_add stamped them all with now, spread them over a minute each
+        for i, decision in enumerate(decisions, offset):
+            decision.created_at = start + timedelta(minutes=i)
+        Decision.objects.bulk_update(decisions, ['created_at'])
+
+
+def measure(client, count, start):
+    for share in SHARES:
+        since = start + timedelta(minutes=count * (1 - share))
+        queryset = Decision.objects.filter(tenant='default', created_at__gte=since)
+        count_ms = timed(queryset.count, 20)
+        url = '/api/decisions?' + urlencode({'created_after': since.isoformat(), 'ordering': 'title'})
+        list_ms = timed(lambda: client.get(url), 20)
+        print(f'{share:>8.1%} {count_ms:>8.2f}ms {list_ms:>8.2f}ms')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with test_database():
+        start = timezone.now() - timedelta(minutes=count)
+        fill(count, start)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('VACUUM ANALYZE decisions_decision')
+            else:
+                cursor.execute('ANALYZE')
+        client = APIClient()
+        narrow = Decision.objects.filter(tenant='default', created_at__gte=start + timedelta(minutes=count * (1 - SHARES[0])))
+
+        print(f'{count} decisions on {connection.vendor}')
+        print(f'{"range":>8} {"count":>10} {"list":>10}')
+        measure(client, count, start)
+        print(narrow.explain())
+
+        index = 'decision_created_brin_idx' if connection.vendor == 'postgresql' else 'decision_tenant_created_idx'
+        assert any(index in statement for statement in POSTGRES_INDEXES + DEFAULT_INDEXES)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {index}')
+        print(f'\nWithout {index}')
+        measure(client, count, start)
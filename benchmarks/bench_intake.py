@@ -0,0 +1,75 @@
+"""
+Concurrent decision creates, synchronous versus write-behind
+
+Threads post decisions through the API, each create is either inserted
+in its own transaction or queued with `Prefer: respond-async` and
+inserted in batches by the flusher. Throughput of the write-behind
+creates is measured until the last decision is inserted, not until the
+last 202.
+
+Usage: python benchmarks/bench_intake.py [--threads 8] [--creates 500]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import test_database
+
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from decisions import intake, views
+from decisions.models import Decision
+
+DATA = {'title': 'Decision', 'description': 'Description', 'measurable_goal': 'Goal', 'status': 'Pending'}
+
+
+def run(user, threads, creates, prefer):
+    def worker():
+        client = APIClient()
+        client.force_authenticate(user=user)
+        try:
+            for _ in range(creates):
+                response = client.post('/api/decisions', DATA, format='json', HTTP_PREFER=prefer)
+                assert response.status_code in (201, 202), response.content
+        finally:
+            connections.close_all()
+
+    Decision.objects.all().delete()
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    accepted = time.perf_counter() - start
+    while Decision.objects.count() < threads * creates:
+        time.sleep(0.01)
+    return threads * creates / (time.perf_counter() - start), accepted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--creates', type=int, default=500, help="Creates per thread")
+    args = parser.parse_args()
+
+    if connection.vendor == 'sqlite':
+        # Threads need a database file, the default in-memory test database has table locks
+        path = os.path.join(tempfile.mkdtemp(), 'bench_intake.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = path
+        connection.settings_dict['OPTIONS'] = {**connection.settings_dict['OPTIONS'], 'timeout': 60}
+
+    with test_database():
+        user = get_user_model().objects.create_superuser(username='bench', email='bench@example.com', password='password')
+        # A queue of its own, so the flusher uses the test database
+        views.decision_intake = intake.WriteBehindQueue()
+        print(f'{args.threads} threads x {args.creates} creates')
+        print(f'{"mode":>12} {"creates/s":>10} {"accepted in":>12}')
+        for name, prefer in (('synchronous', ''), ('write-behind', 'respond-async')):
+            throughput, accepted = run(user, args.threads, args.creates, prefer)
+            print(f'{name:>12} {throughput:>10.1f} {accepted:>11.2f}s')
+        views.decision_intake.stop()
@@ -0,0 +1,50 @@
+"""
+Overhead of the request metrics
+
+Times decision list and retrieve requests with and without
+`MetricsMiddleware`, and the cost of a single histogram observation.
+With --multiprocess the samples go to memory-mapped files, as they do
+when PROMETHEUS_MULTIPROC_DIR is set in production.
+
+Usage: python benchmarks/bench_metrics.py [--multiprocess] [requests]
+"""
+import os
+import sys
+import tempfile
+
+if '--multiprocess' in sys.argv:
+    sys.argv.remove('--multiprocess')
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='metrics-')
+
+from common import test_database, timed  # noqa: E402
+
+from django.conf import settings  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from decisions.models import Decision  # noqa: E402
+from enterpriseApi.metrics import REQUEST_LATENCY  # noqa: E402
+
+MIDDLEWARE = 'enterpriseApi.metrics.MetricsMiddleware'
+
+
+if __name__ == '__main__':
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    mode = 'multiprocess' if os.environ.get('PROMETHEUS_MULTIPROC_DIR') else 'single process'
+    histogram = REQUEST_LATENCY.labels('Benchmark', 'observe', '200')
+    print(f'{mode}: observe {timed(lambda: histogram.observe(0.01), 100000) * 1000:.2f}us')
+
+    with test_database():
+        Decision.objects.bulk_create([
+            Decision(title=f'Decision {i}', description='Description', measurable_goal='Goal', status='Pending')
+            for i in range(100)
+        ])
+        pk = Decision.objects.first().pk
+        print(f'{"":>16} {"list":>10} {"retrieve":>10}')
+        without = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+        for label, middleware in (('without metrics', without), ('with metrics', settings.MIDDLEWARE)):
+            with override_settings(MIDDLEWARE=middleware):
+                client = APIClient()
+                list_ms = timed(lambda: client.get('/api/decisions'), number)
+                retrieve_ms = timed(lambda: client.get(f'/api/decisions/{pk}'), number)
+            print(f'{label:>16} {list_ms:>8.3f}ms {retrieve_ms:>8.3f}ms')
@@ -0,0 +1,53 @@
+"""
+Compare DRF's default JSONRenderer against the orjson renderer
+
+Usage: python benchmarks/bench_renderers.py [page_size]
+"""
+import sys
+import timeit
+from datetime import timedelta
+
+import common  # noqa: F401
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from enterpriseApi.renderers import ORJSONRenderer
+
+
+def make_page(size, native_datetimes):
+    now = timezone.now()
+    fmt = (lambda value: value) if native_datetimes else (lambda value: value.isoformat().replace('+00:00', 'Z'))
+    return {
+        'count': size * 100,
+        'next': 'http://localhost:8000/api/decisions?page=2',
+        'previous': None,
+        'results': [
+            {
+                'id': i,
+                'title': f'Decision {i}',
+                'description': 'Lorem ipsum dolor sit amet ' * 10,
+                'measurable_goal': 'Increase revenue by 10%',
+                'status': 'Completed',
+                'created_at': fmt(now - timedelta(days=i)),
+                'updated_at': fmt(now),
+                'evaluation': {'goal_met': True, 'comments': 'Good job', 'evaluated_at': fmt(now)},
+            }
+            for i in range(size)
+        ],
+    }
+
+
+def bench(label, renderer, data, number):
+    seconds = timeit.timeit(lambda: renderer.render(data), number=number)
+    print(f'{label:<40} {seconds / number * 1000:8.3f} ms/page')
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    number = max(1, 20000 // size)
+    print(f'page size {size}, {number} iterations (DATETIME_FORMAT={api_settings.DATETIME_FORMAT!r})')
+    bench('JSONRenderer (formatted datetimes)', JSONRenderer(), make_page(size, False), number)
+    bench('JSONRenderer (native datetimes)', JSONRenderer(), make_page(size, True), number)
+    bench('ORJSONRenderer (native datetimes)', ORJSONRenderer(), make_page(size, True), number)
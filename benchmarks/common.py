@@ -0,0 +1,36 @@
+"""Helpers shared by the benchmark scripts"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'enterpriseApi.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+
+@contextmanager
+def test_database():
+    """Run against a throwaway test database, like the test suite does"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def timed(func, number):
+    """Average milliseconds per call of `func`"""
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1000
@@ -1,3 +1,140 @@
+"""
+Admin of decisions and evaluations, usable on tables with millions of rows
+
+- Counts are estimated past `EstimatedCountPaginator.exact_count_threshold`
+  rows, like the API lists, and the unfiltered total is not counted.
+- Filters are on indexed columns, tenant choices come from the status
+  counters instead of a DISTINCT over the decisions.
+- Rows are ordered by id, newest first, and search is by title prefix.
+- Bulk actions are one UPDATE or DELETE for the whole selection. As they
+  bypass the model signals, they keep the counters and the history in
+  sync themselves.
+
+Decisions of tenants placed on other shards than `default` are not listed.
+"""
+from collections import Counter
+
 from django.contrib import admin
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from decisions import analytics, history
+from decisions.models import Decision, DecisionHistory, DecisionStatusCount, Evaluation
+from decisions.pagination import CountedPaginator, estimate_count, invalidate_cached_counts
+from enterpriseApi.metrics import EVALUATION_RESETS
+
+
+class EstimatedCountPaginator(CountedPaginator):
+    """Paginator counting big querysets from the cache or the planner estimate"""
+
+    exact_count_threshold = 1000
+    cache_timeout = 300
+
+    def __init__(self, object_list, *args, **kwargs):
+        super().__init__(object_list, *args, count=None, **kwargs)
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list, self.exact_count_threshold, self.cache_timeout)[0]
+
+
+class TenantFilter(admin.SimpleListFilter):
+    title = 'tenant'
+    parameter_name = 'tenant'
+
+    def lookups(self, request, model_admin):
+        tenants = DecisionStatusCount.objects.order_by('tenant').values_list('tenant', flat=True).distinct()
+        return [(tenant, tenant) for tenant in tenants]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(tenant=self.value())
+        return queryset
+
+
+class EvaluationInline(admin.StackedInline):
+    model = Evaluation
+    extra = 0
+    max_num = 1
+    readonly_fields = ['evaluated_at']
+
+
+@admin.register(Decision)
+class DecisionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'title', 'tenant', 'status', 'is_evaluated', 'goal_met', 'evaluation_comments', 'updated_at']
+    list_select_related = ['evaluation']
+    # Each backed by a (tenant, column) index
+    list_filter = [TenantFilter, 'status', 'is_evaluated', 'goal_met']
+    search_fields = ['^title']
+    search_help_text = 'Titles starting with the search'
+    # Keyset friendly: the primary key, or updated_at backed by its (updated_at, id) index
+    ordering = ['-id']
+    sortable_by = ['id', 'updated_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    readonly_fields = ['version', 'is_evaluated', 'goal_met', 'evaluated_at', 'completed_at', 'intake_id', 'created_at', 'updated_at']
+    inlines = [EvaluationInline]
+    actions = ['mark_completed', 'reset_evaluation']
+
+    @admin.display(description='Evaluation')
+    def evaluation_comments(self, decision):
+        evaluation = getattr(decision, 'evaluation', None)
+        return evaluation.comments[:80] if evaluation is not None else '-'
+
+    @admin.action(description='Mark selected decisions as completed')
+    def mark_completed(self, request, queryset):
+        database = router.db_for_write(Decision)
+        with transaction.atomic(using=database):
+            pending = list(queryset.filter(status='Pending').using(database).select_for_update().values_list('pk', 'tenant'))
+            moved = Counter(tenant for _, tenant in pending)
+            now = timezone.now()
+            updated = Decision.objects.using(database).filter(pk__in=[pk for pk, _ in pending]).update(
+                status='Completed', completed_at=now, version=F('version') + 1, updated_at=now, change_seq=None,
+            )
+            history.record_many([
+                (pk, tenant, DecisionHistory.UPDATED, {'status': 'Completed', 'completed_at': now}) for pk, tenant in pending
+            ], using=database)
+            for tenant, count in moved.items():
+                DecisionStatusCount.adjust(tenant, 'Pending', -count)
+                DecisionStatusCount.adjust(tenant, 'Completed', count)
+        invalidate_cached_counts(using=database)
+        for tenant in moved:
+            analytics.invalidate(tenant)
+        self.message_user(request, f'Marked {updated} decisions as completed.')
+
+    @admin.action(description='Reset the evaluation of selected decisions')
+    def reset_evaluation(self, request, queryset):
+        database = router.db_for_write(Decision)
+        with transaction.atomic(using=database):
+            evaluated = list(queryset.filter(is_evaluated=True).using(database).select_for_update().values_list('pk', 'tenant'))
+            pks = [pk for pk, _ in evaluated]
+            tenants = {tenant for _, tenant in evaluated}
+            # A plain DELETE, the evaluation signals would update each decision one by one
+            deleted = Evaluation.objects.using(database).filter(decision_id__in=pks)._raw_delete(database)
+            Decision.objects.using(database).filter(pk__in=pks).update(
+                is_evaluated=False, goal_met=None, evaluated_at=None, version=F('version') + 1, updated_at=timezone.now(),
+                change_seq=None,
+            )
+            history.record_many([(pk, tenant, DecisionHistory.EVALUATION_RESET, {}) for pk, tenant in evaluated], using=database)
+        EVALUATION_RESETS.inc(deleted)
+        invalidate_cached_counts(using=database)
+        for tenant in tenants:
+            analytics.invalidate(tenant)
+        self.message_user(request, f'Reset the evaluation of {deleted} decisions.')
+
 
-# Register your models here.
+@admin.register(Evaluation)
+class EvaluationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'decision', 'goal_met', 'evaluated_at']
+    list_select_related = ['decision']
+    list_filter = ['goal_met']
+    # Picking the decision from a select box would load every decision
+    raw_id_fields = ['decision']
+    ordering = ['-id']
+    sortable_by = ['id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
@@ -0,0 +1,183 @@
+"""
+Decision outcome analytics per week or month
+
+The timestamps, status and outcome of the decisions in the requested
+range, hot and archived, are read in one query each into NumPy arrays.
+Every metric is then computed for all buckets at once: rows are assigned
+to buckets with a binary search over the bucket edges, counts and rates
+are bincounts, lag percentiles come from one sort by bucket and lag.
+
+Results are cached per bucket. Writes delete the buckets holding the
+timestamps they change, see `touch`, so past buckets stay cached while
+the current one is recomputed. Writes to many decisions at once call
+`invalidate`, which drops every bucket of the tenant.
+
+Weeks start on Monday, buckets are in UTC.
+"""
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Q
+
+from decisions.models import Decision
+from enterpriseApi.metrics import CACHE_REQUESTS
+
+WEEK = 'week'
+MONTH = 'month'
+BUCKETS = (WEEK, MONTH)
+PERCENTILES = (50, 90, 99)
+COLUMNS = ['status', 'created_at', 'completed_at', 'goal_met', 'evaluated_at']
+CACHE_TIMEOUT = 24 * 60 * 60
+GENERATION_KEY = 'decisions:analytics-generation:{}'
+
+DAY = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY
+# 1970-01-01 was a Thursday, days since Monday are (days + 3) % 7
+EPOCH_WEEKDAY = 3
+
+
+def floor(bucket, seconds):
+    """Start of the buckets of `seconds` since the epoch, as seconds since the epoch"""
+    seconds = np.asarray(seconds, dtype=np.int64)
+    if bucket == WEEK:
+        days = seconds // DAY
+        return (days - (days + EPOCH_WEEKDAY) % 7) * DAY
+    return seconds.astype('datetime64[s]').astype('datetime64[M]').astype('datetime64[s]').astype(np.int64)
+
+
+def edges(bucket, since, until):
+    """Bounds of the buckets covering the days `since` to `until`, the last being the end of the last bucket"""
+    first, last = floor(bucket, [_epoch(since), _epoch(until)])
+    if bucket == WEEK:
+        return np.arange(first, last + 2 * WEEK_SECONDS, WEEK_SECONDS, dtype=np.int64)
+    months = np.arange(first.astype('datetime64[s]').astype('datetime64[M]'), last.astype('datetime64[s]').astype('datetime64[M]') + 2)
+    return months.astype('datetime64[s]').astype(np.int64)
+
+
+def default_since(bucket, until, count=12):
+    """First day of the `count` buckets ending with the one of `until`"""
+    if bucket == WEEK:
+        return until - timedelta(weeks=count - 1)
+    month = until.year * 12 + until.month - 1 - (count - 1)
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _epoch(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc).timestamp())
+
+
+def _seconds(values):
+    return np.fromiter((np.nan if value is None else value.timestamp() for value in values), dtype=np.float64, count=len(values))
+
+
+def load(querysets, start, end):
+    """Columns of the decisions with a timestamp between `start` and `end` seconds, as arrays"""
+    start, end = (datetime.fromtimestamp(int(bound), dt_timezone.utc) for bound in (start, end))
+    in_range = Q()
+    for field in ('created_at', 'completed_at', 'evaluated_at'):
+        in_range |= Q(**{f'{field}__gte': start, f'{field}__lt': end})
+    rows = []
+    for queryset in querysets:
+        rows.extend(queryset.filter(in_range).order_by().values_list(*COLUMNS))
+    status, created_at, completed_at, goal_met, evaluated_at = zip(*rows) if rows else ([],) * len(COLUMNS)
+    return {
+        'status': np.array(status, dtype=object),
+        'created_at': _seconds(created_at),
+        'completed_at': _seconds(completed_at),
+        'goal_met': np.fromiter((np.nan if value is None else value for value in goal_met), dtype=np.float64, count=len(goal_met)),
+        'evaluated_at': _seconds(evaluated_at),
+    }
+
+
+def compute(columns, bounds):
+    """Metrics of each bucket between consecutive `bounds`"""
+    count = len(bounds) - 1
+
+    def bucket_of(seconds):
+        # NaN sorts after every bound, so missing timestamps fall out of range
+        index = np.searchsorted(bounds, seconds, side='right') - 1
+        return index, (index >= 0) & (index < count)
+
+    created, created_valid = bucket_of(columns['created_at'])
+    created_by_status = {
+        status: np.bincount(created[created_valid & (columns['status'] == status)], minlength=count)
+        for status, _ in Decision.STATUS_CHOICES
+    }
+    completed, completed_valid = bucket_of(columns['completed_at'])
+    completed_counts = np.bincount(completed[completed_valid], minlength=count)
+
+    evaluated, evaluated_valid = bucket_of(columns['evaluated_at'])
+    evaluated = evaluated[evaluated_valid]
+    evaluated_counts = np.bincount(evaluated, minlength=count)
+    goal_met = np.bincount(evaluated, weights=np.nan_to_num(columns['goal_met'][evaluated_valid]), minlength=count)
+    lag = (columns['evaluated_at'][evaluated_valid] - columns['created_at'][evaluated_valid]) / 3600
+
+    # Lags sorted by bucket then value, each bucket is a contiguous slice
+    order = np.lexsort((lag, evaluated))
+    lag, starts = lag[order], np.searchsorted(evaluated[order], np.arange(count + 1))
+
+    results = []
+    for index in range(count):
+        bucket_lag = lag[starts[index]:starts[index + 1]]
+        results.append({
+            'start': datetime.fromtimestamp(int(bounds[index]), dt_timezone.utc).date().isoformat(),
+            'created': int(sum(counts[index] for counts in created_by_status.values())),
+            'created_by_status': {status: int(counts[index]) for status, counts in created_by_status.items()},
+            'completed': int(completed_counts[index]),
+            'evaluated': int(evaluated_counts[index]),
+            'goal_met_rate': float(goal_met[index] / evaluated_counts[index]) if evaluated_counts[index] else None,
+            'evaluation_lag_hours': {
+                f'p{percentile}': float(value)
+                for percentile, value in zip(PERCENTILES, np.percentile(bucket_lag, PERCENTILES))
+            } if len(bucket_lag) else None,
+        })
+    return results
+
+
+def _generation(tenant):
+    return cache.get_or_set(GENERATION_KEY.format(tenant), 1, None)
+
+
+def _cache_key(tenant, generation, bucket, start):
+    return f'decisions:analytics:{tenant}:{generation}:{bucket}:{int(start)}'
+
+
+def bucket_analytics(tenant, bucket, since, until, querysets):
+    """Metrics of the buckets covering the days `since` to `until`, from the cache or computed from `querysets`"""
+    bounds = edges(bucket, since, until)
+    generation = _generation(tenant)
+    keys = [_cache_key(tenant, generation, bucket, start) for start in bounds[:-1]]
+    cached = cache.get_many(keys)
+    missing = [index for index, key in enumerate(keys) if key not in cached]
+    CACHE_REQUESTS.labels('decision_analytics', 'hit').inc(len(keys) - len(missing))
+    if missing:
+        CACHE_REQUESTS.labels('decision_analytics', 'miss').inc(len(missing))
+        # One read covering every missing bucket, the cached ones in between are refreshed too
+        first, last = missing[0], missing[-1] + 1
+        computed = compute(load(querysets, bounds[first], bounds[last]), bounds[first:last + 1])
+        fresh = dict(zip(keys[first:last], computed))
+        cache.set_many(fresh, CACHE_TIMEOUT)
+        cached.update(fresh)
+    return [cached[key] for key in keys]
+
+
+def touch(tenant, *instants):
+    """Drop the cached buckets holding `instants`, called on writes with the timestamps they change"""
+    seconds = [int(instant.timestamp()) for instant in instants if instant is not None]
+    if not seconds:
+        return
+    generation = _generation(tenant)
+    cache.delete_many([
+        _cache_key(tenant, generation, bucket, start)
+        for bucket in BUCKETS
+        for start in set(floor(bucket, seconds).tolist())
+    ])
+
+
+def invalidate(tenant):
+    """Drop every cached bucket of `tenant`"""
+    try:
+        cache.incr(GENERATION_KEY.format(tenant))
+    except ValueError:
+        cache.set(GENERATION_KEY.format(tenant), 1, None)
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class DecisionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'decisions'
+
+    def ready(self):
+        from decisions import signals  # noqa: F401
+        from decisions.indexes import create_indexes
+
+        post_migrate.connect(create_indexes, sender=self)
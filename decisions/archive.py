@@ -0,0 +1,157 @@
+from collections import Counter
+
+from django.db import router, transaction
+from django.db.models import BooleanField, Value
+
+from decisions import history
+from decisions.models import (
+    ArchivedDecision,
+    ArchivedEvaluation,
+    Decision,
+    DecisionHistory,
+    DecisionStatusCount,
+    DecisionTombstone,
+    Evaluation,
+    StaleVersion,
+)
+from decisions.pagination import invalidate_cached_counts
+
+DECISION_FIELDS = [
+    'title', 'description', 'measurable_goal', 'status', 'created_at', 'updated_at', 'version',
+    'is_evaluated', 'goal_met', 'evaluated_at', 'completed_at', 'intake_id',
+]
+EVALUATION_FIELDS = ['goal_met', 'comments', 'evaluated_at']
+
+# Columns of the hot/archive union, everything the list can be ordered by
+UNION_FIELDS = ['id', 'title', 'status', 'created_at', 'updated_at', 'is_evaluated', 'goal_met']
+
+
+def archivable(cutoff):
+    """Evaluated decisions not written since `cutoff`"""
+    return Decision.objects.filter(status='Completed', evaluation__isnull=False, updated_at__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Move up to `batch_size` archivable decisions of the current shard to the archive tables
+
+    Rows are copied and deleted in one transaction with set-based
+    statements, bypassing the delete signals: an archived decision is not
+    a deleted one, so it gets no tombstone. Returns the number of
+    decisions archived.
+    """
+    db = router.db_for_write(Decision)
+    with transaction.atomic(using=db):
+        decisions = list(
+            archivable(cutoff).using(db).select_related('evaluation')
+            .order_by('pk')[:batch_size].select_for_update(skip_locked=True, of=('self',))
+        )
+        if not decisions:
+            return 0
+
+        ArchivedDecision.objects.using(db).bulk_create([
+            ArchivedDecision(id=decision.pk, tenant=decision.tenant, **{field: getattr(decision, field) for field in DECISION_FIELDS})
+            for decision in decisions
+        ])
+        ArchivedEvaluation.objects.using(db).bulk_create([
+            ArchivedEvaluation(decision_id=decision.pk, **{field: getattr(decision.evaluation, field) for field in EVALUATION_FIELDS})
+            for decision in decisions
+        ])
+        pks = [decision.pk for decision in decisions]
+        Evaluation.objects.using(db).filter(decision_id__in=pks)._raw_delete(db)
+        Decision.objects.using(db).filter(pk__in=pks)._raw_delete(db)
+        for tenant, archived in Counter(decision.tenant for decision in decisions).items():
+            DecisionStatusCount.adjust(tenant, 'Completed', -archived)
+    invalidate_cached_counts()
+    return len(pks)
+
+
+def restore(pk, tenant):
+    """
+    Move an archived decision back to the decision table
+
+    Returns the restored decision, or None if `pk` isn't archived.
+    """
+    pk = _as_pk(pk)
+    if pk is None:
+        return None
+    db = router.db_for_write(Decision)
+    with transaction.atomic(using=db):
+        archived = (
+            ArchivedDecision.objects.using(db).select_related('evaluation')
+            .select_for_update().filter(pk=pk, tenant=tenant).first()
+        )
+        if archived is None:
+            return None
+
+        decision = Decision(pk=archived.pk, tenant=tenant, **{field: getattr(archived, field) for field in DECISION_FIELDS})
+        decision._restored = True
+        decision.save(force_insert=True, using=db)
+        evaluation = getattr(archived, 'evaluation', None)
+        if evaluation is not None:
+            # Without the evaluation signal, the decision already has its summary and the history its entry
+            Evaluation.objects.using(db).bulk_create([
+                Evaluation(decision=decision, **{field: getattr(evaluation, field) for field in EVALUATION_FIELDS})
+            ])
+            Evaluation.objects.using(db).filter(decision=decision).update(evaluated_at=evaluation.evaluated_at)
+        # auto_now_add/auto_now overwrote the timestamps on insert
+        Decision.objects.using(db).filter(pk=pk).update(
+            created_at=archived.created_at, updated_at=archived.updated_at,
+            evaluated_at=evaluation.evaluated_at if evaluation is not None else None,
+        )
+        archived.delete()
+    return decision
+
+
+def delete_archived(pk, tenant, expected_version=None):
+    """
+    Delete an archived decision, leaving a tombstone and a history entry. Returns whether it existed
+
+    With `expected_version`, raises `StaleVersion` if the decision has another version.
+    """
+    pk = _as_pk(pk)
+    if pk is None:
+        return False
+    db = router.db_for_write(ArchivedDecision)
+    with transaction.atomic(using=db):
+        archived = ArchivedDecision.objects.filter(pk=pk, tenant=tenant)
+        if expected_version is not None and archived.exclude(version=expected_version).exists():
+            raise StaleVersion()
+        deleted, _ = archived.delete()
+        if deleted:
+            DecisionTombstone.objects.create(decision_id=pk, tenant=tenant)
+            history.record(pk, tenant, DecisionHistory.DELETED, using=db)
+    return bool(deleted)
+
+
+def _as_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def with_archive(hot, archived, ordering):
+    """
+    Union of hot and archived decisions, as rows of `UNION_FIELDS` plus `archived`
+
+    Both querysets must already be filtered. Pages of the union are turned
+    back into decisions by `hydrate`.
+    """
+    hot = hot.order_by().values(*UNION_FIELDS).annotate(archived=Value(False, output_field=BooleanField()))
+    archived = archived.order_by().values(*UNION_FIELDS).annotate(archived=Value(True, output_field=BooleanField()))
+    return hot.union(archived, all=True).order_by(*ordering, 'id')
+
+
+def hydrate(rows):
+    """
+    Load the decisions of a page of `with_archive` rows, keeping their order
+
+    Rows archived or restored since the page was read are left out.
+    """
+    hot_ids = [row['id'] for row in rows if not row['archived']]
+    archived_ids = [row['id'] for row in rows if row['archived']]
+    hot = Decision.objects.select_related('evaluation').in_bulk(hot_ids)
+    archived = ArchivedDecision.objects.select_related('evaluation').in_bulk(archived_ids)
+    decisions = [(archived if row['archived'] else hot).get(row['id']) for row in rows]
+    return [decision for decision in decisions if decision is not None]
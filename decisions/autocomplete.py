@@ -0,0 +1,219 @@
+"""
+Title autocomplete for search-as-you-type
+
+On PostgreSQL suggestions come from the database: titles starting with
+the query, then titles with a word similar to it by trigrams, both served
+by indexes created after `migrate` (see `decisions.indexes`).
+
+Other databases can't search by similarity, suggestions come from an
+in-process index instead: the titles of a tenant sorted case-insensitively,
+searched by prefix with a binary search. It is loaded on the first lookup,
+kept up to date by the decision signals of this process and reloaded after
+`AUTOCOMPLETE_INDEX_TTL` seconds to pick up the writes of other processes.
+Loads run in one background thread per index, lookups meanwhile are
+served from the titles loaded before.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from decisions.models import Decision
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def _insert(entries, entry):
+    position = bisect_left(entries, entry)
+    if position == len(entries) or entries[position] != entry:
+        entries.insert(position, entry)
+
+
+def _delete(entries, entry):
+    position = bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
+
+
+class PrefixIndex:
+    """Titles of the decisions of one tenant on one database, sorted for prefix search"""
+
+    def __init__(self, database, tenant):
+        self.database = database
+        self.tenant = tenant
+        # (normalized title, id, title)
+        self.entries = []
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        # Changes made while a load runs, applied again to the titles it read. None when not loading
+        self._loading = None
+        self._thread = None
+
+    @property
+    def stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > settings.AUTOCOMPLETE_INDEX_TTL
+
+    def refresh(self):
+        """Reload the index in a background thread, unless a load is already running"""
+        with self._lock:
+            if self._loading is not None:
+                return
+            self._loading = []
+            self._thread = threading.Thread(target=self._load_in_thread, name=f'autocomplete-{self.tenant}', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """Wait for the load in progress, if any"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _load_in_thread(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Loading the autocomplete index of %s on %s failed", self.tenant, self.database)
+            with self._lock:
+                self._loading = None
+        finally:
+            connections[self.database].close()
+
+    def load(self):
+        rows = (
+            Decision.objects.using(self.database).filter(tenant=self.tenant)
+            .values_list('id', 'title').iterator(chunk_size=10000)
+        )
+        entries = sorted((normalize(title), pk, title) for pk, title in rows)
+        with self._lock:
+            for change in self._loading or ():
+                change(entries)
+            self.entries = entries
+            self.loaded_at = time.monotonic()
+            self._loading = None
+
+    def _change(self, change):
+        with self._lock:
+            change(self.entries)
+            if self._loading is not None:
+                self._loading.append(change)
+
+    def add(self, pk, title):
+        self._change(partial(_insert, entry=(normalize(title), pk, title)))
+
+    def remove(self, pk, title):
+        self._change(partial(_delete, entry=(normalize(title), pk, title)))
+
+    def search(self, query, limit):
+        prefix = normalize(query)
+        with self._lock:
+            position = bisect_left(self.entries, (prefix,))
+            matches = []
+            for key, pk, title in self.entries[position:position + limit]:
+                if not key.startswith(prefix):
+                    break
+                matches.append({'id': pk, 'title': title})
+        return matches
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def prefix_index(database, tenant, load=True):
+    """
+    The index of `tenant` on `database`, loaded if needed unless `load` is false
+
+    A stale index is served while it is reloaded in the background, only
+    the first lookup of a tenant waits for its load.
+    """
+    with _indexes_lock:
+        index = _indexes.get((database, tenant))
+        if index is None:
+            if not load:
+                return None
+            index = _indexes[(database, tenant)] = PrefixIndex(database, tenant)
+    if load and index.stale:
+        index.refresh()
+        if index.loaded_at is None:
+            index.wait()
+    return index
+
+
+def clear_indexes():
+    """Forget the indexes, once their loads in progress finished"""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+        _indexes.clear()
+    for index in indexes:
+        index.wait()
+
+
+def _update_index(database, tenant, update):
+    index = prefix_index(database, tenant, load=False)
+    if index is not None:
+        update(index)
+
+
+def decision_written(decision, previous_title):
+    """Update the loaded index of the decision's tenant once the write commits, from the decision signals"""
+    if previous_title == decision.title:
+        return
+    pk, title = decision.pk, decision.title
+
+    def update(index):
+        if previous_title is not None:
+            index.remove(pk, previous_title)
+        index.add(pk, title)
+
+    database = decision._state.db
+    transaction.on_commit(lambda: _update_index(database, decision.tenant, update), using=database)
+
+
+def decisions_created(database, tenant, decisions):
+    """Add decisions inserted without signals, once the insert commits"""
+    entries = [(decision.pk, decision.title) for decision in decisions]
+
+    def update(index):
+        for pk, title in entries:
+            index.add(pk, title)
+
+    if entries:
+        transaction.on_commit(lambda: _update_index(database, tenant, update), using=database)
+
+
+def decision_deleted(decision):
+    pk, title, database = decision.pk, decision.title, decision._state.db
+    transaction.on_commit(lambda: _update_index(database, decision.tenant, lambda index: index.remove(pk, title)), using=database)
+
+
+def _search_database(queryset, query, limit):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    prefix = Q(title__istartswith=query)
+    if len(query) < settings.AUTOCOMPLETE_TRIGRAM_MIN_LENGTH:
+        # Too short for trigrams, only the prefix index helps
+        queryset = queryset.filter(prefix).order_by('title')
+    else:
+        queryset = queryset.filter(prefix | Q(title__trigram_word_similar=query)).annotate(
+            is_prefix=Case(When(prefix, then=Value(1)), default=Value(0), output_field=IntegerField()),
+            similarity=TrigramWordSimilarity(query, 'title'),
+        ).order_by('-is_prefix', '-similarity', 'title')
+    return list(queryset.values('id', 'title')[:limit])
+
+
+def suggest(queryset, tenant, query, limit):
+    """Up to `limit` decisions of `queryset` whose title matches `query`, as id and title"""
+    database = router.db_for_read(Decision)
+    if connections[database].vendor == 'postgresql':
+        return _search_database(queryset, query, limit)
+    # The index follows the writes, so it belongs to the database written to even when reads go to a replica
+    return prefix_index(router.db_for_write(Decision), tenant).search(query, limit)
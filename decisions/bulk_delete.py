@@ -0,0 +1,70 @@
+"""
+Deleting the decisions matching the list filters, chunk by chunk
+
+A filter can match hundreds of thousands of decisions. Deleting them in
+one statement would hold its locks until the end, and `QuerySet.delete`
+collects the cascade to the evaluations in Python. Here each chunk is
+the next `DECISION_BULK_DELETE_CHUNK_SIZE` matching decisions by primary
+key, deleted in a short transaction with set-based statements: the
+evaluations first, then the decisions. As they bypass the delete signals,
+chunks write the tombstones, the history entries and the status counters
+themselves. Hot decisions are deleted first, then archived ones.
+
+Decisions created after the request are kept: only ids up to the highest
+one when the request was made are deleted. Autocomplete indexes of other
+processes drop the deleted titles on their next reload.
+"""
+from collections import Counter
+
+from django.db import router, transaction
+
+from decisions import analytics, history
+from decisions.models import (
+    ArchivedDecision,
+    ArchivedEvaluation,
+    Decision,
+    DecisionHistory,
+    DecisionStatusCount,
+    DecisionTombstone,
+    Evaluation,
+)
+from decisions.pagination import invalidate_cached_counts
+
+HOT = 'hot'
+ARCHIVED = 'archived'
+# Deleted in this order, with the evaluation model cascaded to and whether the status counters include them
+PHASES = [
+    (HOT, Decision, Evaluation, True),
+    (ARCHIVED, ArchivedDecision, ArchivedEvaluation, False),
+]
+
+
+def delete_chunk(queryset, evaluation_model, after, chunk_size, counted=True):
+    """
+    Delete the next `chunk_size` decisions of `queryset` with an id above `after`
+
+    Returns the number deleted and the highest id deleted, (0, after)
+    once none are left.
+    """
+    database = router.db_for_write(queryset.model)
+    with transaction.atomic(using=database):
+        rows = list(
+            queryset.using(database).filter(pk__gt=after).order_by('pk').select_for_update()
+            .values_list('pk', 'tenant', 'status')[:chunk_size]
+        )
+        if not rows:
+            return 0, after
+        pks = [pk for pk, _, _ in rows]
+        evaluation_model.objects.using(database).filter(decision_id__in=pks)._raw_delete(database)
+        queryset.model.objects.using(database).filter(pk__in=pks)._raw_delete(database)
+        DecisionTombstone.objects.using(database).bulk_create([
+            DecisionTombstone(decision_id=pk, tenant=tenant) for pk, tenant, _ in rows
+        ])
+        history.record_many([(pk, tenant, DecisionHistory.DELETED, {}) for pk, tenant, _ in rows], using=database)
+        if counted:
+            for (tenant, status), count in Counter((tenant, status) for _, tenant, status in rows).items():
+                DecisionStatusCount.adjust(tenant, status, -count)
+    invalidate_cached_counts()
+    for tenant in {tenant for _, tenant, _ in rows}:
+        analytics.invalidate(tenant)
+    return len(rows), pks[-1]
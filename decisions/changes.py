@@ -0,0 +1,173 @@
+"""
+Incremental change feed of the decisions
+
+Writes leave `change_seq` empty on the decisions and tombstones they
+write. Readers first number every committed write left empty, all with
+the next value of the `ChangeSequence` of the shard, see `number_changes`,
+then page by (change_seq, id). Numbers are given in commit order, so a
+reader having seen a number has seen every write numbered before it.
+Paging by `updated_at` instead would skip writes whose transaction took
+its timestamp before another one but committed after a reader went past.
+"""
+import base64
+import heapq
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from decisions.models import ChangeSequence, Decision, DecisionTombstone
+from decisions.serializers import DecisionSerializer
+
+
+class InvalidToken(ValueError):
+    """Raised for a change feed token which can't be decoded"""
+
+
+class TokenExpired(Exception):
+    """Raised when tombstones newer than the token may already have been pruned"""
+
+
+def encode_token(seq, pk, changed_at):
+    raw = f'{seq}|{pk}|{changed_at.isoformat()}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token):
+    """(change_seq, id, changed_at) of the change a token points at"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        parts = raw.split('|')
+        if len(parts) == 2:
+            # Tokens of the feed paged by timestamp can't be placed in the sequence
+            raise TokenExpired()
+        seq, pk, changed_at = parts
+        seq, pk, changed_at = int(seq), int(pk), datetime.fromisoformat(changed_at)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidToken(str(exc))
+    if timezone.is_naive(changed_at):
+        raise InvalidToken('Token is missing a timezone.')
+    return seq, pk, changed_at
+
+
+def tombstone_horizon():
+    """Tombstones older than this are pruned"""
+    return timezone.now() - timedelta(days=settings.DECISION_TOMBSTONE_RETENTION_DAYS)
+
+
+def check_token(token):
+    """Decode a token, refusing it if the feed can't be resumed from there anymore"""
+    cursor = decode_token(token)
+    if cursor[2] < tombstone_horizon():
+        raise TokenExpired()
+    return cursor
+
+
+def number_changes(database):
+    """
+    Number the committed writes of `database` not numbered yet, returns how many
+
+    They all get the next value of the sequence, taken in a transaction
+    which holds it until it commits. Rows locked by a write in progress
+    are skipped where the database can, and numbered once it commits.
+    """
+    pending = [
+        Decision.objects.using(database).filter(change_seq__isnull=True),
+        DecisionTombstone.objects.using(database).filter(change_seq__isnull=True),
+    ]
+    if not any(queryset.exists() for queryset in pending):
+        return 0
+    numbered = 0
+    with transaction.atomic(using=database):
+        seq = ChangeSequence.next_value(database)
+        for queryset in pending:
+            pks = list(queryset.select_for_update(skip_locked=True).values_list('pk', flat=True))
+            numbered += queryset.filter(pk__in=pks).update(change_seq=seq)
+    return numbered
+
+
+def _after(id_field, cursor):
+    if cursor is None:
+        return Q(change_seq__isnull=False)
+    seq, pk, _ = cursor
+    return Q(change_seq__gt=seq) | Q(change_seq=seq, **{f'{id_field}__gt': pk})
+
+
+class Change(NamedTuple):
+    seq: int
+    id: int
+    changed_at: datetime
+    tenant: str
+    # None for a deletion
+    decision: object
+
+    @property
+    def token(self):
+        return encode_token(self.seq, self.id, self.changed_at)
+
+
+def read_changes(queryset, since=None, limit=100, tenant=None):
+    """
+    Read decision changes after the `since` token
+
+    Returns (changes, token) where changes is a list of `Change`, ordered by
+    (seq, id), and token resumes the feed after the last change. Updated
+    and evaluated decisions come from `queryset`, deletions from the
+    tombstones of `tenant`, or of every tenant of the shard when None.
+    """
+    cursor = check_token(since) if since else None
+    number_changes(router.db_for_write(Decision))
+
+    decisions = (
+        queryset.filter(_after('pk', cursor))
+        .select_related('evaluation')
+        .order_by('change_seq', 'pk')[:limit]
+    )
+    tombstones = (
+        _tombstones(tenant).filter(_after('decision_id', cursor))
+        .order_by('change_seq', 'decision_id')[:limit]
+    )
+    changes = list(heapq.merge(
+        (Change(decision.change_seq, decision.pk, decision.updated_at, decision.tenant, decision) for decision in decisions),
+        (Change(tombstone.change_seq, tombstone.decision_id, tombstone.deleted_at, tombstone.tenant, None) for tombstone in tombstones),
+        key=lambda change: change[:2],
+    ))[:limit]
+
+    token = changes[-1].token if changes else since
+    return changes, token
+
+
+def serialize_change(change):
+    return {
+        'type': 'delete' if change.decision is None else 'upsert',
+        'id': change.id,
+        'changed_at': change.changed_at,
+        'decision': None if change.decision is None else DecisionSerializer(change.decision).data,
+    }
+
+
+def latest_token(queryset, tenant=None):
+    """Token pointing at the most recent change, to follow the feed from now on"""
+    number_changes(router.db_for_write(Decision))
+    decision = (
+        queryset.filter(change_seq__isnull=False).order_by('-change_seq', '-pk')
+        .values_list('change_seq', 'pk', 'updated_at').first()
+    )
+    tombstone = (
+        _tombstones(tenant).filter(change_seq__isnull=False).order_by('-change_seq', '-decision_id')
+        .values_list('change_seq', 'decision_id', 'deleted_at').first()
+    )
+    candidates = [change for change in (decision, tombstone) if change is not None]
+    if not candidates:
+        return None
+    return encode_token(*max(candidates))
+
+
+def _tombstones(tenant):
+    tombstones = DecisionTombstone.objects.all()
+    if tenant is not None:
+        tombstones = tombstones.filter(tenant=tenant)
+    return tombstones
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from rest_framework.authtoken.models import Token
+
+from decisions.changes import (
+    InvalidToken,
+    TokenExpired,
+    check_token,
+    latest_token,
+    read_changes,
+    serialize_change,
+)
+from decisions.models import Decision
+from decisions.sharding import shard_for_tenant, tenant_for_user, use_shard
+from enterpriseApi.renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    """A decision change, as pushed to the subscribers"""
+
+    __slots__ = ('key', 'id', 'type', 'tenant', 'status', 'data')
+
+    def __init__(self, change, type, status, data):
+        self.key = change[:2]
+        self.id = change.token
+        self.tenant = change.tenant
+        self.type = type
+        self.status = status
+        self.data = data
+
+    def encode(self):
+        return b'id: %s\nevent: %s\ndata: %s\n\n' % (self.id.encode(), self.type.encode(), dumps(self.data))
+
+
+def _event_type(decision, since):
+    """
+    Classify a change relative to the previous poll
+
+    The feed only carries the current state of a decision, so a decision
+    created or evaluated after `since` is reported as such.
+    """
+    if decision is None:
+        return 'deleted'
+    if since is None or decision.created_at > since:
+        return 'created'
+    evaluation = getattr(decision, 'evaluation', None)
+    if evaluation is not None and evaluation.evaluated_at > since:
+        return 'evaluated'
+    return 'updated'
+
+
+def read_events(shard, since=None, limit=None, tenant=None):
+    """
+    Read the decision changes of `shard` after the `since` token as events
+
+    Reads the changes of every tenant on the shard unless `tenant` is given.
+    """
+    close_old_connections()
+    limit = limit or settings.DECISION_EVENTS_BATCH_SIZE
+    previous = check_token(since)[2] if since else None
+    with use_shard(shard, tenant):
+        queryset = Decision.objects.all() if tenant is None else Decision.objects.filter(tenant=tenant)
+        changes, token = read_changes(queryset, since, limit, tenant)
+        events = [
+            Event(change, _event_type(change.decision, previous), getattr(change.decision, 'status', None), serialize_change(change))
+            for change in changes
+        ]
+    return events, token, len(changes) == limit
+
+
+class Subscription:
+    """A connected client, with a bounded queue of pending events"""
+
+    def __init__(self, tenant, shard, status=None, maxsize=None):
+        self.tenant = tenant
+        self.shard = shard
+        self.status = status
+        self.queue = asyncio.Queue(maxsize or settings.DECISION_EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, event):
+        if event.tenant != self.tenant:
+            return False
+        return self.status is None or event.status is None or event.status == self.status
+
+    def offer(self, event):
+        """
+        Queue an event without ever blocking the broadcaster
+
+        A client too slow to keep up is cut off, it reconnects with
+        `Last-Event-ID` and catches up from the database.
+        """
+        if self.overflowed or not self.wants(event):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class ChangeBroadcaster:
+    """
+    Follows the change feed and fans the events out to the subscribers
+
+    There is one broadcaster per process and it is the only one reading
+    the database, however many clients are connected. It only polls
+    the shards at least one client is subscribed to.
+    """
+
+    def __init__(self, poll_interval=None):
+        self.poll_interval = poll_interval or settings.DECISION_EVENTS_POLL_INTERVAL
+        self.subscribers = set()
+        # Shard -> token the feed of the shard is followed from
+        self.tokens = {}
+        self._task = None
+
+    def subscribe(self, tenant, shard, status=None):
+        subscription = Subscription(tenant, shard, status)
+        self.subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, events):
+        for event in events:
+            for subscription in list(self.subscribers):
+                subscription.offer(event)
+
+    async def follow(self, shard, since=None):
+        """
+        Follow the feed of `shard` from the `since` token, or from now, unless it is followed already
+
+        Called once subscribed, before the replay of the subscriber: with
+        its `Last-Event-ID`, everything after the replay is published.
+        """
+        if shard not in self.tokens:
+            token = since or await sync_to_async(self._latest_token)(shard)
+            self.tokens.setdefault(shard, token)
+
+    async def _run(self):
+        while self.subscribers:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Polling the decision change feed failed")
+            await asyncio.sleep(self.poll_interval)
+        # Followed again from the next subscriber on
+        self.tokens = {}
+        self._task = None
+
+    async def poll(self):
+        for shard in {subscription.shard for subscription in self.subscribers}:
+            if shard not in self.tokens:
+                await self.follow(shard)
+                continue
+            has_more = True
+            while has_more:
+                events, self.tokens[shard], has_more = await sync_to_async(read_events)(shard, self.tokens[shard])
+                self.publish(events)
+
+    @staticmethod
+    def _latest_token(shard):
+        close_old_connections()
+        with use_shard(shard):
+            return latest_token(Decision.objects.all())
+
+
+broadcaster = ChangeBroadcaster()
+
+
+class DecisionEventsApp:
+    """
+    ASGI application serving decision changes as server-sent events
+
+    Clients get the events of their tenant, authenticating with the same
+    `Authorization: Token <key>` header as the API. They may filter on
+    `?status=` and resume with the `Last-Event-ID` header, missed events
+    are then replayed from the change feed before switching to the live
+    stream.
+    """
+
+    def __init__(self, broadcaster=broadcaster):
+        self.broadcaster = broadcaster
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        status = query.get('status', [None])[0]
+        headers = dict(scope.get('headers', []))
+        last_event_id = headers.get(b'last-event-id', b'').decode() or None
+
+        if status is not None and status not in dict(Decision.STATUS_CHOICES):
+            await self._reject(send, 400, b'Invalid status.')
+            return
+
+        if last_event_id:
+            try:
+                check_token(last_event_id)
+            except InvalidToken:
+                await self._reject(send, 400, b'Invalid Last-Event-ID.')
+                return
+            except TokenExpired:
+                await self._reject(send, 410, b'Last-Event-ID expired, fetch all decisions again.')
+                return
+
+        tenant = await sync_to_async(self._authenticate)(headers.get(b'authorization', b'').decode())
+        if tenant is None:
+            await self._reject(send, 401, b'Invalid token.')
+            return
+        shard = await sync_to_async(shard_for_tenant)(tenant)
+
+        subscription = self.broadcaster.subscribe(tenant, shard, status)
+        await self.broadcaster.follow(shard, last_event_id)
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+            last_key = None
+            if last_event_id:
+                last_key = await self._replay(send, last_event_id, subscription)
+            await self._stream(send, subscription, last_key, disconnected)
+        finally:
+            disconnected.cancel()
+            self.broadcaster.unsubscribe(subscription)
+
+    async def _replay(self, send, since, subscription):
+        """
+        Send the events the client missed
+
+        The client is subscribed before the replay starts, so events
+        arriving meanwhile are queued and the ones already replayed are
+        skipped by key. Returns the key of the last replayed event.
+        """
+        last_key, has_more = None, True
+        while has_more:
+            events, since, has_more = await sync_to_async(read_events)(subscription.shard, since, tenant=subscription.tenant)
+            for event in events:
+                last_key = event.key
+                if subscription.wants(event):
+                    await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+        return last_key
+
+    async def _stream(self, send, subscription, last_key, disconnected):
+        heartbeat = settings.DECISION_EVENTS_HEARTBEAT
+        while not disconnected.done():
+            get = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({get, disconnected}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+            if get not in done:
+                get.cancel()
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+                continue
+
+            event = get.result()
+            if event is None:
+                # Overflowed, end the response so the client resumes from its last event
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            if last_key is not None and event.key <= last_key:
+                continue
+            await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+
+    @staticmethod
+    def _authenticate(authorization):
+        """Tenant of the `Token <key>` authorization, None if the token is invalid"""
+        close_old_connections()
+        if not authorization:
+            return tenant_for_user(None)
+        keyword, _, key = authorization.partition(' ')
+        if keyword != 'Token':
+            return None
+        token = Token.objects.select_related('user').filter(key=key.strip()).first()
+        if token is None or not token.user.is_active:
+            return None
+        return tenant_for_user(token.user)
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    @staticmethod
+    async def _reject(send, status, body):
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': body})
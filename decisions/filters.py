@@ -0,0 +1,25 @@
+from django_filters import rest_framework as filters
+
+from decisions.models import Decision
+
+
+class DecisionFilter(filters.FilterSet):
+    """
+    Filters of the decision list and export
+
+    Declared without a model, so the same filters apply to archived decisions.
+    `evaluated`, `goal_met` and `evaluated_*` use the columns copied from
+    the evaluation, not a join. Date ranges are half-open: `*_after` is
+    inclusive and `*_before` exclusive, so consecutive ranges don't overlap.
+    Dates and ISO 8601 datetimes are accepted.
+    """
+
+    status = filters.ChoiceFilter(choices=Decision.STATUS_CHOICES)
+    evaluated = filters.BooleanFilter(field_name='is_evaluated')
+    goal_met = filters.BooleanFilter(field_name='goal_met')
+    created_after = filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = filters.DateTimeFilter(field_name='created_at', lookup_expr='lt')
+    updated_after = filters.DateTimeFilter(field_name='updated_at', lookup_expr='gte')
+    updated_before = filters.DateTimeFilter(field_name='updated_at', lookup_expr='lt')
+    evaluated_after = filters.DateTimeFilter(field_name='evaluated_at', lookup_expr='gte')
+    evaluated_before = filters.DateTimeFilter(field_name='evaluated_at', lookup_expr='lt')
@@ -0,0 +1,131 @@
+"""
+Append-only history of decisions, read at any point in time
+
+Every write of a decision or its evaluation appends one narrow row to
+`DecisionHistory` in the same transaction, holding only the fields
+written: the decision signals diff the instance against the values it
+was loaded with. Writes of many decisions at once (write-behind creates,
+admin actions) append theirs with one bulk insert.
+
+The state of a decision at a point in time is its latest
+`DecisionSnapshot` before that time, with the entries recorded after it
+applied in order. `manage.py compact_decision_history` writes a snapshot
+every `DECISION_HISTORY_SNAPSHOT_INTERVAL` entries of a decision, so a
+read replays fewer entries than that once compacted, instead of the
+whole history.
+
+Decisions created before the history was kept start at their first
+recorded change, with the fields that change wrote.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from decisions.models import HISTORY_FIELDS, DecisionHistory, DecisionSnapshot
+
+EVALUATION_FIELDS = ['goal_met', 'comments', 'evaluated_at']
+
+
+def decision_saved(decision, created):
+    """Record the fields written by a save of `decision`, from the decision signals"""
+    current = {field: getattr(decision, field) for field in HISTORY_FIELDS}
+    if created and decision._restored:
+        # Unchanged by the move back from the archive
+        record(decision.pk, decision.tenant, DecisionHistory.RESTORED, using=decision._state.db)
+    elif created:
+        record(decision.pk, decision.tenant, DecisionHistory.CREATED, current, using=decision._state.db)
+    else:
+        loaded = decision._loaded_values or {}
+        changes = {field: value for field, value in current.items() if field not in loaded or loaded[field] != value}
+        if changes:
+            record(decision.pk, decision.tenant, DecisionHistory.UPDATED, changes, using=decision._state.db)
+    decision._loaded_values = current
+
+
+def evaluation_saved(evaluation, tenant):
+    changes = {field: getattr(evaluation, field) for field in EVALUATION_FIELDS}
+    record(evaluation.decision_id, tenant, DecisionHistory.EVALUATED, changes, using=evaluation._state.db)
+
+
+def record(decision_id, tenant, kind, changes=None, using=None):
+    DecisionHistory.objects.using(using).create(decision_id=decision_id, tenant=tenant, kind=kind, changes=changes or {})
+
+
+def record_many(entries, using=None):
+    """Append (decision id, tenant, kind, changes) entries with one insert"""
+    DecisionHistory.objects.using(using).bulk_create([
+        DecisionHistory(decision_id=decision_id, tenant=tenant, kind=kind, changes=changes)
+        for decision_id, tenant, kind, changes in entries
+    ])
+
+
+def apply(state, entry):
+    """State of a decision after `entry`, None when deleted"""
+    if entry.kind == DecisionHistory.CREATED:
+        return {**entry.changes, 'evaluation': None}
+    if entry.kind == DecisionHistory.DELETED:
+        return None
+    state = dict(state) if state is not None else {'evaluation': None}
+    if entry.kind == DecisionHistory.UPDATED:
+        state.update(entry.changes)
+    elif entry.kind == DecisionHistory.EVALUATED:
+        state['evaluation'] = entry.changes
+    elif entry.kind == DecisionHistory.EVALUATION_RESET:
+        state['evaluation'] = None
+    return state
+
+
+def state_at(decision_id, tenant, as_of):
+    """
+    State of a decision at `as_of`, from its latest snapshot before and the entries after
+
+    Returns a tuple of (state, known): `known` is false when nothing was
+    recorded for the decision by then, `state` is None if it was deleted.
+    """
+    snapshot = (
+        DecisionSnapshot.objects.filter(decision_id=decision_id, tenant=tenant, recorded_at__lte=as_of)
+        .order_by('-last_entry_id').first()
+    )
+    entries = DecisionHistory.objects.filter(decision_id=decision_id, tenant=tenant, recorded_at__lte=as_of).order_by('id')
+    state, known = None, False
+    if snapshot is not None:
+        state, known = snapshot.state, True
+        entries = entries.filter(id__gt=snapshot.last_entry_id)
+    for entry in entries:
+        state, known = apply(state, entry), True
+    return state, known
+
+
+def needing_snapshots(interval, after=0):
+    """
+    Ids of the decisions with at least `interval` entries since their latest snapshot
+
+    Only decisions with entries after the id `after` are looked at, so a
+    run reads the entries of the decisions written since the previous one
+    rather than the whole history.
+    """
+    latest = DecisionSnapshot.objects.filter(decision_id=OuterRef('decision_id')).order_by('-last_entry_id').values('last_entry_id')[:1]
+    written = DecisionHistory.objects.filter(id__gt=after).values('decision_id')
+    return (
+        DecisionHistory.objects.filter(decision_id__in=written).alias(snapshot=Coalesce(Subquery(latest), Value(0)))
+        .filter(id__gt=F('snapshot')).order_by().values('decision_id')
+        .annotate(entries=Count('id')).filter(entries__gte=interval).values_list('decision_id', flat=True)
+    )
+
+
+def compact(decision_id, interval):
+    """Write a snapshot of the decision every `interval` entries after its latest one, returns the number written"""
+    snapshot = DecisionSnapshot.objects.filter(decision_id=decision_id).order_by('-last_entry_id').first()
+    entries = DecisionHistory.objects.filter(decision_id=decision_id).order_by('id')
+    state = None
+    if snapshot is not None:
+        state = snapshot.state
+        entries = entries.filter(id__gt=snapshot.last_entry_id)
+    snapshots = []
+    for position, entry in enumerate(entries.iterator(), 1):
+        state = apply(state, entry)
+        if position % interval == 0:
+            snapshots.append(DecisionSnapshot(
+                decision_id=decision_id, tenant=entry.tenant, last_entry_id=entry.pk, recorded_at=entry.recorded_at, state=state,
+            ))
+    DecisionSnapshot.objects.bulk_create(snapshots)
+    return len(snapshots)
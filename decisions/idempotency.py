@@ -0,0 +1,155 @@
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from decisions.models import IdempotencyKey
+from enterpriseApi.renderers import dumps
+
+HEADER = 'Idempotency-Key'
+# Headers of the first response which are replayed with it
+REPLAYED_HEADERS = ('Location',)
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still running, retry later.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+class Replay(Exception):
+    """Raised to answer a retry with the stored response instead of running the view"""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def request_hash(request):
+    """Digest of what makes a request the same request: method, path with query string and body"""
+    digest = hashlib.sha256(f'{request.method} {request.get_full_path()}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def replay(record):
+    response = HttpResponse(bytes(record.body or b''), status=record.status_code, content_type='application/json')
+    for name, value in record.headers.items():
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _check(record, digest):
+    if record.request_hash != digest:
+        raise IdempotencyKeyReused()
+    if record.completed:
+        raise Replay(replay(record))
+
+
+def claim(user, key, digest):
+    """
+    Reserve `key` for a request of `user`, returns the reservation to complete with `store`
+
+    Raises `Replay` when the key was used before and its response is
+    stored. A concurrent duplicate waits up to `IDEMPOTENCY_WAIT_TIMEOUT`
+    for the first request to finish, then gets a conflict. Reservations
+    left over by a crashed request are taken over after
+    `IDEMPOTENCY_LOCK_TIMEOUT`.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, request_hash=digest, created_at=now, expires_at=expires_at)
+    except IntegrityError:
+        pass
+
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None or record.expires_at <= timezone.now():
+            # Expired or released meanwhile, start over
+            IdempotencyKey.objects.filter(user=user, key=key, expires_at__lte=timezone.now()).delete()
+            return claim(user, key, digest)
+        _check(record, digest)
+
+        stale = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        if record.created_at < stale:
+            taken = IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True, created_at=record.created_at)
+            if taken.update(created_at=timezone.now()):
+                record.refresh_from_db()
+                return record
+        if time.monotonic() >= deadline:
+            raise IdempotencyKeyInUse()
+        time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+
+def store(record, response):
+    """
+    Keep the response of a claimed request for its retries
+
+    Server errors are not kept, the key is released so a retry runs again.
+    """
+    if response.status_code >= 500:
+        release(record)
+        return
+    data = getattr(response, 'data', None)
+    body = dumps(data) if data is not None else response.content
+    headers = {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)}
+    IdempotencyKey.objects.filter(pk=record.pk).update(status_code=response.status_code, body=body, headers=headers)
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).delete()
+
+
+class IdempotencyMixin:
+    """
+    Makes the POST actions of a viewset idempotent with the `Idempotency-Key` header
+
+    The first response of an authenticated user's key is stored and sent
+    again to retries, which don't run the action again.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self._idempotency_record = None
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or not key or not request.user.is_authenticated:
+            return
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise ValidationError({HEADER: 'Ensure this header has no more than 255 characters.'})
+        self._idempotency_record = claim(request.user, key, request_hash(request))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Uncaught, there will be no response to store: release the key so a retry runs again
+            record = getattr(self, '_idempotency_record', None)
+            if record is not None:
+                self._idempotency_record = None
+                release(record)
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record = getattr(self, '_idempotency_record', None)
+        if record is not None:
+            self._idempotency_record = None
+            store(record, response)
+        return response
@@ -0,0 +1,41 @@
+"""
+Indexes which differ by database, and so can't be declared on the models
+
+The tables are created without migrations, so these are created after
+every `migrate` on the databases holding decisions, replicas excepted.
+"""
+from django.conf import settings
+from django.db import connections, router
+
+from decisions.models import Decision
+
+POSTGRES_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    # Autocomplete: titles with a word similar to the query
+    'CREATE INDEX IF NOT EXISTS decision_title_trgm_idx ON decisions_decision USING gin (title gin_trgm_ops)',
+    # Autocomplete: titles starting with the query, as `istartswith` compares UPPER() with LIKE
+    'CREATE INDEX IF NOT EXISTS decision_title_prefix_idx ON decisions_decision (UPPER(title::text) text_pattern_ops)',
+    # Date ranges: rows are appended in created_at order, so block ranges summarize them well, at a
+    # fraction of the size of a B-tree. Restored and moved decisions keep their old created_at, which
+    # widens the ranges of the blocks they land in.
+    'CREATE INDEX IF NOT EXISTS decision_created_brin_idx ON decisions_decision USING brin (created_at) '
+    'WITH (pages_per_range = 32)',
+]
+
+# Other databases have no BRIN, created_at gets a B-tree
+DEFAULT_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS decision_tenant_created_idx ON decisions_decision (tenant, created_at)',
+]
+
+
+def create_indexes(using, verbosity=1, **kwargs):
+    """`post_migrate` receiver creating the indexes of the vendor of the database just migrated"""
+    connection = connections[using]
+    if using in settings.DATABASE_REPLICAS or not router.allow_migrate_model(using, Decision):
+        return
+    statements = POSTGRES_INDEXES if connection.vendor == 'postgresql' else DEFAULT_INDEXES
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    if verbosity >= 2:
+        print(f'  Created the {connection.vendor} indexes of decisions on {using}')
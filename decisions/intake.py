@@ -0,0 +1,233 @@
+"""
+Write-behind intake of decision creates
+
+Clients sending `Prefer: respond-async` on `POST /api/decisions` get the
+decision validated and queued in process, and `202 Accepted` with an
+intake id right away. A flusher thread inserts the queued decisions with
+one `bulk_create` per tenant once `DECISION_INTAKE_BATCH_SIZE` of them are
+queued or the oldest waited `DECISION_INTAKE_MAX_DELAY` seconds, so
+thousands of creates cost a few transactions instead of one each.
+
+When a batch fails, its decisions are inserted one by one and those still
+failing are appended to the dead letter file `DECISION_INTAKE_DEAD_LETTER_FILE`,
+one JSON object per line, from where `manage.py replay_decision_intake`
+inserts them again, skipping those which made it into the database. Other
+errors dead letter the decisions of the tenant being written, not those of
+the other tenants of the batch. Accepted decisions are held in memory until flushed:
+they are flushed when the process exits, but lost if it crashes.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.utils import timezone
+
+from decisions import analytics, autocomplete, history
+from decisions.models import HISTORY_FIELDS, Decision, DecisionHistory, DecisionStatusCount, decision_ids
+from decisions.pagination import invalidate_cached_counts
+from decisions.sharding import use_tenant
+from enterpriseApi.renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+CREATED = 'created'
+FAILED = 'failed'
+
+# Failures kept in memory for intake status lookups
+FAILED_HISTORY = 10000
+
+
+class Intake(NamedTuple):
+    intake_id: str
+    tenant: str
+    data: dict
+
+
+class WriteBehindQueue:
+    """Queue of accepted decision creates, written in batches by a flusher thread"""
+
+    def __init__(self, start_thread=True):
+        self.start_thread = start_thread
+        self._queue = queue.Queue(maxsize=settings.DECISION_INTAKE_QUEUE_SIZE)
+        self._pending = set()
+        # Intake id -> error, of the most recent failures
+        self._failed = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, tenant, data):
+        """Queue a validated decision, returns its intake id or None when the queue is full"""
+        intake = Intake(uuid.uuid4().hex, tenant, data)
+        with self._lock:
+            self._pending.add(intake.intake_id)
+        try:
+            self._queue.put_nowait(intake)
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(intake.intake_id)
+            return None
+        self._ensure_started()
+        return intake.intake_id
+
+    def status(self, intake_id):
+        """`PENDING` or (`FAILED`, error) while known to this process, else None"""
+        with self._lock:
+            if intake_id in self._pending:
+                return PENDING, None
+            if intake_id in self._failed:
+                return FAILED, self._failed[intake_id]
+        return None
+
+    def _ensure_started(self):
+        if not self.start_thread or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='decision-intake', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self.write(batch)
+            except Exception:
+                # Keep the flusher alive, the decisions of the batch were written or dead lettered by tenant
+                logger.exception('Batch of %d decisions failed', len(batch))
+
+    def _collect(self):
+        """Wait for the first decision, then for more until the batch is full or the delay is over"""
+        try:
+            batch = [self._queue.get(timeout=settings.DECISION_INTAKE_MAX_DELAY)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + settings.DECISION_INTAKE_MAX_DELAY
+        while len(batch) < settings.DECISION_INTAKE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Write everything queued so far in the calling thread, returns the number of decisions created"""
+        created = 0
+        while True:
+            batch = []
+            while len(batch) < settings.DECISION_INTAKE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return created
+            created += self.write(batch)
+
+    def stop(self):
+        """Stop the flusher and write what is left"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def write(self, batch):
+        """Insert a batch of intakes, returns the number of decisions created"""
+        by_tenant = {}
+        for intake in batch:
+            by_tenant.setdefault(intake.tenant, []).append(intake)
+        created = 0
+        for tenant, intakes in by_tenant.items():
+            try:
+                with use_tenant(tenant):
+                    created += self._write_tenant(tenant, intakes)
+            except Exception as exc:
+                # The decisions of the other tenants are committed on their own, only these are kept aside.
+                # Some of them may be committed already, the replay skips their intake ids
+                logger.exception('Batch of %d decisions of %s failed', len(intakes), tenant)
+                for intake in intakes:
+                    self.dead_letter(intake, exc)
+                with self._lock:
+                    self._pending.difference_update(intake.intake_id for intake in intakes)
+        if created:
+            invalidate_cached_counts()
+        return created
+
+    def _write_tenant(self, tenant, intakes):
+        database = router.db_for_write(Decision)
+        decisions = [self._decision(intake) for intake in intakes]
+        try:
+            self._insert(database, decisions)
+            written = list(zip(intakes, decisions))
+        except DatabaseError:
+            logger.warning('Batch of %d decisions of %s failed, inserting them one by one', len(intakes), tenant, exc_info=True)
+            connections[database].close_if_unusable_or_obsolete()
+            written = self._write_one_by_one(database, intakes)
+
+        with transaction.atomic(using=database):
+            # bulk_create sends no signals, do what the decision signals do
+            for decision_status, count in Counter(decision.status for _, decision in written).items():
+                DecisionStatusCount.adjust(tenant, decision_status, count)
+        autocomplete.decisions_created(database, tenant, [decision for _, decision in written])
+        analytics.touch(tenant, *{decision.created_at for _, decision in written})
+        with self._lock:
+            self._pending.difference_update(intake.intake_id for intake in intakes)
+        return len(written)
+
+    def _write_one_by_one(self, database, intakes):
+        written = []
+        for intake in intakes:
+            decision = self._decision(intake)
+            try:
+                self._insert(database, [decision])
+            except DatabaseError as exc:
+                connections[database].close_if_unusable_or_obsolete()
+                self.dead_letter(intake, exc)
+            else:
+                written.append((intake, decision))
+        return written
+
+    @staticmethod
+    def _insert(database, decisions):
+        with transaction.atomic(using=database):
+            Decision.objects.using(database).bulk_create(decisions)
+            history.record_many([
+                (decision.pk, decision.tenant, DecisionHistory.CREATED, {field: getattr(decision, field) for field in HISTORY_FIELDS})
+                for decision in decisions
+            ], using=database)
+
+    @staticmethod
+    def _decision(intake):
+        decision = Decision(tenant=intake.tenant, intake_id=intake.intake_id, **intake.data)
+        decision.stamp_completed_at()
+        if len(settings.DECISION_SHARDS) > 1:
+            # bulk_create doesn't go through Decision.save, which allocates the ids of sharded decisions
+            decision.pk = decision_ids.next_id()
+        return decision
+
+    def dead_letter(self, intake, error):
+        logger.error('Decision %s of %s could not be created: %s', intake.intake_id, intake.tenant, error)
+        record = {**intake._asdict(), 'error': str(error), 'failed_at': timezone.now()}
+        with self._lock:
+            with open(settings.DECISION_INTAKE_DEAD_LETTER_FILE, 'ab') as dead_letters:
+                dead_letters.write(dumps(record) + b'\n')
+            self._failed[intake.intake_id] = str(error)
+            while len(self._failed) > FAILED_HISTORY:
+                self._failed.popitem(last=False)
+
+
+decision_intake = WriteBehindQueue()
@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from decisions.archive import archive_batch
+from decisions.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = "Move evaluated decisions which haven't been written for a while to the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, help="Archive decisions not updated for this many days")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Decisions moved per transaction")
+        parser.add_argument('--sleep', type=float, default=0, help="Seconds to pause between batches")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        total = 0
+        for shard in settings.DECISION_SHARDS:
+            with use_shard(shard):
+                while True:
+                    archived = archive_batch(cutoff, options['batch_size'])
+                    total += archived
+                    if archived < options['batch_size']:
+                        break
+                    if options['sleep']:
+                        time.sleep(options['sleep'])
+        self.stdout.write(f"Archived {total} decisions")
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from decisions import history
+from decisions.models import DecisionHistory, HistoryCompaction
+from decisions.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Write snapshots of the decisions with DECISION_HISTORY_SNAPSHOT_INTERVAL history entries "
+        "since their latest snapshot, on every shard. Run it periodically."
+    )
+
+    def handle(self, *args, **options):
+        interval = settings.DECISION_HISTORY_SNAPSHOT_INTERVAL
+        total = 0
+        for shard in settings.DECISION_SHARDS:
+            with use_shard(shard):
+                compaction, _ = HistoryCompaction.objects.get_or_create(pk=1)
+                # Taken first, the entries recorded during the run are looked at by the next one
+                last_entry_id = DecisionHistory.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                for decision_id in list(history.needing_snapshots(interval, after=compaction.last_entry_id)):
+                    total += history.compact(decision_id, interval)
+                HistoryCompaction.objects.filter(pk=1).update(last_entry_id=last_entry_id)
+        self.stdout.write(f"Wrote {total} snapshots")
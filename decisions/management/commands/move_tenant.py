@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from decisions.archive import DECISION_FIELDS, EVALUATION_FIELDS
+from decisions.models import (
+    ArchivedDecision,
+    ArchivedEvaluation,
+    ChangeSequence,
+    Decision,
+    DecisionHistory,
+    DecisionSnapshot,
+    DecisionStatusCount,
+    DecisionTombstone,
+    Evaluation,
+)
+from decisions.pagination import invalidate_cached_counts
+from decisions.sharding import move_tenant_placement, shard_for_tenant, use_shard
+
+
+def batches(queryset, batch_size):
+    """Rows of `queryset` in primary key order, `batch_size` at a time, so a large tenant is never loaded at once"""
+    after = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=after).order_by('pk')[:batch_size])
+        if not batch:
+            return
+        yield batch
+        after = batch[-1].pk
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the decisions of a tenant to another shard. Writes of the tenant "
+        "made while the command runs may be lost, run it in a maintenance window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tenant')
+        parser.add_argument('shard', help="Database alias to move the tenant to, one of DECISION_SHARDS")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows read and written at once")
+
+    def handle(self, *args, **options):
+        tenant, target = options['tenant'], options['shard']
+        if target not in settings.DECISION_SHARDS:
+            raise CommandError(f"{target} is not one of DECISION_SHARDS: {', '.join(settings.DECISION_SHARDS)}")
+        source = shard_for_tenant(tenant)
+        if source == target:
+            self.stdout.write(f"{tenant} is already on {target}")
+            return
+
+        # Ids are global across shards, so they are kept as they are
+        with transaction.atomic(using=target):
+            moved = self.copy(tenant, source, target, options['batch_size'])
+        move_tenant_placement(tenant, target)
+        with transaction.atomic(using=source):
+            self.delete(tenant, source)
+        with use_shard(target):
+            DecisionStatusCount.rebuild(tenant)
+        invalidate_cached_counts()
+        self.stdout.write(f"Moved {moved} decisions of {tenant} from {source} to {target}")
+
+    @staticmethod
+    def copy(tenant, source, target, batch_size):
+        # Copies are numbered in the feed of the target after the tokens clients got from the source
+        ChangeSequence.advance(target, ChangeSequence.current(source))
+        moved = 0
+        for decisions in batches(Decision.objects.using(source).filter(tenant=tenant).select_related('evaluation'), batch_size):
+            copies = [
+                Decision(pk=decision.pk, tenant=tenant, **{field: getattr(decision, field) for field in DECISION_FIELDS})
+                for decision in decisions
+            ]
+            Decision.objects.using(target).bulk_create(copies)
+            # auto_now_add/auto_now overwrote the timestamps on insert
+            for copy, decision in zip(copies, decisions):
+                copy.created_at, copy.updated_at = decision.created_at, decision.updated_at
+            Decision.objects.using(target).bulk_update(copies, ['created_at', 'updated_at'])
+
+            evaluated = [decision for decision in decisions if hasattr(decision, 'evaluation')]
+            evaluations = Evaluation.objects.using(target).bulk_create([
+                Evaluation(decision_id=decision.pk, **{field: getattr(decision.evaluation, field) for field in EVALUATION_FIELDS})
+                for decision in evaluated
+            ])
+            for evaluation, decision in zip(evaluations, evaluated):
+                evaluation.evaluated_at = decision.evaluation.evaluated_at
+            Evaluation.objects.using(target).bulk_update(evaluations, ['evaluated_at'])
+            moved += len(decisions)
+
+        for archived in batches(ArchivedDecision.objects.using(source).filter(tenant=tenant), batch_size):
+            ArchivedDecision.objects.using(target).bulk_create(archived)
+            ArchivedEvaluation.objects.using(target).bulk_create([
+                ArchivedEvaluation(decision_id=evaluation.decision_id, **{field: getattr(evaluation, field) for field in EVALUATION_FIELDS})
+                for evaluation in ArchivedEvaluation.objects.using(source).filter(decision_id__in=[decision.pk for decision in archived])
+            ])
+        for tombstones in batches(DecisionTombstone.objects.using(source).filter(tenant=tenant), batch_size):
+            DecisionTombstone.objects.using(target).bulk_create([
+                DecisionTombstone(decision_id=tombstone.decision_id, tenant=tenant, deleted_at=tombstone.deleted_at)
+                for tombstone in tombstones
+            ])
+        # Entries get new ids on the target, copied in order. Snapshots refer to the ids of the
+        # source, so they are not copied: compact_decision_history writes them again
+        for entries in batches(DecisionHistory.objects.using(source).filter(tenant=tenant), batch_size):
+            DecisionHistory.objects.using(target).bulk_create([
+                DecisionHistory(decision_id=entry.decision_id, tenant=tenant, kind=entry.kind, changes=entry.changes, recorded_at=entry.recorded_at)
+                for entry in entries
+            ])
+        return moved
+
+    @staticmethod
+    def delete(tenant, source):
+        # Raw deletes skip the signals, a moved decision is not a deleted one
+        decision_ids = Decision.objects.using(source).filter(tenant=tenant).values('pk')
+        Evaluation.objects.using(source).filter(decision_id__in=decision_ids)._raw_delete(source)
+        Decision.objects.using(source).filter(tenant=tenant)._raw_delete(source)
+        archived_ids = ArchivedDecision.objects.using(source).filter(tenant=tenant).values('pk')
+        ArchivedEvaluation.objects.using(source).filter(decision_id__in=archived_ids)._raw_delete(source)
+        ArchivedDecision.objects.using(source).filter(tenant=tenant)._raw_delete(source)
+        DecisionTombstone.objects.using(source).filter(tenant=tenant)._raw_delete(source)
+        DecisionHistory.objects.using(source).filter(tenant=tenant)._raw_delete(source)
+        DecisionSnapshot.objects.using(source).filter(tenant=tenant)._raw_delete(source)
+        DecisionStatusCount.objects.using(source).filter(tenant=tenant).delete()
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from decisions.changes import tombstone_horizon
+from decisions.models import DecisionTombstone
+from decisions.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = "Delete change feed tombstones older than DECISION_TOMBSTONE_RETENTION_DAYS on every shard"
+
+    def handle(self, *args, **options):
+        total = 0
+        for shard in settings.DECISION_SHARDS:
+            with use_shard(shard):
+                deleted, _ = DecisionTombstone.objects.filter(deleted_at__lt=tombstone_horizon()).delete()
+                total += deleted
+        self.stdout.write(f"Deleted {total} tombstones")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from decisions.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key responses, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Keys deleted per statement")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = IdempotencyKey.objects.filter(expires_at__lte=now).order_by('expires_at')
+        total = 0
+        while True:
+            pks = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            deleted, _ = IdempotencyKey.objects.filter(pk__in=pks).delete()
+            total += deleted
+        self.stdout.write(f"Deleted {total} expired idempotency keys")
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from decisions.models import Decision, DecisionStatusCount
+from decisions.pagination import invalidate_cached_counts
+from decisions.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = "Recount decisions per tenant and status on every shard and drop cached list counts"
+
+    def handle(self, *args, **options):
+        for shard in settings.DECISION_SHARDS:
+            with use_shard(shard):
+                tenants = set(Decision.objects.order_by().values_list('tenant', flat=True).distinct())
+                tenants |= set(DecisionStatusCount.objects.values_list('tenant', flat=True))
+                for tenant in sorted(tenants):
+                    counts = DecisionStatusCount.rebuild(tenant)
+                    self.stdout.write(f"{shard} {tenant}: " + ", ".join(f"{status} {count}" for status, count in counts.items()))
+        invalidate_cached_counts()
@@ -0,0 +1,45 @@
+import os
+
+import orjson
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from decisions.intake import Intake, WriteBehindQueue
+from decisions.models import ArchivedDecision, Decision
+from decisions.sharding import use_tenant
+
+
+class Command(BaseCommand):
+    help = "Insert the decisions of the write-behind dead letter file again, those failing again are kept in it"
+
+    def handle(self, *args, **options):
+        path = settings.DECISION_INTAKE_DEAD_LETTER_FILE
+        if not os.path.exists(path):
+            self.stdout.write("No dead letters")
+            return
+        # Failures of this run are appended to a new file
+        replaying = f'{path}.replaying'
+        os.replace(path, replaying)
+        with open(replaying, 'rb') as dead_letters:
+            records = [orjson.loads(line) for line in dead_letters if line.strip()]
+
+        intakes = {}
+        for record in records:
+            intakes.setdefault(record['tenant'], []).append(Intake(record['intake_id'], record['tenant'], record['data']))
+        writer = WriteBehindQueue(start_thread=False)
+        created = skipped = 0
+        for tenant, batch in intakes.items():
+            intake_ids = [intake.intake_id for intake in batch]
+            with use_tenant(tenant):
+                # Dead lettered after being committed, or archived since
+                inserted = {
+                    *Decision.objects.filter(intake_id__in=intake_ids).values_list('intake_id', flat=True),
+                    *ArchivedDecision.objects.filter(intake_id__in=intake_ids).values_list('intake_id', flat=True),
+                }
+            skipped += len(inserted)
+            batch = [intake for intake in batch if intake.intake_id not in inserted]
+            if batch:
+                created += writer.write(batch)
+        os.remove(replaying)
+        failed = len(records) - created - skipped
+        self.stdout.write(f"Created {created} decisions, {skipped} already existed, {failed} failed again")
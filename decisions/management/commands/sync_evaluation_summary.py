@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from decisions import analytics
+from decisions.models import Decision
+from decisions.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = "Recompute the evaluation summary columns of the decisions on every shard from their evaluations"
+
+    def handle(self, *args, **options):
+        for shard in settings.DECISION_SHARDS:
+            with use_shard(shard):
+                tenants = Decision.objects.order_by().values_list('tenant', flat=True).distinct()
+                for tenant in sorted(tenants):
+                    updated = Decision.sync_evaluation_summary(tenant)
+                    analytics.invalidate(tenant)
+                    self.stdout.write(f"{shard} {tenant}: {updated} decisions")
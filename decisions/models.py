@@ -1,4 +1,23 @@
-from django.db import models
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+
+def default_tenant():
+    return settings.DEFAULT_TENANT
+
+
+# Fields of a decision recorded in its history
+HISTORY_FIELDS = ['title', 'description', 'measurable_goal', 'status', 'completed_at']
+
+
+class StaleVersion(Exception):
+    """Raised by `Decision.save(expected_version=...)` when the decision was changed meanwhile"""
+
 
 class Decision(models.Model):
     """Model definition for Decision."""
@@ -8,12 +27,154 @@ class Decision(models.Model):
         ('Completed', 'Completed'),
     ]
     
+    tenant = models.CharField(max_length=64, default=default_tenant)
     title = models.CharField(max_length=200)
     description = models.TextField()
     measurable_goal = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Incremented on every write, clients send it back in If-Match
+    version = models.PositiveIntegerField(default=1)
+    # Copies of the evaluation, kept in sync by the evaluation signals, so lists filter without a join
+    is_evaluated = models.BooleanField(default=False)
+    goal_met = models.BooleanField(null=True, blank=True)
+    evaluated_at = models.DateTimeField(null=True, blank=True)
+    # When the decision last went from Pending to Completed, None while pending
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # Id returned when the create was accepted asynchronously, see decisions.intake
+    intake_id = models.CharField(max_length=32, null=True, blank=True, unique=True, editable=False)
+    # Position in the change feed, None until the write is numbered after it commits, see decisions.changes
+    change_seq = models.BigIntegerField(null=True, blank=True, editable=False)
+
+    # Status and title as stored in the database, used to keep the status counters and autocomplete in sync
+    _loaded_status = None
+    _loaded_title = None
+    _loaded_completed_at = None
+    # Fields recorded in the history as stored in the database
+    _loaded_values = None
+    # Moved back from the archive, the save is recorded as a restore rather than a creation
+    _restored = False
+    # Version the row must still have for the save in progress to go through
+    _expected_version = None
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='decision_updated_id_idx'),
+            # Back the change feed, which pages by (change_seq, id), and the numbering of new writes
+            models.Index(fields=['change_seq', 'id'], name='decision_change_seq_idx'),
+            models.Index(fields=['id'], condition=Q(change_seq__isnull=True), name='decision_change_pending_idx'),
+            models.Index(fields=['tenant', 'status'], name='decision_tenant_status_idx'),
+            models.Index(fields=['tenant', 'is_evaluated'], name='decision_tenant_evaluated_idx'),
+            models.Index(fields=['tenant', 'goal_met'], name='decision_tenant_goal_met_idx'),
+            models.Index(fields=['tenant', 'evaluated_at'], name='decision_tenant_evaluated_at_idx'),
+            models.Index(fields=['tenant', 'completed_at'], name='decision_tenant_completed_at_idx'),
+            # created_at is indexed per database, see decisions.indexes
+        ]
+
+    def __str__(self):
+        return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_title = instance.__dict__.get('title')
+        instance._loaded_completed_at = instance.__dict__.get('completed_at')
+        instance._loaded_values = {field: instance.__dict__[field] for field in HISTORY_FIELDS if field in instance.__dict__}
+        return instance
+
+    def stamp_completed_at(self):
+        """Set `completed_at` when the decision is completed, clear it when it is pending"""
+        if self.status != 'Completed':
+            self.completed_at = None
+        elif self.completed_at is None:
+            self.completed_at = timezone.now()
+
+    def save(self, *args, expected_version=None, **kwargs):
+        """
+        Save the decision, bumping its version
+
+        With `expected_version` the row is only updated if it still has
+        that version, in the same UPDATE statement, else `StaleVersion`
+        is raised and nothing is written.
+        """
+        self.stamp_completed_at()
+        if self.pk is None and len(settings.DECISION_SHARDS) > 1:
+            # Ids stay unique across shards, so tenants can move between them
+            self.pk = decision_ids.next_id()
+            kwargs['force_insert'] = True
+        database = kwargs.get('using') or router.db_for_write(Decision, instance=self)
+        if self._state.adding or kwargs.get('force_insert'):
+            # With the history entry written by the signal
+            with transaction.atomic(using=database):
+                if self.pk is not None and not kwargs.get('force_insert'):
+                    # Updates the row if it exists
+                    self._load_stored_values(database)
+                super().save(*args, **kwargs)
+            return
+
+        # Numbered again in the change feed once committed
+        self.change_seq = None
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'change_seq'}
+            if 'status' in kwargs['update_fields']:
+                kwargs['update_fields'].add('completed_at')
+        if expected_version is None:
+            self.version = F('version') + 1
+        else:
+            self.version = expected_version + 1
+            self._expected_version = expected_version
+        try:
+            # In a savepoint, so a stale write leaves the outer transaction usable
+            with transaction.atomic(using=database):
+                if self._loaded_status is None:
+                    self._load_stored_values(database)
+                super().save(*args, **kwargs)
+        finally:
+            self._expected_version = None
+        if expected_version is None:
+            self.refresh_from_db(fields=['version'])
+
+    def delete(self, *args, **kwargs):
+        if self._loaded_status is None:
+            # The delete signals read the stored values, once the row is gone
+            try:
+                self.refresh_from_db(using=kwargs.get('using'), fields=[field.attname for field in self._meta.concrete_fields])
+            except Decision.DoesNotExist:
+                pass
+            else:
+                self._loaded_status, self._loaded_title = self.status, self.title
+        return super().delete(*args, **kwargs)
+
+    def _load_stored_values(self, database):
+        """
+        Read the stored values the signals diff against, for an instance not loaded from the database
+
+        E.g. `Decision(pk=...)` or one loaded without its status. They stay
+        None if the row doesn't exist, then the save inserts it.
+        """
+        stored = Decision.objects.using(database).filter(pk=self.pk).values(*HISTORY_FIELDS).first()
+        if stored is not None:
+            self._loaded_status, self._loaded_title = stored['status'], stored['title']
+            self._loaded_completed_at, self._loaded_values = stored['completed_at'], stored
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if self._expected_version is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if not super()._do_update(base_qs.filter(version=self._expected_version), using, pk_val, values, update_fields, True):
+            raise StaleVersion()
+        return True
+
+    @classmethod
+    def sync_evaluation_summary(cls, tenant):
+        """Recompute `is_evaluated`, `goal_met` and `evaluated_at` of the decisions of `tenant` from their evaluations"""
+        evaluation = Evaluation.objects.filter(decision=OuterRef('pk'))
+        return cls.objects.filter(tenant=tenant).update(
+            is_evaluated=Exists(evaluation),
+            goal_met=Subquery(evaluation.values('goal_met')[:1]),
+            evaluated_at=Subquery(evaluation.values('evaluated_at')[:1]),
+        )
 
 class Evaluation(models.Model):
     """Model definition for Evaluation."""
@@ -21,3 +182,285 @@ class Evaluation(models.Model):
     goal_met = models.BooleanField()
     comments = models.TextField(blank=True)
     evaluated_at = models.DateTimeField(auto_now_add=True)
+
+class ArchivedDecision(models.Model):
+    """
+    Model definition for ArchivedDecision.
+
+    Cold copy of an evaluated decision, moved out of the decision table by
+    `manage.py archive_decisions`. Keeps the id of the original decision.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    tenant = models.CharField(max_length=64, default=default_tenant, db_index=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField()
+    measurable_goal = models.TextField()
+    status = models.CharField(max_length=20, choices=Decision.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    version = models.PositiveIntegerField(default=1)
+    is_evaluated = models.BooleanField(default=False)
+    goal_met = models.BooleanField(null=True, blank=True)
+    evaluated_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    intake_id = models.CharField(max_length=32, null=True, blank=True, unique=True, editable=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+class ArchivedEvaluation(models.Model):
+    """Model definition for ArchivedEvaluation."""
+    decision = models.OneToOneField(ArchivedDecision, on_delete=models.CASCADE, related_name='evaluation')
+    goal_met = models.BooleanField()
+    comments = models.TextField(blank=True)
+    evaluated_at = models.DateTimeField()
+
+class DecisionTombstone(models.Model):
+    """
+    Model definition for DecisionTombstone.
+
+    Marks a deleted decision in the change feed, pruned after
+    `DECISION_TOMBSTONE_RETENTION_DAYS`.
+    """
+    decision_id = models.BigIntegerField()
+    tenant = models.CharField(max_length=64, default=default_tenant)
+    deleted_at = models.DateTimeField(default=timezone.now)
+    # Position in the change feed, like `Decision.change_seq`
+    change_seq = models.BigIntegerField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'decision_id'], name='tombstone_deleted_id_idx'),
+            models.Index(fields=['change_seq', 'decision_id'], name='tombstone_change_seq_idx'),
+            models.Index(fields=['id'], condition=Q(change_seq__isnull=True), name='tombstone_change_pending_idx'),
+        ]
+
+
+class ChangeSequence(models.Model):
+    """
+    Model definition for ChangeSequence.
+
+    The last number given to writes in the change feed of a shard, in a
+    single row. See `decisions.changes.number_changes`.
+    """
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def next_value(cls, database):
+        """
+        Take the next number of the feed of `database`, in a transaction
+
+        The row stays locked until the transaction ends, so a transaction
+        taking the number after it waits for it to commit: numbers only
+        grow in the order their transactions commit.
+        """
+        sequence = cls.objects.using(database)
+        if not sequence.filter(pk=1).update(value=F('value') + 1):
+            sequence.get_or_create(pk=1)
+            sequence.filter(pk=1).update(value=F('value') + 1)
+        return sequence.values_list('value', flat=True).get(pk=1)
+
+    @classmethod
+    def advance(cls, database, value):
+        """Make the next number of `database` greater than `value`, for tenants moved from another shard"""
+        sequence = cls.objects.using(database)
+        sequence.get_or_create(pk=1)
+        sequence.filter(pk=1, value__lt=value).update(value=value)
+
+    @classmethod
+    def current(cls, database):
+        return cls.objects.using(database).filter(pk=1).values_list('value', flat=True).first() or 0
+
+class DecisionHistory(models.Model):
+    """
+    Model definition for DecisionHistory.
+
+    Append-only log of the changes of a decision and its evaluation,
+    written in the transaction of the change. `changes` holds the fields
+    written, see `decisions.history`. Kept when the decision is deleted.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    EVALUATED = 'evaluated'
+    EVALUATION_RESET = 'evaluation_reset'
+    DELETED = 'deleted'
+    RESTORED = 'restored'
+    KIND_CHOICES = [
+        (CREATED, 'Created'),
+        (UPDATED, 'Updated'),
+        (EVALUATED, 'Evaluated'),
+        (EVALUATION_RESET, 'Evaluation reset'),
+        (DELETED, 'Deleted'),
+        (RESTORED, 'Restored from the archive'),
+    ]
+
+    decision_id = models.BigIntegerField()
+    tenant = models.CharField(max_length=64, default=default_tenant)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['decision_id', 'id'], name='history_decision_id_idx'),
+        ]
+
+
+class DecisionSnapshot(models.Model):
+    """
+    Model definition for DecisionSnapshot.
+
+    State of a decision once the history entries up to `last_entry_id`
+    are applied, written by `manage.py compact_decision_history` so
+    point-in-time reads only replay the entries after it. `state` is None
+    for deleted decisions.
+    """
+    decision_id = models.BigIntegerField()
+    tenant = models.CharField(max_length=64, default=default_tenant)
+    last_entry_id = models.BigIntegerField()
+    recorded_at = models.DateTimeField()
+    state = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['decision_id', 'last_entry_id'], name='snapshot_decision_entry_idx'),
+        ]
+
+class HistoryCompaction(models.Model):
+    """
+    Model definition for HistoryCompaction.
+
+    The highest history entry id `manage.py compact_decision_history` has
+    looked at on a shard, in a single row: decisions without entries after
+    it have no more entries since their latest snapshot than the last run
+    left them with, so they aren't looked at again.
+    """
+    last_entry_id = models.BigIntegerField(default=0)
+
+class DecisionStatusCount(models.Model):
+    """
+    Model definition for DecisionStatusCount.
+
+    Number of decisions per tenant and status, kept up to date on every
+    write so unfiltered and status-filtered lists never have to scan the
+    table.
+    """
+    tenant = models.CharField(max_length=64, default=default_tenant)
+    status = models.CharField(max_length=20, choices=Decision.STATUS_CHOICES)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'status'], name='unique_tenant_status_count'),
+        ]
+
+    @classmethod
+    def adjust(cls, tenant, status, delta):
+        """Apply `delta` to the counter of `status`, a no-op until the counters are built"""
+        cls.objects.filter(tenant=tenant, status=status).update(count=F('count') + delta)
+
+    @classmethod
+    def rebuild(cls, tenant):
+        """Recount the decisions of `tenant` per status with a single scan, on the primary"""
+        db = router.db_for_write(cls)
+        with transaction.atomic(using=db):
+            counts = dict(
+                Decision.objects.using(db).filter(tenant=tenant).order_by()
+                .values_list('status').annotate(Count('id'))
+            )
+            counts = {status: counts.get(status, 0) for status, _ in Decision.STATUS_CHOICES}
+            cls.objects.using(db).filter(tenant=tenant).delete()
+            cls.objects.using(db).bulk_create([
+                cls(tenant=tenant, status=status, count=count) for status, count in counts.items()
+            ])
+        return counts
+
+    @classmethod
+    def get_counts(cls, tenant):
+        """Counts per status of `tenant`, building the counters first if needed"""
+        counts = dict(cls.objects.filter(tenant=tenant).values_list('status', 'count'))
+        if len(counts) != len(Decision.STATUS_CHOICES):
+            counts = cls.rebuild(tenant)
+        return counts
+
+class TenantShard(models.Model):
+    """
+    Model definition for TenantShard.
+
+    Database alias holding the decisions of a tenant. Lives on the default
+    database, tenants get placed on first use.
+    """
+    tenant = models.CharField(max_length=64, unique=True)
+    database = models.CharField(max_length=64)
+
+class IdBlock(models.Model):
+    """
+    Model definition for IdBlock.
+
+    Next free id of a sequence shared by all shards, handed out to the
+    processes in blocks.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    next_id = models.BigIntegerField()
+
+
+class IdAllocator:
+    """Allocates ids of the `name` sequence from blocks reserved in the default database"""
+
+    def __init__(self, name, block_size=1000):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._limit = 0
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._limit:
+                self._next, self._limit = self._reserve()
+            self._next += 1
+            return self._next - 1
+
+    def _reserve(self):
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            blocks = IdBlock.objects.using(DEFAULT_DB_ALIAS)
+            if not blocks.filter(name=self.name).update(next_id=F('next_id') + self.block_size):
+                blocks.create(name=self.name, next_id=self._highest_id() + 1 + self.block_size)
+            limit = blocks.get(name=self.name).next_id
+        return limit - self.block_size, limit
+
+    @staticmethod
+    def _highest_id():
+        """Highest decision id on any shard, hot or archived"""
+        highest = 0
+        for alias in settings.DECISION_SHARDS:
+            for model in (Decision, ArchivedDecision):
+                highest = max(highest, model.objects.using(alias).aggregate(highest=Max('id'))['highest'] or 0)
+        return highest
+
+
+decision_ids = IdAllocator('decision')
+
+
+class IdempotencyKey(models.Model):
+    """
+    Model definition for IdempotencyKey.
+
+    First response to a POST sent with an `Idempotency-Key` header, replayed
+    to retries of the same user and key until `expires_at`. The response
+    fields are empty while the first request is still running.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    body = models.BinaryField(null=True, blank=True)
+    headers = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_unique'),
+        ]
+
+    @property
+    def completed(self):
+        return self.status_code is not None
@@ -0,0 +1,146 @@
+import hashlib
+import json
+from functools import partial
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+
+from enterpriseApi.metrics import CACHE_REQUESTS, COUNT_SOURCE, PAGINATION_DEPTH
+
+COUNT_VERSION_KEY = 'decisions:count-version'
+
+
+def invalidate_cached_counts(using=None):
+    """
+    Invalidate every cached decision count, called on writes to Decision
+
+    Done once the transaction of the write on `using` commits: bumped
+    before, a concurrent list could still count the rows as they were and
+    cache that under the new version.
+    """
+    transaction.on_commit(_bump_count_version, using=using)
+
+
+def _bump_count_version():
+    try:
+        cache.incr(COUNT_VERSION_KEY)
+    except ValueError:
+        cache.set(COUNT_VERSION_KEY, 1, None)
+
+
+def _count_cache_key(queryset):
+    version = cache.get_or_set(COUNT_VERSION_KEY, 1, None)
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+    return f'decisions:count:{version}:{digest}'
+
+
+def planner_estimate(queryset):
+    """Row estimate from the PostgreSQL planner, without executing the query"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate_count(queryset, exact_count_threshold, cache_timeout):
+    """
+    Count of `queryset` without a full scan when possible, returns a tuple of (count, is the count exact)
+
+    Small sets are counted exactly, bigger ones come from the cache or,
+    on PostgreSQL, the planner estimate. Elsewhere they are counted once
+    and cached.
+    """
+    bounded = queryset.order_by()[:exact_count_threshold + 1].count()
+    if bounded <= exact_count_threshold:
+        COUNT_SOURCE.labels('exact').inc()
+        return bounded, True
+
+    key = _count_cache_key(queryset)
+    count = cache.get(key)
+    CACHE_REQUESTS.labels('decision_count', 'miss' if count is None else 'hit').inc()
+    if count is not None:
+        COUNT_SOURCE.labels('cache').inc()
+        return count, True
+
+    if connections[queryset.db].vendor == 'postgresql':
+        COUNT_SOURCE.labels('estimate').inc()
+        return planner_estimate(queryset), False
+
+    count = queryset.count()
+    cache.set(key, count, cache_timeout)
+    COUNT_SOURCE.labels('full').inc()
+    return count, True
+
+
+class CountedPaginator(Paginator):
+    """Django paginator which uses a precomputed count"""
+
+    def __init__(self, *args, count, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        return self._count
+
+
+class DecisionPagination(PageNumberPagination):
+    """
+    Page number pagination which avoids full COUNT(*) scans on large tables
+
+    The count is resolved, cheapest first, from:
+    - the status counters of the tenant, for unfiltered and `?status=` lists
+    - an exact count, when the filtered set is small
+    - the cache, keyed by the filtered query and invalidated on writes
+    - the planner estimate on PostgreSQL, flagged with `count_exact: false`
+    - a full count, which is then cached
+    """
+
+    # Bigger sets than this are not counted exactly on every request
+    exact_count_threshold = 1000
+    cache_timeout = 300
+    # Query parameters which don't change the number of results
+    non_filter_params = {'page', 'ordering', 'stream', 'format'}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count, self.count_exact = self.get_count(queryset, request)
+        self.django_paginator_class = partial(CountedPaginator, count=count)
+        page = super().paginate_queryset(queryset, request, view)
+        if page is not None:
+            PAGINATION_DEPTH.observe(self.page.number)
+        return page
+
+    def get_count(self, queryset, request):
+        """Returns a tuple of (count, is the count exact)"""
+        from decisions.models import DecisionStatusCount
+        from decisions.sharding import get_tenant
+
+        filters = set(request.query_params) - self.non_filter_params
+        if filters <= {'status'}:
+            counts = DecisionStatusCount.get_counts(get_tenant())
+            if not filters:
+                COUNT_SOURCE.labels('counters').inc()
+                return sum(counts.values()), True
+            status = request.query_params['status']
+            if status in counts:
+                COUNT_SOURCE.labels('counters').inc()
+                return counts[status], True
+
+        return estimate_count(queryset, self.exact_count_threshold, self.cache_timeout)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_exact'] = self.count_exact
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count_exact'] = {'type': 'boolean', 'example': True}
+        return schema
@@ -15,8 +15,11 @@ class DecisionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Decision
-        fields = ['id', 'title', 'description', 'measurable_goal', 'status', 'created_at', 'updated_at', 'evaluation']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = [
+            'id', 'title', 'description', 'measurable_goal', 'status', 'created_at', 'updated_at', 'version',
+            'is_evaluated', 'goal_met', 'evaluation',
+        ]
+        read_only_fields = ['id', 'created_at', 'updated_at', 'version', 'is_evaluated', 'goal_met']
 
 class DecisionCreateUpdateSerializer(serializers.ModelSerializer):
     """Serializer for creating and updating decision"""
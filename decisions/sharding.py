@@ -0,0 +1,121 @@
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError
+
+# Models living on the shard of their tenant, everything else stays on the default database
+SHARDED_MODELS = {
+    'decision', 'evaluation', 'archiveddecision', 'archivedevaluation',
+    'decisiontombstone', 'decisionstatuscount', 'decisionhistory', 'decisionsnapshot', 'changesequence',
+    'historycompaction',
+}
+
+current_tenant = ContextVar('current_tenant', default=None)
+current_shard = ContextVar('current_shard', default=None)
+
+
+def get_tenant():
+    return current_tenant.get() or settings.DEFAULT_TENANT
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'decisions' and model._meta.model_name in SHARDED_MODELS
+
+
+@contextmanager
+def use_shard(shard, tenant=None):
+    """Route the decision models to `shard` and scope them to `tenant`"""
+    shard_token = current_shard.set(shard)
+    tenant_token = current_tenant.set(tenant)
+    try:
+        yield
+    finally:
+        current_shard.reset(shard_token)
+        current_tenant.reset(tenant_token)
+
+
+@contextmanager
+def use_tenant(tenant):
+    with use_shard(shard_for_tenant(tenant), tenant):
+        yield
+
+
+def _cache_key(tenant):
+    return f'tenant-shard:{tenant}'
+
+
+def shard_for_tenant(tenant):
+    """
+    Database alias holding the decisions of `tenant`
+
+    New tenants are placed by hash on one of `DECISION_SHARDS` and the
+    placement is recorded, so it doesn't change when shards are added.
+    """
+    from decisions.models import TenantShard
+
+    if len(settings.DECISION_SHARDS) == 1:
+        return settings.DECISION_SHARDS[0]
+
+    shard = cache.get(_cache_key(tenant))
+    if shard is None:
+        shards = TenantShard.objects.using(DEFAULT_DB_ALIAS)
+        shard = shards.filter(tenant=tenant).values_list('database', flat=True).first()
+        if shard is None:
+            placement = settings.DECISION_SHARDS[zlib.crc32(tenant.encode()) % len(settings.DECISION_SHARDS)]
+            try:
+                shard = shards.create(tenant=tenant, database=placement).database
+            except IntegrityError:
+                shard = shards.get(tenant=tenant).database
+        cache.set(_cache_key(tenant), shard, 300)
+    return shard
+
+
+def move_tenant_placement(tenant, shard):
+    from decisions.models import TenantShard
+
+    TenantShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(tenant=tenant, defaults={'database': shard})
+    cache.delete(_cache_key(tenant))
+
+
+def tenant_for_user(user):
+    """Tenant of an authenticated user, the default tenant for anyone else"""
+    from authentication.models import UserTenant
+
+    if user is None or not user.is_authenticated:
+        return settings.DEFAULT_TENANT
+    tenant = UserTenant.objects.filter(user=user).values_list('tenant', flat=True).first()
+    return tenant or settings.DEFAULT_TENANT
+
+
+class ShardRouter:
+    """
+    Sends the decision models to the shard selected by `use_shard`
+
+    On the default shard, or outside of a shard context, it has no opinion
+    and the next router decides, e.g. to read from a replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model)
+
+    def _shard(self, model):
+        shard = current_shard.get()
+        if shard and shard != DEFAULT_DB_ALIAS and is_sharded(model):
+            return shard
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._state.db in settings.DECISION_SHARDS or obj2._state.db in settings.DECISION_SHARDS:
+            return obj1._state.db == obj2._state.db or None
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db != DEFAULT_DB_ALIAS and db in settings.DECISION_SHARDS:
+            return app_label == 'decisions' and model_name in SHARDED_MODELS
+        return None
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from decisions import analytics, autocomplete, history
+from decisions.models import Decision, DecisionHistory, DecisionStatusCount, DecisionTombstone, Evaluation
+from decisions.pagination import invalidate_cached_counts
+
+
+@receiver(post_save, sender=Decision)
+def decision_saved(sender, instance, created, **kwargs):
+    if created:
+        DecisionStatusCount.adjust(instance.tenant, instance.status, 1)
+    elif instance._loaded_status is not None and instance._loaded_status != instance.status:
+        DecisionStatusCount.adjust(instance.tenant, instance._loaded_status, -1)
+        DecisionStatusCount.adjust(instance.tenant, instance.status, 1)
+    instance._loaded_status = instance.status
+    autocomplete.decision_written(instance, instance._loaded_title)
+    instance._loaded_title = instance.title
+    analytics.touch(instance.tenant, instance.created_at, instance.completed_at, instance._loaded_completed_at, instance.evaluated_at)
+    instance._loaded_completed_at = instance.completed_at
+    history.decision_saved(instance, created)
+    invalidate_cached_counts(using=instance._state.db)
+
+
+@receiver(post_delete, sender=Decision)
+def decision_deleted(sender, instance, **kwargs):
+    if instance._loaded_status is not None:
+        DecisionStatusCount.adjust(instance.tenant, instance._loaded_status, -1)
+    DecisionTombstone.objects.create(decision_id=instance.pk, tenant=instance.tenant)
+    autocomplete.decision_deleted(instance)
+    analytics.touch(instance.tenant, instance.created_at, instance.completed_at, instance.evaluated_at)
+    history.record(instance.pk, instance.tenant, DecisionHistory.DELETED, using=instance._state.db)
+    invalidate_cached_counts(using=instance._state.db)
+
+
+@receiver(post_save, sender=Evaluation)
+def evaluation_saved(sender, instance, **kwargs):
+    Decision.objects.filter(pk=instance.decision_id).update(
+        is_evaluated=True, goal_met=instance.goal_met, evaluated_at=instance.evaluated_at, change_seq=None,
+    )
+    analytics.touch(instance.decision.tenant, instance.evaluated_at)
+    history.evaluation_saved(instance, instance.decision.tenant)
+    # The evaluation filters count the decision columns updated above
+    invalidate_cached_counts(using=instance._state.db)
+
+
+@receiver(post_delete, sender=Evaluation)
+def evaluation_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Decision):
+        # Deleted along with its decision
+        return
+    Decision.objects.filter(pk=instance.decision_id).update(is_evaluated=False, goal_met=None, evaluated_at=None, change_seq=None)
+    analytics.touch(instance.decision.tenant, instance.evaluated_at)
+    history.record(instance.decision_id, instance.decision.tenant, DecisionHistory.EVALUATION_RESET, using=instance._state.db)
+    invalidate_cached_counts(using=instance._state.db)
@@ -0,0 +1,86 @@
+import time
+
+from django.conf import settings
+
+from decisions import bulk_delete
+from decisions.filters import DecisionFilter
+from decisions.models import Decision, DecisionStatusCount
+from decisions.pagination import invalidate_cached_counts
+from decisions.serializers import DecisionSerializer
+from decisions.sharding import use_tenant
+from enterpriseApi.renderers import dumps
+from jobs.registry import task
+
+# Decisions read per query, and between two progress reports
+EXPORT_CHUNK_SIZE = 500
+
+
+@task('decisions.export')
+def export_decisions(job, tenant, filters=None, status=None):
+    """Write the decisions of `tenant` matching the list `filters` as a JSON array to the output file of the job"""
+    path = job.output_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix('.part')
+    count = 0
+    with use_tenant(tenant):
+        queryset = Decision.objects.filter(tenant=tenant).select_related('evaluation').order_by('pk')
+        if status:
+            # Jobs queued before the export took the list filters
+            queryset = queryset.filter(status=status)
+        if filters:
+            queryset = DecisionFilter(filters, queryset=queryset).qs
+        total = queryset.count()
+        with partial.open('wb') as output:
+            output.write(b'[')
+            for decision in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                if count:
+                    output.write(b',')
+                output.write(dumps(DecisionSerializer(decision).data))
+                count += 1
+                if count % EXPORT_CHUNK_SIZE == 0:
+                    job.report_progress(count, total)
+            output.write(b']')
+    partial.replace(path)
+    return {'count': count, 'file': path.name}
+
+
+@task('decisions.rebuild_counts')
+def rebuild_counts(job, tenant):
+    """Recount the decisions of `tenant` per status"""
+    with use_tenant(tenant):
+        counts = DecisionStatusCount.rebuild(tenant)
+    invalidate_cached_counts()
+    return counts
+
+
+@task('decisions.bulk_delete')
+def delete_decisions(job, tenant, filters, until_id, phase=bulk_delete.HOT, after=0, deleted=0):
+    """
+    Delete the decisions of `tenant` matching the list `filters` with an id up to `until_id`, in chunks
+
+    Pauses `DECISION_BULK_DELETE_PAUSE` seconds between chunks to leave
+    the database to live traffic. The position is checkpointed after
+    every chunk, an attempt after a failure resumes from it.
+    """
+    first = [name for name, *_ in bulk_delete.PHASES].index(phase)
+    with use_tenant(tenant):
+        pending = [
+            (name, DecisionFilter(filters, queryset=model.objects.filter(tenant=tenant, pk__lte=until_id)).qs, evaluation_model, counted)
+            for name, model, evaluation_model, counted in bulk_delete.PHASES[first:]
+        ]
+        # What is left, plus what earlier attempts deleted
+        total = deleted + sum(queryset.filter(pk__gt=after if name == phase else 0).count() for name, queryset, *_ in pending)
+        for name, queryset, evaluation_model, counted in pending:
+            if name != phase:
+                after = 0
+            while True:
+                count, after = bulk_delete.delete_chunk(
+                    queryset, evaluation_model, after, settings.DECISION_BULK_DELETE_CHUNK_SIZE, counted,
+                )
+                if not count:
+                    break
+                deleted += count
+                job.checkpoint(phase=name, after=after, deleted=deleted)
+                job.report_progress(deleted, total)
+                time.sleep(settings.DECISION_BULK_DELETE_PAUSE)
+    return {'deleted': deleted}
@@ -1,8 +1,37 @@
+import asyncio
+import gzip
+import io
+import json
+import threading
 import pytest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import urlencode
 from django.urls import reverse
 from rest_framework import status
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APIClient
-from decisions.models import Decision, Evaluation
+from decisions.changes import Change, encode_token, latest_token
+from decisions.events import ChangeBroadcaster, DecisionEventsApp, Event, Subscription
+from decisions import autocomplete, history, idempotency, intake, pagination, views
+from decisions.models import (
+    ArchivedDecision,
+    ArchivedEvaluation,
+    Decision,
+    DecisionHistory,
+    DecisionSnapshot,
+    DecisionStatusCount,
+    DecisionTombstone,
+    Evaluation,
+    HistoryCompaction,
+    IdempotencyKey,
+    StaleVersion,
+)
+from decisions.pagination import DecisionPagination
 from decisions.serializers import DecisionSerializer, DecisionCreateUpdateSerializer\
 
 @pytest.mark.django_db
@@ -290,3 +319,1389 @@ class TestDecisionViewSetFiltersAndPagination:
         response = api_client.get(url, {"page": 3})
         assert response.status_code == status.HTTP_200_OK
         assert len(response.data["results"]) == 5  # Third page should have 5 items
+
+
+@pytest.mark.django_db
+class TestDecisionRenderingAndStreaming:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def decisions(self):
+        for i in range(12):
+            decision = Decision.objects.create(title=f"Decision {i:02}", description="Description", measurable_goal="Goal", status="Completed")
+            if i % 2:
+                Evaluation.objects.create(decision=decision, goal_met=True, comments="Done")
+
+    def test_datetimes_rendered_as_iso_utc(self, api_client, decisions):
+        """Test that datetimes are rendered in ISO 8601 with a Z suffix."""
+        url = reverse("decision-list")
+        response = api_client.get(url)
+        body = json.loads(response.content)
+        assert body["results"][0]["created_at"].endswith("Z")
+        assert body["results"][1]["evaluation"]["evaluated_at"].endswith("Z")
+
+    def test_invalid_json_body(self, api_client, django_user_model):
+        """Test that a malformed JSON body is rejected."""
+        user = django_user_model.objects.create_user(username="user", password="password")
+        api_client.force_authenticate(user=user)
+        response = api_client.post(reverse("decision-list"), data=b'{"title": ', content_type="application/json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_streamed_page_matches_regular_page(self, api_client, decisions):
+        """Test that a streamed page has the same content as a regular page."""
+        url = reverse("decision-list")
+        regular = json.loads(api_client.get(url, {"page": 2}).content)
+        response = api_client.get(url, {"page": 2, "stream": "true"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        streamed = json.loads(b"".join(response.streaming_content))
+        assert streamed["results"] == regular["results"]
+        assert streamed["count"] == regular["count"] == 12
+
+    def test_streamed_page_gzip(self, api_client, decisions):
+        """Test that a streamed page is gzip compressed when the client accepts it."""
+        url = reverse("decision-list")
+        response = api_client.get(url, {"stream": "1"}, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        assert response["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response["Vary"]
+        body = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        assert len(body["results"]) == 10
+
+
+@pytest.mark.django_db
+class TestDecisionPaginationCounts:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        cache.clear()
+
+    @pytest.fixture
+    def decisions(self):
+        for i in range(5):
+            Decision.objects.create(title=f"Pending {i}", description="Description", measurable_goal="Goal", status="Pending")
+        for i in range(3):
+            Decision.objects.create(title=f"Completed {i}", description="Description", measurable_goal="Goal", status="Completed")
+
+    def test_unfiltered_count_from_counters(self, api_client, decisions):
+        """Test that the unfiltered count comes from the status counters."""
+        url = reverse("decision-list")
+        api_client.get(url)  # builds the counters
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(url)
+        assert response.data["count"] == 8
+        assert response.data["count_exact"] is True
+        assert not any("COUNT(" in query["sql"].upper() for query in queries.captured_queries)
+
+    def test_counters_follow_writes(self, api_client, decisions):
+        """Test that the status counters follow creates, status changes and deletes."""
+        url = reverse("decision-list")
+        assert api_client.get(url, {"status": "Pending"}).data["count"] == 5
+        decision = Decision.objects.filter(status="Pending").first()
+        decision.status = "Completed"
+        decision.save()
+        Decision.objects.filter(status="Pending").first().delete()
+        Decision.objects.create(title="New", description="Description", measurable_goal="Goal")
+        assert dict(DecisionStatusCount.objects.values_list("status", "count")) == {"Pending": 4, "Completed": 4}
+        assert api_client.get(url, {"status": "Completed"}).data["count"] == 4
+
+    def test_counters_follow_writes_of_unloaded_instances(self, decisions):
+        """Test that saving or deleting an instance not loaded from the database keeps the counters exact."""
+        DecisionStatusCount.rebuild("default")
+        pending = Decision.objects.filter(status="Pending").values_list("pk", flat=True)
+        Decision(pk=pending[0], title="Saved", description="Description", measurable_goal="Goal", status="Pending").save(update_fields=["title"])
+        Decision(pk=pending[1], title="Completed", description="Description", measurable_goal="Goal", status="Completed").save(update_fields=["status"])
+        Decision.objects.only("pk").get(pk=pending[2]).delete()
+        assert DecisionStatusCount.get_counts("default") == {"Pending": 3, "Completed": 4}
+        assert DecisionStatusCount.rebuild("default") == {"Pending": 3, "Completed": 4}
+
+    def test_large_filtered_count_is_cached(self, api_client, decisions, monkeypatch, django_capture_on_commit_callbacks):
+        """Test that counts over the exact threshold are cached until the next write commits."""
+        monkeypatch.setattr(DecisionPagination, "exact_count_threshold", 2)
+        url = reverse("decision-list")
+        response = api_client.get(url, {"search": "Pending"})
+        assert response.data["count"] == 5
+        assert response.data["count_exact"] is True
+        with CaptureQueriesContext(connection) as queries:
+            api_client.get(url, {"search": "Pending"})
+        assert sum("COUNT(" in query["sql"].upper() for query in queries.captured_queries) == 1
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            Decision.objects.create(title="Pending 5", description="Description", measurable_goal="Goal")
+            version = cache.get(pagination.COUNT_VERSION_KEY)
+        assert callbacks
+        # Bumped once committed, so a count made before can't be cached under the new version
+        assert cache.get(pagination.COUNT_VERSION_KEY) == version + 1
+        assert api_client.get(url, {"search": "Pending"}).data["count"] == 6
+
+    def test_cached_count_follows_evaluations(self, api_client, decisions, monkeypatch, django_capture_on_commit_callbacks):
+        """Test that evaluating a decision or resetting its evaluation invalidates the cached evaluation counts."""
+        monkeypatch.setattr(DecisionPagination, "exact_count_threshold", 2)
+        url = reverse("decision-list")
+        assert api_client.get(url, {"evaluated": "false"}).data["count"] == 8
+        decision = Decision.objects.filter(status="Completed").first()
+        with django_capture_on_commit_callbacks(execute=True):
+            evaluation = Evaluation.objects.create(decision=decision, goal_met=True)
+        response = api_client.get(url, {"evaluated": "false"})
+        assert (response.data["count"], response.data["count_exact"]) == (7, True)
+        with django_capture_on_commit_callbacks(execute=True):
+            evaluation.delete()
+        assert api_client.get(url, {"evaluated": "false"}).data["count"] == 8
+
+
+@pytest.mark.django_db
+class TestDecisionChangeFeed:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    @pytest.fixture
+    def decision_data(self):
+        return {"title": "Test Decision", "description": "Description", "measurable_goal": "Goal", "status": "Completed"}
+
+    def test_feed_resumes_from_token(self, api_client, decision_data):
+        """Test that the feed returns only changes after the token."""
+        url = reverse("decision-changes")
+        first = Decision.objects.create(**decision_data)
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert [change["id"] for change in response.data["changes"]] == [first.pk]
+
+        second = Decision.objects.create(**decision_data)
+        response = api_client.get(url, {"since": response.data["next"]})
+        assert [change["id"] for change in response.data["changes"]] == [second.pk]
+        assert response.data["changes"][0]["type"] == "upsert"
+
+        response = api_client.get(url, {"since": response.data["next"]})
+        assert response.data["changes"] == []
+
+    def test_feed_pages_with_limit(self, api_client, decision_data):
+        """Test that the feed can be walked in small pages without gaps."""
+        created = [Decision.objects.create(**decision_data).pk for _ in range(5)]
+        url = reverse("decision-changes")
+        seen, since = [], None
+        while True:
+            response = api_client.get(url, {"limit": 2, **({"since": since} if since else {})})
+            seen += [change["id"] for change in response.data["changes"]]
+            since = response.data["next"]
+            if not response.data["has_more"]:
+                break
+        assert seen == created
+
+    def test_feed_sees_writes_committed_out_of_order(self, api_client, decision_data):
+        """Test that a write timestamped before the last change read, but committed after the read, is not skipped."""
+        url = reverse("decision-changes")
+        first = Decision.objects.create(**decision_data)
+        since = api_client.get(url).data["next"]
+
+        # Its transaction took its timestamp before the first one, and committed after the read
+        late = Decision.objects.create(**decision_data)
+        Decision.objects.filter(pk=late.pk).update(updated_at=first.updated_at - timedelta(seconds=1))
+        response = api_client.get(url, {"since": since})
+        assert [change["id"] for change in response.data["changes"]] == [late.pk]
+        assert api_client.get(url, {"since": response.data["next"]}).data["changes"] == []
+
+    def test_feed_limit_is_clamped(self, api_client, decision_data):
+        """Test that a zero or negative limit reads one change and reports that more are left."""
+        for _ in range(3):
+            Decision.objects.create(**decision_data)
+        for limit in (0, -5):
+            response = api_client.get(reverse("decision-changes"), {"limit": limit})
+            assert len(response.data["changes"]) == 1
+            assert response.data["has_more"] is True
+
+    def test_feed_includes_evaluation_and_reset(self, api_client, admin_user, decision_data):
+        """Test that evaluations and evaluation resets show up in the feed."""
+        decision = Decision.objects.create(**decision_data)
+        url = reverse("decision-changes")
+        since = api_client.get(url).data["next"]
+
+        api_client.force_authenticate(user=admin_user)
+        api_client.post(reverse("decision-evaluate", kwargs={"pk": decision.pk}), {"goal_met": True})
+        response = api_client.get(url, {"since": since})
+        assert response.data["changes"][0]["decision"]["evaluation"]["goal_met"] is True
+
+        since = response.data["next"]
+        api_client.put(reverse("decision-detail", kwargs={"pk": decision.pk}), {**decision_data, "status": "Pending"})
+        response = api_client.get(url, {"since": since})
+        assert response.data["changes"][0]["decision"]["evaluation"] is None
+
+    def test_feed_tombstone_on_delete(self, api_client, admin_user, decision_data):
+        """Test that deleting a decision emits a tombstone."""
+        decision = Decision.objects.create(**decision_data)
+        url = reverse("decision-changes")
+        since = api_client.get(url).data["next"]
+        api_client.force_authenticate(user=admin_user)
+        api_client.delete(reverse("decision-detail", kwargs={"pk": decision.pk}))
+        response = api_client.get(url, {"since": since})
+        assert response.data["changes"] == [
+            {"type": "delete", "id": decision.pk, "changed_at": response.data["changes"][0]["changed_at"], "decision": None}
+        ]
+
+    def test_feed_expired_token(self, api_client, settings):
+        """Test that a token older than the tombstone retention is rejected."""
+        token = encode_token(1, 1, timezone.now() - timedelta(days=settings.DECISION_TOMBSTONE_RETENTION_DAYS + 1))
+        response = api_client.get(reverse("decision-changes"), {"since": token})
+        assert response.status_code == status.HTTP_410_GONE
+
+    def test_feed_invalid_token(self, api_client):
+        """Test that a malformed token is rejected."""
+        response = api_client.get(reverse("decision-changes"), {"since": "not-a-token"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def run_events_app(app, query_string=b"", headers=(), events=1, timeout=5):
+    """Drive the events ASGI app until `events` events were sent, then disconnect."""
+
+    async def main(after_subscribe):
+        messages = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if sum(m.get("body", b"").startswith(b"id:") for m in messages) >= events:
+                disconnect.set()
+
+        scope = {"type": "http", "path": "/api/decisions/events", "query_string": query_string, "headers": list(headers)}
+        task = asyncio.ensure_future(app(scope, receive, send))
+        if after_subscribe:
+            await asyncio.sleep(0.2)
+            await sync_to_async(after_subscribe)()
+        await asyncio.wait_for(task, timeout)
+        return messages
+
+    def run(after_subscribe=None):
+        messages = asyncio.run(main(after_subscribe))
+        bodies = [m["body"] for m in messages if m.get("body", b"").startswith(b"id:")]
+        return messages, [dict(line.split(": ", 1) for line in body.decode().strip().split("\n")) for body in bodies]
+
+    return run
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDecisionEvents:
+    @pytest.fixture
+    def app(self):
+        return DecisionEventsApp(ChangeBroadcaster(poll_interval=0.05))
+
+    def create(self, title, status="Pending"):
+        return Decision.objects.create(title=title, description="Description", measurable_goal="Goal", status=status)
+
+    def test_live_event_pushed(self, app):
+        """Test that a decision created while connected is pushed to the client."""
+        self.create("Before")
+        messages, events = run_events_app(app)(lambda: self.create("Live"))
+        assert messages[0]["status"] == 200
+        assert (b"content-type", b"text/event-stream") in messages[0]["headers"]
+        assert events[0]["event"] == "created"
+        assert json.loads(events[0]["data"])["decision"]["title"] == "Live"
+
+    def test_resume_with_last_event_id(self, app):
+        """Test that missed events are replayed after Last-Event-ID, filtered by status."""
+        self.create("First")
+        token = latest_token(Decision.objects.all())
+        self.create("Completed", status="Completed")
+        missed = self.create("Missed")
+        _, events = run_events_app(app, b"status=Pending", [(b"last-event-id", token.encode())])()
+        assert len(events) == 1
+        assert json.loads(events[0]["data"])["id"] == missed.pk
+        missed.refresh_from_db()
+        assert events[0]["id"] == encode_token(missed.change_seq, missed.pk, missed.updated_at)
+
+    def test_broadcaster_follows_from_last_event_id(self):
+        """Test that a shard is followed from the Last-Event-ID of its first subscriber, not from the first poll."""
+        self.create("First")
+        token = latest_token(Decision.objects.all())
+        broadcaster = ChangeBroadcaster()
+        subscription = Subscription("default", "default")
+        broadcaster.subscribers.add(subscription)
+
+        async def main():
+            await broadcaster.follow("default", token)
+            # Committed after the replay of the subscriber, before the first poll
+            await sync_to_async(self.create)("Between")
+            await broadcaster.poll()
+
+        asyncio.run(main())
+        assert subscription.queue.get_nowait().data["decision"]["title"] == "Between"
+
+    def test_invalid_status(self, app):
+        """Test that an unknown status filter is rejected."""
+        messages, _ = run_events_app(app, b"status=Unknown")()
+        assert messages[0]["status"] == 400
+
+    def test_slow_subscriber_is_cut_off(self):
+        """Test that a subscriber whose queue is full gets disconnected instead of blocking."""
+        subscription = Subscription("default", "default", maxsize=1)
+        for pk in (1, 2):
+            subscription.offer(Event(Change(pk, pk, timezone.now(), "default", None), "created", "Pending", {}))
+        assert subscription.overflowed
+        assert subscription.queue.get_nowait() is None
+
+
+@pytest.mark.django_db
+class TestDecisionArchive:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def normal_user(self, django_user_model):
+        return django_user_model.objects.create_user(username="user", email="user@example.com", password="password")
+
+    @pytest.fixture
+    def decisions(self):
+        old = timezone.now() - timedelta(days=400)
+        for i in range(3):
+            decision = Decision.objects.create(title=f"Old {i}", description="Description", measurable_goal="Goal", status="Completed")
+            Evaluation.objects.create(decision=decision, goal_met=bool(i % 2), comments="Done")
+        Decision.objects.update(updated_at=old, created_at=old)
+        Decision.objects.create(title="Recent", description="Description", measurable_goal="Goal", status="Completed")
+        Decision.objects.create(title="Active", description="Description", measurable_goal="Goal", status="Pending")
+
+    def archive(self):
+        call_command("archive_decisions", "--older-than", "365", "--batch-size", "2", stdout=io.StringIO())
+
+    def test_archive_moves_old_evaluated_decisions(self, decisions):
+        """Test that only old evaluated decisions are moved to the archive."""
+        self.archive()
+        assert sorted(Decision.objects.values_list("title", flat=True)) == ["Active", "Recent"]
+        assert ArchivedDecision.objects.count() == 3
+        assert ArchivedEvaluation.objects.count() == 3
+        assert ArchivedDecision.objects.get(title="Old 0").created_at < timezone.now() - timedelta(days=365)
+        assert not DecisionTombstone.objects.exists()
+
+    def test_list_include_archived(self, api_client, decisions):
+        """Test that the list only includes archived decisions when asked to."""
+        self.archive()
+        url = reverse("decision-list")
+        assert api_client.get(url).data["count"] == 2
+        response = api_client.get(url, {"include_archived": "true", "ordering": "-title"})
+        assert response.data["count"] == 5
+        titles = [decision["title"] for decision in response.data["results"]]
+        assert titles == ["Recent", "Old 2", "Old 1", "Old 0", "Active"]
+        assert response.data["results"][2]["evaluation"]["goal_met"] is True
+
+        response = api_client.get(url, {"include_archived": "true", "search": "Old", "page": 1})
+        assert response.data["count"] == 3
+
+    def test_evaluation_filters_include_archived(self, api_client, decisions):
+        """Test that the evaluation filters and ordering apply to archived decisions too."""
+        self.archive()
+        url = reverse("decision-list")
+        response = api_client.get(url, {"include_archived": "true", "evaluated": "true", "goal_met": "true"})
+        assert [decision["title"] for decision in response.data["results"]] == ["Old 1"]
+
+        response = api_client.get(url, {"include_archived": "true", "ordering": "-goal_met,title"})
+        assert [decision["title"] for decision in response.data["results"]][:3] == ["Old 1", "Old 0", "Old 2"]
+
+    def test_retrieve_include_archived(self, api_client, decisions):
+        """Test that archived decisions can be retrieved with include_archived."""
+        self.archive()
+        archived = ArchivedDecision.objects.get(title="Old 1")
+        url = reverse("decision-detail", kwargs={"pk": archived.pk})
+        assert api_client.get(url).status_code == status.HTTP_404_NOT_FOUND
+        response = api_client.get(url, {"include_archived": "1"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["evaluation"]["goal_met"] is True
+
+    def test_update_restores_archived_decision(self, api_client, decisions, normal_user):
+        """Test that updating an archived decision restores it and resets its evaluation."""
+        self.archive()
+        archived = ArchivedDecision.objects.get(title="Old 0")
+        api_client.force_authenticate(user=normal_user)
+        url = reverse("decision-detail", kwargs={"pk": archived.pk})
+        data = {"title": "Old 0", "description": "Description", "measurable_goal": "New goal", "status": "Completed"}
+        response = api_client.put(url, data)
+        assert response.status_code == status.HTTP_200_OK
+        decision = Decision.objects.get(pk=archived.pk)
+        assert decision.measurable_goal == "New goal"
+        assert decision.created_at < timezone.now() - timedelta(days=365)
+        assert not Evaluation.objects.filter(decision=decision).exists()
+        assert not ArchivedDecision.objects.filter(pk=archived.pk).exists()
+        assert DecisionStatusCount.get_counts("default")["Completed"] == 2
+
+    def test_rejected_update_keeps_decision_archived(self, api_client, decisions, normal_user):
+        """Test that an update of an archived decision failing validation or its precondition leaves it archived."""
+        self.archive()
+        archived = ArchivedDecision.objects.get(title="Old 0")
+        api_client.force_authenticate(user=normal_user)
+        url = reverse("decision-detail", kwargs={"pk": archived.pk})
+        data = {"title": "Old 0", "description": "Description", "measurable_goal": "Goal", "status": "Unknown"}
+        assert api_client.put(url, data).status_code == status.HTTP_400_BAD_REQUEST
+        data["status"] = "Completed"
+        response = api_client.put(url, data, HTTP_IF_MATCH='"99"')
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+        assert ArchivedDecision.objects.filter(pk=archived.pk).exists()
+        assert not Decision.objects.filter(pk=archived.pk).exists()
+        assert DecisionStatusCount.get_counts("default")["Completed"] == 1
+
+    def test_restore_keeps_evaluation_and_history(self, api_client, decisions, normal_user):
+        """Test that a restore keeps the evaluation time and is recorded as a restore, not a creation."""
+        self.archive()
+        archived = ArchivedDecision.objects.select_related("evaluation").get(title="Old 0")
+        api_client.force_authenticate(user=normal_user)
+        url = reverse("decision-detail", kwargs={"pk": archived.pk})
+        data = {"title": "Old 0 renamed", "description": "Description", "measurable_goal": "Goal", "status": "Completed"}
+        assert api_client.put(url, data).status_code == status.HTTP_200_OK
+        decision = Decision.objects.get(pk=archived.pk)
+        assert decision.evaluated_at == decision.evaluation.evaluated_at == archived.evaluation.evaluated_at
+        kinds = list(DecisionHistory.objects.filter(decision_id=archived.pk).order_by("id").values_list("kind", flat=True))
+        assert kinds[-2:] == [DecisionHistory.RESTORED, DecisionHistory.UPDATED]
+        assert kinds.count(DecisionHistory.CREATED) == 1
+        assert kinds.count(DecisionHistory.EVALUATED) == 1
+
+    def test_delete_archived_decision(self, api_client, decisions, normal_user):
+        """Test that deleting an archived decision removes it and leaves a tombstone."""
+        self.archive()
+        archived = ArchivedDecision.objects.get(title="Old 2")
+        api_client.force_authenticate(user=normal_user)
+        response = api_client.delete(reverse("decision-detail", kwargs={"pk": archived.pk}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert not ArchivedEvaluation.objects.filter(decision_id=archived.pk).exists()
+        assert DecisionTombstone.objects.filter(decision_id=archived.pk).exists()
+        response = api_client.get(reverse("decision-history", args=[archived.pk])).json()
+        assert (response["state"], response["deleted"]) == (None, True)
+        assert response["entries"][0]["kind"] == DecisionHistory.DELETED
+
+
+@pytest.mark.django_db(databases=["default", "shard_1"])
+class TestDecisionSharding:
+    @pytest.fixture(autouse=True)
+    def shards(self, settings):
+        settings.DECISION_SHARDS = ["default", "shard_1"]
+        cache.clear()
+
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    @pytest.fixture
+    def users(self, django_user_model):
+        from authentication.models import UserTenant
+        from decisions.sharding import move_tenant_placement
+
+        move_tenant_placement("acme", "default")
+        move_tenant_placement("globex", "shard_1")
+        users = {}
+        for tenant in ("acme", "globex"):
+            user = django_user_model.objects.create_superuser(username=tenant, email=f"{tenant}@example.com", password="password")
+            UserTenant.objects.create(user=user, tenant=tenant)
+            users[tenant] = user
+        return users
+
+    def create(self, api_client, user, title, status="Completed"):
+        api_client.force_authenticate(user=user)
+        data = {"title": title, "description": "Description", "measurable_goal": "Goal", "status": status}
+        response = api_client.post(reverse("decision-list"), data, format="json")
+        assert response.status_code == 201
+        shard = "shard_1" if user.username == "globex" else "default"
+        return Decision.objects.using(shard).get(title=title).pk
+
+    def test_decisions_are_stored_on_the_shard_of_the_tenant(self, api_client, users):
+        """Test that decisions land on the shard of their tenant, with ids unique across shards."""
+        acme = self.create(api_client, users["acme"], "Acme")
+        globex = self.create(api_client, users["globex"], "Globex")
+
+        assert list(Decision.objects.using("default").values_list("id", "tenant")) == [(acme, "acme")]
+        assert list(Decision.objects.using("shard_1").values_list("id", "tenant")) == [(globex, "globex")]
+        assert acme != globex
+
+    def test_tenants_are_isolated(self, api_client, users):
+        """Test that every action only sees the decisions of the tenant of the user."""
+        acme = self.create(api_client, users["acme"], "Acme")
+        globex = self.create(api_client, users["globex"], "Globex")
+
+        api_client.force_authenticate(user=users["globex"])
+        response = api_client.get(reverse("decision-list"))
+        assert [item["title"] for item in response.json()["results"]] == ["Globex"]
+        assert response.json()["count"] == 1
+        assert api_client.get(reverse("decision-detail", args=[acme])).status_code == 404
+
+        url = reverse("decision-evaluate", args=[globex])
+        assert api_client.post(url, {"goal_met": True, "comments": "Done"}, format="json").status_code == 201
+        assert Evaluation.objects.using("shard_1").filter(decision_id=globex).exists()
+
+        # Reopening the decision resets its evaluation on the shard
+        data = {"title": "Globex", "description": "Description", "measurable_goal": "Goal", "status": "Pending"}
+        assert api_client.put(reverse("decision-detail", args=[globex]), data, format="json").status_code == 200
+        assert not Evaluation.objects.using("shard_1").exists()
+
+    def test_all_shards_listing_merges_shards(self, api_client, users, admin_user, settings):
+        """Test that administrators get the decisions of every shard in one ordered listing."""
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, "PAGE_SIZE": 2}
+        for title in ("A", "C", "E"):
+            self.create(api_client, users["acme"], title)
+        for title in ("B", "D"):
+            self.create(api_client, users["globex"], title)
+
+        api_client.force_authenticate(user=admin_user)
+        url = reverse("decision-all-shards")
+        first = api_client.get(url).json()
+        assert first["count"] == 5
+        assert [item["title"] for item in first["results"]] == ["A", "B"]
+        second = api_client.get(first["next"]).json()
+        assert [item["title"] for item in second["results"]] == ["C", "D"]
+        descending = api_client.get(url, {"ordering": "-title", "page": 3}).json()
+        assert [item["title"] for item in descending["results"]] == ["A"]
+        assert descending["next"] is None
+
+    def test_all_shards_listing_requires_admin(self, api_client, django_user_model):
+        """Test that the cross-shard listing is limited to administrators."""
+        user = django_user_model.objects.create_user(username="user", email="user@example.com", password="password")
+        api_client.force_authenticate(user=user)
+        assert api_client.get(reverse("decision-all-shards")).status_code == 403
+
+    def test_move_tenant(self, api_client, users):
+        """Test that moving a tenant copies its decisions to the target shard and removes them from the source."""
+        evaluated = self.create(api_client, users["acme"], "Evaluated")
+        api_client.post(reverse("decision-evaluate", args=[evaluated]), {"goal_met": True, "comments": "Done"}, format="json")
+        pending = self.create(api_client, users["acme"], "Pending", status="Pending")
+        deleted = self.create(api_client, users["acme"], "Deleted")
+        api_client.delete(reverse("decision-detail", args=[deleted]))
+        updated_at = Decision.objects.using("default").get(pk=evaluated).updated_at
+        api_client.force_authenticate(user=users["acme"])
+        since = api_client.get(reverse("decision-changes")).json()["next"]
+        Decision.objects.using("default").filter(pk=pending).update(intake_id="intake-1")
+
+        call_command("move_tenant", "acme", "shard_1", "--batch-size", "1", stdout=io.StringIO())
+
+        assert not Decision.objects.using("default").filter(tenant="acme").exists()
+        assert not DecisionTombstone.objects.using("default").filter(tenant="acme").exists()
+        moved = Decision.objects.using("shard_1").filter(tenant="acme")
+        assert set(moved.values_list("id", flat=True)) == {evaluated, pending}
+        assert moved.get(pk=evaluated).updated_at == updated_at
+        assert moved.get(pk=pending).intake_id == "intake-1"
+        assert Evaluation.objects.using("shard_1").filter(decision_id=evaluated).exists()
+        assert DecisionTombstone.objects.using("shard_1").filter(decision_id=deleted).exists()
+        assert DecisionStatusCount.objects.using("shard_1").get(tenant="acme", status="Completed").count == 1
+
+        api_client.force_authenticate(user=users["acme"])
+        response = api_client.get(reverse("decision-list"))
+        assert {item["id"] for item in response.json()["results"]} == {evaluated, pending}
+        # The copies are numbered after the token of the source, so the feed carries on
+        response = api_client.get(reverse("decision-changes"), {"since": since})
+        assert {change["id"] for change in response.json()["changes"]} == {evaluated, pending, deleted}
+
+
+@pytest.mark.django_db
+class TestIdempotency:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    @pytest.fixture
+    def decision_data(self):
+        return {"title": "Title", "description": "Description", "measurable_goal": "Goal", "status": "Completed"}
+
+    def create(self, api_client, data, key="key-1"):
+        return api_client.post(reverse("decision-list"), data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self, api_client, admin_user, decision_data):
+        """Test that a retried create gets the first response without creating the decision again."""
+        api_client.force_authenticate(user=admin_user)
+        first = self.create(api_client, decision_data)
+        assert first.status_code == status.HTTP_201_CREATED
+
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.create(api_client, decision_data)
+        assert retry.status_code == status.HTTP_201_CREATED
+        assert retry.json() == first.json()
+        assert retry["Idempotent-Replayed"] == "true"
+        assert Decision.objects.count() == 1
+        assert not any("decisions_decision" in query["sql"] for query in queries.captured_queries)
+
+    def test_keys_are_per_user(self, api_client, admin_user, django_user_model, decision_data):
+        """Test that the same key sent by two users creates two decisions."""
+        other = django_user_model.objects.create_user(username="user", email="user@example.com", password="password")
+        for user in (admin_user, other):
+            api_client.force_authenticate(user=user)
+            assert self.create(api_client, decision_data).status_code == status.HTTP_201_CREATED
+        assert Decision.objects.count() == 2
+
+    def test_key_reused_for_other_request(self, api_client, admin_user, decision_data):
+        """Test that a key sent again with a different body is rejected."""
+        api_client.force_authenticate(user=admin_user)
+        self.create(api_client, decision_data)
+        response = self.create(api_client, {**decision_data, "title": "Other"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert Decision.objects.count() == 1
+
+    def test_key_reused_with_other_query_string(self, api_client, admin_user):
+        """Test that a key sent again with different query parameters is rejected."""
+        api_client.force_authenticate(user=admin_user)
+        url = reverse("decision-export")
+        response = api_client.post(f"{url}?status=Completed", HTTP_IDEMPOTENCY_KEY="export")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        response = api_client.post(f"{url}?status=Pending", HTTP_IDEMPOTENCY_KEY="export")
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_key_released_on_server_error(self, api_client, admin_user, decision_data, monkeypatch):
+        """Test that a request failing with an uncaught exception releases its key, so a retry runs again."""
+        api_client.force_authenticate(user=admin_user)
+
+        def crash(self, serializer):
+            raise RuntimeError("Database unavailable")
+
+        with monkeypatch.context() as patched:
+            patched.setattr(views.DecisionViewSet, "perform_create", crash)
+            with pytest.raises(RuntimeError):
+                self.create(api_client, decision_data)
+        assert not IdempotencyKey.objects.exists()
+        assert self.create(api_client, decision_data).status_code == status.HTTP_201_CREATED
+
+    def test_errors_are_replayed(self, api_client, admin_user, decision_data):
+        """Test that a client error is stored and replayed like any other response."""
+        api_client.force_authenticate(user=admin_user)
+        decision = Decision.objects.create(**{**decision_data, "status": "Pending"})
+        url = reverse("decision-evaluate", args=[decision.pk])
+        data = {"goal_met": True, "comments": "Done"}
+        assert api_client.post(url, data, HTTP_IDEMPOTENCY_KEY="evaluate").status_code == status.HTTP_400_BAD_REQUEST
+
+        Decision.objects.filter(pk=decision.pk).update(status="Completed")
+        assert api_client.post(url, data, HTTP_IDEMPOTENCY_KEY="evaluate").status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.post(url, data, HTTP_IDEMPOTENCY_KEY="other").status_code == status.HTTP_201_CREATED
+
+    def test_concurrent_duplicate_waits(self, api_client, admin_user, decision_data, monkeypatch, settings):
+        """Test that a duplicate of a running request waits for its response instead of running."""
+        api_client.force_authenticate(user=admin_user)
+        first = self.create(api_client, decision_data)
+        # Pretend the first request is still running until the duplicate polls
+        stored = IdempotencyKey.objects.values("status_code", "body").get()
+        IdempotencyKey.objects.update(status_code=None, body=None)
+        monkeypatch.setattr(idempotency.time, "sleep", lambda seconds: IdempotencyKey.objects.update(**stored))
+
+        retry = self.create(api_client, decision_data)
+        assert retry.status_code == status.HTTP_201_CREATED
+        assert retry.json() == first.json()
+        assert Decision.objects.count() == 1
+
+    def test_running_duplicate_times_out(self, api_client, admin_user, decision_data, monkeypatch, settings):
+        """Test that a duplicate gets 409 when the first request doesn't finish in time."""
+        settings.IDEMPOTENCY_WAIT_TIMEOUT = 0
+        api_client.force_authenticate(user=admin_user)
+        self.create(api_client, decision_data)
+        IdempotencyKey.objects.update(status_code=None, body=None)
+        monkeypatch.setattr(idempotency.time, "sleep", lambda seconds: None)
+        assert self.create(api_client, decision_data).status_code == status.HTTP_409_CONFLICT
+
+    def test_stale_and_expired_keys_are_taken_over(self, api_client, admin_user, decision_data):
+        """Test that keys of crashed requests and expired keys run the request again."""
+        api_client.force_authenticate(user=admin_user)
+        self.create(api_client, decision_data)
+        IdempotencyKey.objects.update(status_code=None, body=None, created_at=timezone.now() - timedelta(hours=1))
+        assert self.create(api_client, decision_data).status_code == status.HTTP_201_CREATED
+        assert Decision.objects.count() == 2
+
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        assert self.create(api_client, decision_data).status_code == status.HTTP_201_CREATED
+        assert Decision.objects.count() == 3
+
+    def test_prune_expired_keys(self, api_client, admin_user, decision_data):
+        """Test that expired keys are deleted in bulk."""
+        api_client.force_authenticate(user=admin_user)
+        for key in ("a", "b", "c"):
+            self.create(api_client, decision_data, key)
+        IdempotencyKey.objects.exclude(key="c").update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command("prune_idempotency_keys", "--batch-size", "1", stdout=io.StringIO())
+        assert list(IdempotencyKey.objects.values_list("key", flat=True)) == ["c"]
+
+
+@pytest.mark.django_db
+class TestOptimisticConcurrency:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    @pytest.fixture
+    def decision(self):
+        return Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", status="Pending")
+
+    def update(self, api_client, decision, if_match=None, title="Updated"):
+        data = {"title": title, "description": "Description", "measurable_goal": "Goal", "status": "Pending"}
+        headers = {} if if_match is None else {"HTTP_IF_MATCH": if_match}
+        return api_client.put(reverse("decision-detail", args=[decision.pk]), data, **headers)
+
+    def test_retrieve_sends_etag(self, api_client, admin_user, decision):
+        """Test that a decision is sent with its version as ETag."""
+        api_client.force_authenticate(user=admin_user)
+        response = api_client.get(reverse("decision-detail", args=[decision.pk]))
+        assert response["ETag"] == '"1"'
+        assert response.json()["version"] == 1
+
+    def test_update_with_current_version(self, api_client, admin_user, decision):
+        """Test that an update with the current ETag is written and bumps the version."""
+        api_client.force_authenticate(user=admin_user)
+        response = self.update(api_client, decision, '"1"')
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"] == '"2"'
+        decision.refresh_from_db()
+        assert (decision.title, decision.version) == ("Updated", 2)
+
+        assert self.update(api_client, decision, 'W/"2"', "Again").status_code == status.HTTP_200_OK
+
+    def test_update_with_stale_version(self, api_client, admin_user, decision):
+        """Test that an update based on an old version is rejected without writing."""
+        api_client.force_authenticate(user=admin_user)
+        self.update(api_client, decision, '"1"')
+        response = self.update(api_client, decision, '"1"', "Lost update")
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+        decision.refresh_from_db()
+        assert (decision.title, decision.version) == ("Updated", 2)
+
+    def test_update_without_if_match(self, api_client, admin_user, decision, settings):
+        """Test that If-Match is only required when configured, and that every update bumps the version."""
+        api_client.force_authenticate(user=admin_user)
+        assert self.update(api_client, decision).status_code == status.HTTP_200_OK
+        assert self.update(api_client, decision, "*").status_code == status.HTTP_200_OK
+        decision.refresh_from_db()
+        assert decision.version == 3
+
+        settings.DECISION_REQUIRE_IF_MATCH = True
+        assert self.update(api_client, decision).status_code == status.HTTP_428_PRECONDITION_REQUIRED
+
+    def test_destroy_with_stale_version(self, api_client, admin_user, decision):
+        """Test that a delete based on an old version is rejected and one with the current version goes through."""
+        api_client.force_authenticate(user=admin_user)
+        url = reverse("decision-detail", args=[decision.pk])
+        Decision.objects.get(pk=decision.pk).save()
+
+        assert api_client.delete(url, HTTP_IF_MATCH='"1"').status_code == status.HTTP_412_PRECONDITION_FAILED
+        assert Decision.objects.filter(pk=decision.pk).exists()
+        assert api_client.delete(url, HTTP_IF_MATCH='"2"').status_code == status.HTTP_204_NO_CONTENT
+        assert not Decision.objects.filter(pk=decision.pk).exists()
+
+    def test_save_with_expected_version(self, decision):
+        """Test that saving a stale instance with its version raises instead of overwriting."""
+        stale = Decision.objects.get(pk=decision.pk)
+        decision.title = "First"
+        decision.save(expected_version=1)
+        stale.title = "Second"
+        with pytest.raises(StaleVersion):
+            stale.save(expected_version=1)
+        assert Decision.objects.get(pk=decision.pk).title == "First"
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAutocomplete:
+    @pytest.fixture(autouse=True)
+    def clear_indexes(self):
+        autocomplete.clear_indexes()
+        yield
+        autocomplete.clear_indexes()
+
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def decisions(self):
+        titles = ["Budget review", "budget cuts", "Build pipeline", "Hire a designer", "Budgeting tool"]
+        return [Decision.objects.create(title=title, description="Description", measurable_goal="Goal") for title in titles]
+
+    def suggest(self, api_client, q, **params):
+        response = api_client.get(reverse("decision-autocomplete"), {"q": q, **params})
+        assert response.status_code == status.HTTP_200_OK
+        return [suggestion["title"] for suggestion in response.json()]
+
+    def test_prefix_suggestions(self, api_client, decisions):
+        """Test that titles starting with the query are suggested case-insensitively, in order and up to the limit."""
+        assert self.suggest(api_client, "bud") == ["budget cuts", "Budget review", "Budgeting tool"]
+        assert self.suggest(api_client, "BU", limit=2) == ["budget cuts", "Budget review"]
+        assert self.suggest(api_client, "hire  a") == ["Hire a designer"]
+        assert self.suggest(api_client, "zzz") == []
+
+    def test_suggestions_come_from_the_index(self, api_client, decisions):
+        """Test that once loaded, suggestions don't query the decisions."""
+        self.suggest(api_client, "bud")
+        with CaptureQueriesContext(connection) as queries:
+            assert self.suggest(api_client, "build") == ["Build pipeline"]
+        assert not any("decisions_decision" in query["sql"] for query in queries.captured_queries)
+
+    def test_index_follows_writes(self, api_client, decisions, django_capture_on_commit_callbacks):
+        """Test that created, renamed and deleted decisions are reflected in the suggestions."""
+        self.suggest(api_client, "bud")
+        with django_capture_on_commit_callbacks(execute=True):
+            Decision.objects.create(title="Budget freeze", description="Description", measurable_goal="Goal")
+            renamed = Decision.objects.get(title="budget cuts")
+            renamed.title = "Spending cuts"
+            renamed.save()
+            decisions[0].delete()
+        assert self.suggest(api_client, "bud") == ["Budget freeze", "Budgeting tool"]
+        assert self.suggest(api_client, "spend") == ["Spending cuts"]
+
+    def test_index_is_reloaded(self, api_client, decisions, settings):
+        """Test that writes of other processes show up once the index is reloaded."""
+        settings.AUTOCOMPLETE_INDEX_TTL = 0
+        self.suggest(api_client, "bud")
+        Decision.objects.filter(title="Build pipeline").update(title="Budget pipeline")
+        self.suggest(api_client, "bud")
+        autocomplete.prefix_index("default", "default", load=False).wait()
+        assert "Budget pipeline" in self.suggest(api_client, "bud")
+
+    def test_stale_index_is_served_while_reloading(self, api_client, decisions, settings, monkeypatch):
+        """Test that lookups of a stale index don't wait for its reload, which runs once at a time."""
+        settings.AUTOCOMPLETE_INDEX_TTL = 0
+        self.suggest(api_client, "bud")
+        loads, release = [], threading.Event()
+        load = autocomplete.PrefixIndex.load
+
+        def blocked_load(index):
+            loads.append(index.tenant)
+            release.wait(5)
+            load(index)
+
+        monkeypatch.setattr(autocomplete.PrefixIndex, "load", blocked_load)
+        Decision.objects.filter(title="Build pipeline").update(title="Budget pipeline")
+        for _ in range(3):
+            assert "Budget pipeline" not in self.suggest(api_client, "bud")
+        assert loads == ["default"]
+
+        # Created while the reload runs, kept once it is done
+        Decision.objects.create(title="Budget freeze", description="Description", measurable_goal="Goal")
+        release.set()
+        autocomplete.prefix_index("default", "default", load=False).wait()
+        assert {"Budget freeze", "Budget pipeline"} <= set(self.suggest(api_client, "budget"))
+
+    def test_query_is_required(self, api_client):
+        """Test that an empty query is rejected."""
+        response = api_client.get(reverse("decision-autocomplete"), {"q": " "})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestEvaluationSummary:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    @pytest.fixture
+    def decisions(self, api_client, admin_user):
+        api_client.force_authenticate(user=admin_user)
+        decisions = [
+            Decision.objects.create(title=f"Decision {i}", description="Description", measurable_goal="Goal", status="Completed")
+            for i in range(4)
+        ]
+        for decision, goal_met in zip(decisions, (True, False)):
+            response = api_client.post(reverse("decision-evaluate", args=[decision.pk]), {"goal_met": goal_met, "comments": "Done"})
+            assert response.status_code == status.HTTP_201_CREATED
+        return decisions
+
+    def titles(self, api_client, **params):
+        response = api_client.get(reverse("decision-list"), params)
+        assert response.status_code == status.HTTP_200_OK
+        return [decision["title"] for decision in response.json()["results"]]
+
+    def test_evaluate_sets_summary(self, api_client, decisions):
+        """Test that evaluating a decision copies the outcome onto the decision."""
+        response = api_client.get(reverse("decision-detail", args=[decisions[0].pk]))
+        assert response.json()["is_evaluated"] is True
+        assert response.json()["goal_met"] is True
+        assert Decision.objects.get(pk=decisions[2].pk).goal_met is None
+
+    def test_filters(self, api_client, decisions):
+        """Test that decisions can be filtered by evaluated and goal met without a join."""
+        assert self.titles(api_client, evaluated="true") == ["Decision 0", "Decision 1"]
+        assert self.titles(api_client, evaluated="false") == ["Decision 2", "Decision 3"]
+        assert self.titles(api_client, goal_met="false") == ["Decision 1"]
+        assert self.titles(api_client, evaluated="true", ordering="goal_met") == ["Decision 1", "Decision 0"]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.titles(api_client, goal_met="true", status="Completed")
+        page_query = [query["sql"] for query in queries.captured_queries if "goal_met" in query["sql"]][-1]
+        assert "JOIN" not in page_query.split("WHERE")[1]
+
+    def test_invalid_filter_values(self, api_client, decisions):
+        """Test that unknown filter values are rejected."""
+        assert api_client.get(reverse("decision-list"), {"status": "Unknown"}).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_reset_clears_summary(self, api_client, decisions):
+        """Test that the evaluation reset of an update clears the summary."""
+        data = {"title": "Decision 0", "description": "Description", "measurable_goal": "New goal", "status": "Completed"}
+        response = api_client.put(reverse("decision-detail", args=[decisions[0].pk]), data)
+        assert response.json()["is_evaluated"] is False
+        assert response.json()["goal_met"] is None
+        assert self.titles(api_client, evaluated="true") == ["Decision 1"]
+
+    def test_evaluation_delete_clears_summary(self, decisions):
+        """Test that deleting an evaluation clears the summary of its decision."""
+        Evaluation.objects.get(decision=decisions[1]).delete()
+        decision = Decision.objects.get(pk=decisions[1].pk)
+        assert (decision.is_evaluated, decision.goal_met) == (False, None)
+
+    def test_sync_command(self, decisions):
+        """Test that the summary can be recomputed from the evaluations."""
+        Decision.objects.update(is_evaluated=False, goal_met=None)
+        call_command("sync_evaluation_summary", stdout=io.StringIO())
+        assert dict(Decision.objects.filter(is_evaluated=True).values_list("title", "goal_met")) == {
+            "Decision 0": True, "Decision 1": False,
+        }
+
+
+@pytest.mark.django_db
+class TestDateRangeFilters:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def now(self):
+        return timezone.now().replace(microsecond=0)
+
+    @pytest.fixture
+    def decisions(self, now):
+        for days in (100, 40, 10, 1):
+            decision = Decision.objects.create(title=f"{days} days", description="Description", measurable_goal="Goal", status="Completed")
+            Decision.objects.filter(pk=decision.pk).update(created_at=now - timedelta(days=days), updated_at=now - timedelta(days=days // 2))
+            if days < 50:
+                evaluation = Evaluation.objects.create(decision=decision, goal_met=True)
+                evaluation.evaluated_at = now - timedelta(days=days // 2)
+                evaluation.save()
+
+    def titles(self, api_client, **params):
+        response = api_client.get(reverse("decision-list"), {**params, "ordering": "title"})
+        assert response.status_code == status.HTTP_200_OK
+        return sorted(decision["title"] for decision in response.json()["results"])
+
+    def test_ranges(self, api_client, decisions, now):
+        """Test that after bounds are inclusive and before bounds exclusive, for every date."""
+        assert self.titles(api_client, created_after=(now - timedelta(days=40)).isoformat()) == ["1 days", "10 days", "40 days"]
+        assert self.titles(api_client, created_before=(now - timedelta(days=40)).isoformat()) == ["100 days"]
+        assert self.titles(
+            api_client, created_after=(now - timedelta(days=50)).isoformat(), created_before=(now - timedelta(days=5)).isoformat(),
+        ) == ["10 days", "40 days"]
+        assert self.titles(api_client, updated_after=(now - timedelta(days=20)).isoformat()) == ["1 days", "10 days", "40 days"]
+        assert self.titles(api_client, evaluated_before=(now - timedelta(days=1)).isoformat()) == ["10 days", "40 days"]
+        assert self.titles(api_client, evaluated_after=(now - timedelta(days=1)).date().isoformat(), evaluated="true") == ["1 days"]
+
+    def test_invalid_date(self, api_client, decisions):
+        """Test that a malformed date is rejected."""
+        response = api_client.get(reverse("decision-list"), {"created_after": "last quarter"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_export_takes_the_filters(self, api_client, decisions, now, django_user_model, settings, tmp_path):
+        """Test that an export only contains the decisions matching the list filters."""
+        settings.JOB_OUTPUT_DIR = tmp_path
+        api_client.force_authenticate(user=django_user_model.objects.create_user(username="user", password="password"))
+        url = reverse("decision-export")
+        assert api_client.post(url + "?created_before=soon").status_code == status.HTTP_400_BAD_REQUEST
+
+        response = api_client.post(url + "?" + urlencode({"created_after": (now - timedelta(days=15)).isoformat()}))
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        call_command("run_workers", "--once", stdout=io.StringIO())
+        job = api_client.get(response["Location"]).json()
+        assert job["result"]["count"] == 2
+
+    def test_created_at_is_indexed(self, decisions, now):
+        """Test that a created_at range is answered from an index, not a table scan."""
+        plan = Decision.objects.filter(tenant="default", created_at__gte=now - timedelta(days=5)).explain()
+        assert "decision_tenant_created_idx" in plan
+
+
+@pytest.mark.django_db
+class TestWriteBehindIntake:
+    @pytest.fixture(autouse=True)
+    def queue(self, monkeypatch, settings, tmp_path):
+        settings.DECISION_INTAKE_DEAD_LETTER_FILE = tmp_path / "dead_letters.jsonl"
+        queue = intake.WriteBehindQueue(start_thread=False)
+        monkeypatch.setattr(views, "decision_intake", queue)
+        return queue
+
+    @pytest.fixture
+    def api_client(self, django_user_model):
+        client = APIClient()
+        client.force_authenticate(user=django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password"))
+        return client
+
+    def create(self, api_client, title="Title", prefer="respond-async"):
+        data = {"title": title, "description": "Description", "measurable_goal": "Goal", "status": "Pending"}
+        return api_client.post(reverse("decision-list"), data, HTTP_PREFER=prefer)
+
+    def test_async_create_is_written_on_flush(self, api_client, queue):
+        """Test that an async create returns 202 and the decision and counters are written by the flush."""
+        DecisionStatusCount.rebuild("default")
+        response = self.create(api_client)
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response["Preference-Applied"] == "respond-async"
+        assert response["Location"] == response.json()["url"]
+        assert not Decision.objects.exists()
+
+        assert queue.flush() == 1
+        decision = Decision.objects.get()
+        assert (decision.title, decision.intake_id) == ("Title", response.json()["intake_id"])
+        assert DecisionStatusCount.objects.get(status="Pending").count == 1
+
+    def test_batches_many_creates(self, api_client, queue, settings):
+        """Test that queued creates are inserted with one statement per batch."""
+        settings.DECISION_INTAKE_BATCH_SIZE = 10
+        for i in range(25):
+            self.create(api_client, f"Decision {i}")
+        with CaptureQueriesContext(connection) as queries:
+            assert queue.flush() == 25
+        assert len([query for query in queries if query["sql"].startswith('INSERT INTO "decisions_decision" ')]) == 3
+        assert Decision.objects.count() == 25
+
+    def test_intake_status(self, api_client, queue):
+        """Test that the intake is pending until flushed, then points to the decision."""
+        url = self.create(api_client).json()["url"]
+        assert api_client.get(url).json()["status"] == "pending"
+        queue.flush()
+        data = api_client.get(url).json()
+        assert data["status"] == "created"
+        assert data["id"] == Decision.objects.get().pk
+        assert api_client.get(reverse("decision-intake", args=["0" * 32])).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_invalid_create_is_rejected_synchronously(self, api_client, queue):
+        """Test that validation errors are returned right away, nothing is queued."""
+        response = api_client.post(reverse("decision-list"), {"title": "Title"}, HTTP_PREFER="respond-async")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert queue.flush() == 0
+
+    def test_without_prefer_creates_synchronously(self, api_client, settings):
+        """Test that creates are synchronous without the preference or when intake is disabled."""
+        assert self.create(api_client, prefer="").status_code == status.HTTP_201_CREATED
+        settings.DECISION_INTAKE_ENABLED = False
+        assert self.create(api_client).status_code == status.HTTP_201_CREATED
+        assert Decision.objects.count() == 2
+
+    def test_full_queue_creates_synchronously(self, api_client, monkeypatch, settings):
+        """Test that a create is made synchronously when the queue is full."""
+        settings.DECISION_INTAKE_QUEUE_SIZE = 1
+        monkeypatch.setattr(views, "decision_intake", intake.WriteBehindQueue(start_thread=False))
+        assert self.create(api_client).status_code == status.HTTP_202_ACCEPTED
+        assert self.create(api_client).status_code == status.HTTP_201_CREATED
+
+    def test_failed_decisions_go_to_dead_letters(self, api_client, queue, settings):
+        """Test that a failing batch is retried one by one and the failures are kept for replay."""
+        Decision.objects.create(title="Existing", description="Description", measurable_goal="Goal", intake_id="a" * 32)
+        data = {"title": "Title", "description": "Description", "measurable_goal": "Goal"}
+        created = queue.write([intake.Intake("a" * 32, "default", data), intake.Intake("b" * 32, "default", data)])
+        assert created == 1
+        assert Decision.objects.filter(intake_id="b" * 32).exists()
+
+        records = [json.loads(line) for line in settings.DECISION_INTAKE_DEAD_LETTER_FILE.read_text().splitlines()]
+        assert [record["intake_id"] for record in records] == ["a" * 32]
+        Decision.objects.filter(intake_id="a" * 32).delete()
+        response = api_client.get(reverse("decision-intake", args=["a" * 32])).json()
+        assert response["status"] == "failed"
+        assert "UNIQUE" in response["error"].upper()
+
+    def test_failure_dead_letters_only_its_tenant(self, queue, settings, monkeypatch):
+        """Test that an error writing the decisions of one tenant keeps the other tenants' decisions and replays without duplicates."""
+        data = {"title": "Title", "description": "Description", "measurable_goal": "Goal"}
+        write_tenant = intake.WriteBehindQueue._write_tenant
+
+        def fail_after_insert(self, tenant, intakes):
+            created = write_tenant(self, tenant, intakes)
+            if tenant == "beta":
+                raise RuntimeError("Cache unavailable")
+            return created
+
+        monkeypatch.setattr(intake.WriteBehindQueue, "_write_tenant", fail_after_insert)
+        queue.write([intake.Intake("a" * 32, "alpha", data), intake.Intake("b" * 32, "beta", data)])
+        records = [json.loads(line) for line in settings.DECISION_INTAKE_DEAD_LETTER_FILE.read_text().splitlines()]
+        assert [record["intake_id"] for record in records] == ["b" * 32]
+
+        monkeypatch.undo()
+        call_command("replay_decision_intake", stdout=io.StringIO())
+        assert Decision.objects.filter(intake_id__in=["a" * 32, "b" * 32]).count() == 2
+
+    def test_replay_dead_letters(self, queue, settings):
+        """Test that replaying inserts the dead letters and keeps those failing again."""
+        data = {"title": "Title", "description": "Description", "measurable_goal": "Goal"}
+        queue.dead_letter(intake.Intake("c" * 32, "default", data), "database was down")
+        call_command("replay_decision_intake")
+        assert Decision.objects.filter(intake_id="c" * 32).exists()
+        assert not settings.DECISION_INTAKE_DEAD_LETTER_FILE.exists()
+
+
+@pytest.mark.django_db
+class TestDecisionAdmin:
+    @pytest.fixture
+    def admin_client(self, client, django_user_model):
+        client.force_login(django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password"))
+        return client
+
+    def create(self, count, status="Pending", evaluated=False):
+        decisions = [
+            Decision.objects.create(title=f"Decision {i}", description="Description", measurable_goal="Goal", status=status)
+            for i in range(count)
+        ]
+        if evaluated:
+            for decision in decisions:
+                Evaluation.objects.create(decision=decision, goal_met=True, comments="Comments")
+        return decisions
+
+    def action(self, admin_client, name, decisions):
+        return admin_client.post(
+            reverse("admin:decisions_decision_changelist"),
+            {"action": name, "_selected_action": [decision.pk for decision in decisions]},
+        )
+
+    def test_changelist_queries_dont_grow_with_rows(self, admin_client):
+        """Test that the changelist loads evaluations with the decisions."""
+        self.create(3, "Completed", evaluated=True)
+        url = reverse("admin:decisions_decision_changelist")
+        with CaptureQueriesContext(connection) as few:
+            assert admin_client.get(url).status_code == status.HTTP_200_OK
+        self.create(20, "Completed", evaluated=True)
+        with CaptureQueriesContext(connection) as many:
+            response = admin_client.get(url)
+        assert "Comments" in response.content.decode()
+        assert len(many) == len(few)
+
+    def test_changelist_filters(self, admin_client):
+        """Test that the changelist filters by tenant from the counters and by evaluation."""
+        self.create(2)
+        self.create(1, "Completed", evaluated=True)
+        DecisionStatusCount.rebuild("default")
+        url = reverse("admin:decisions_decision_changelist")
+        response = admin_client.get(url, {"tenant": "default", "is_evaluated__exact": "1"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.context["cl"].result_count == 1
+
+    def test_mark_completed(self, admin_client):
+        """Test that marking decisions completed is one update which keeps the counters in sync."""
+        decisions = self.create(5)
+        DecisionStatusCount.rebuild("default")
+        with CaptureQueriesContext(connection) as queries:
+            self.action(admin_client, "mark_completed", decisions[:4])
+        assert len([query for query in queries if query["sql"].startswith('UPDATE "decisions_decision"')]) == 1
+        assert Decision.objects.filter(status="Completed", version=2).count() == 4
+        assert DecisionStatusCount.get_counts("default") == {"Pending": 1, "Completed": 4}
+
+    def test_reset_evaluation(self, admin_client):
+        """Test that resetting evaluations deletes them and clears their copies on the decisions."""
+        decisions = self.create(3, "Completed", evaluated=True)
+        self.action(admin_client, "reset_evaluation", decisions[:2])
+        assert Evaluation.objects.count() == 1
+        assert Decision.objects.filter(is_evaluated=False, goal_met=None, evaluated_at=None).count() == 2
+        assert Decision.objects.get(pk=decisions[2].pk).is_evaluated
+
+
+@pytest.mark.django_db
+class TestDecisionAnalytics:
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        cache.clear()
+
+    @pytest.fixture
+    def api_client(self, django_user_model):
+        client = APIClient()
+        client.force_authenticate(user=django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password"))
+        return client
+
+    def decision(self, created_at, status="Pending", evaluated_after=None, goal_met=True):
+        decision = Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", status=status)
+        Decision.objects.filter(pk=decision.pk).update(created_at=created_at)
+        if evaluated_after is not None:
+            evaluation = Evaluation.objects.create(decision=decision, goal_met=goal_met)
+            evaluated_at = created_at + evaluated_after
+            Evaluation.objects.filter(pk=evaluation.pk).update(evaluated_at=evaluated_at)
+            Decision.objects.filter(pk=decision.pk).update(evaluated_at=evaluated_at)
+        return decision
+
+    def analytics(self, api_client, **params):
+        response = api_client.get(reverse("decision-analytics"), params)
+        assert response.status_code == status.HTTP_200_OK, response.content
+        return {bucket["start"]: bucket for bucket in response.json()["buckets"]}
+
+    def test_weekly_buckets(self, api_client):
+        """Test that decisions are counted in the weeks they were created and evaluated in, from Monday."""
+        monday = datetime(2024, 7, 1, 9, tzinfo=dt_timezone.utc)
+        self.decision(monday, "Completed", evaluated_after=timedelta(hours=10), goal_met=True)
+        self.decision(monday + timedelta(days=6), "Completed", evaluated_after=timedelta(days=2), goal_met=False)
+        self.decision(monday + timedelta(days=1))
+        buckets = self.analytics(api_client, since="2024-07-01", until="2024-07-14")
+
+        assert list(buckets) == ["2024-07-01", "2024-07-08"]
+        first, second = buckets["2024-07-01"], buckets["2024-07-08"]
+        assert first["created"] == 3
+        assert first["created_by_status"] == {"Pending": 1, "Completed": 2}
+        assert (first["evaluated"], first["goal_met_rate"]) == (1, 1.0)
+        assert first["evaluation_lag_hours"]["p50"] == pytest.approx(10)
+        assert (second["created"], second["evaluated"], second["goal_met_rate"]) == (0, 1, 0.0)
+        assert second["evaluation_lag_hours"]["p99"] == pytest.approx(48)
+
+    def test_monthly_buckets_include_archive(self, api_client):
+        """Test that months are calendar months and archived decisions are counted."""
+        self.decision(datetime(2024, 1, 31, 23, tzinfo=dt_timezone.utc), "Completed", evaluated_after=timedelta(hours=2))
+        self.decision(datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+        call_command("archive_decisions", older_than=0)
+        assert ArchivedDecision.objects.count() == 1
+        buckets = self.analytics(api_client, bucket="month", since="2024-01-15", until="2024-03-01")
+        assert list(buckets) == ["2024-01-01", "2024-02-01", "2024-03-01"]
+        assert buckets["2024-01-01"]["created"] == 1
+        assert buckets["2024-02-01"]["evaluated"] == 1
+        assert buckets["2024-02-01"]["created"] == 1
+        assert buckets["2024-03-01"]["evaluation_lag_hours"] is None
+
+    def test_completed_throughput(self, api_client):
+        """Test that decisions are counted as completed in the bucket they were completed in."""
+        decision = self.decision(timezone.now() - timedelta(days=60))
+        decision.status = "Completed"
+        decision.save()
+        assert decision.completed_at is not None
+        buckets = list(self.analytics(api_client).values())
+        assert len(buckets) == 12
+        assert buckets[-1]["completed"] == 1
+
+    def test_writes_only_invalidate_touched_buckets(self, api_client):
+        """Test that cached buckets are served without a query until a write touches them."""
+        old = datetime(2024, 7, 1, tzinfo=dt_timezone.utc)
+        self.decision(old)
+        params = {"since": "2024-07-01", "until": "2024-07-14"}
+        self.analytics(api_client, **params)
+        with CaptureQueriesContext(connection) as queries:
+            self.analytics(api_client, **params)
+        assert not [query for query in queries if "decisions_decision" in query["sql"]]
+
+        # A write elsewhere keeps these buckets, one in the first week drops it
+        Decision.objects.create(title="Now", description="Description", measurable_goal="Goal")
+        assert self.analytics(api_client, **params)["2024-07-01"]["created"] == 1
+        Decision.objects.get(title="Title").delete()
+        assert self.analytics(api_client, **params)["2024-07-01"]["created"] == 0
+
+    def test_invalid_parameters(self, api_client):
+        """Test that unknown buckets, bad dates and too long ranges are rejected."""
+        url = reverse("decision-analytics")
+        assert api_client.get(url, {"bucket": "day"}).status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get(url, {"since": "July"}).status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get(url, {"since": "2024-07-02", "until": "2024-07-01"}).status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get(url, {"since": "1990-01-01"}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestDecisionHistory:
+    @pytest.fixture
+    def api_client(self, django_user_model):
+        client = APIClient()
+        client.force_authenticate(user=django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password"))
+        return client
+
+    def history(self, api_client, pk, **params):
+        return api_client.get(reverse("decision-history", args=[pk]), params)
+
+    def lifecycle(self):
+        """Create, update, evaluate, reset and delete a decision, one day apart from 2024-07-01"""
+        decision = Decision.objects.create(title="Title", description="Description", measurable_goal="Goal")
+        decision = Decision.objects.get(pk=decision.pk)
+        decision.title = "Renamed"
+        decision.save()
+        decision.status = "Completed"
+        decision.save()
+        Evaluation.objects.create(decision=decision, goal_met=True, comments="Comments")
+        Evaluation.objects.get(decision=decision).delete()
+        Decision.objects.get(pk=decision.pk).delete()
+        entries = list(DecisionHistory.objects.filter(decision_id=decision.pk).order_by("id"))
+        for day, entry in enumerate(entries, 1):
+            DecisionHistory.objects.filter(pk=entry.pk).update(recorded_at=datetime(2024, 7, day, 12, tzinfo=dt_timezone.utc))
+        return decision.pk, entries
+
+    def test_records_only_written_fields(self):
+        """Test that every write appends one entry with the fields it changed."""
+        pk, entries = self.lifecycle()
+        assert [entry.kind for entry in entries] == [
+            DecisionHistory.CREATED, DecisionHistory.UPDATED, DecisionHistory.UPDATED,
+            DecisionHistory.EVALUATED, DecisionHistory.EVALUATION_RESET, DecisionHistory.DELETED,
+        ]
+        assert entries[1].changes == {"title": "Renamed"}
+        assert set(entries[2].changes) == {"status", "completed_at"}
+
+    def test_state_at_points_in_time(self, api_client):
+        """Test that the state is rebuilt as of each step, deleted decisions included."""
+        pk, _ = self.lifecycle()
+        assert self.history(api_client, pk, as_of="2024-06-30").status_code == status.HTTP_404_NOT_FOUND
+
+        first = self.history(api_client, pk, as_of="2024-07-01").json()
+        assert (first["state"]["title"], first["state"]["status"], first["state"]["evaluation"]) == ("Title", "Pending", None)
+        assert [entry["kind"] for entry in first["entries"]] == ["created"]
+
+        evaluated = self.history(api_client, pk, as_of="2024-07-04T13:00:00Z").json()["state"]
+        assert (evaluated["title"], evaluated["status"]) == ("Renamed", "Completed")
+        assert evaluated["evaluation"]["goal_met"] is True
+        assert self.history(api_client, pk, as_of="2024-07-05").json()["state"]["evaluation"] is None
+
+        deleted = self.history(api_client, pk, limit=2).json()
+        assert (deleted["state"], deleted["deleted"]) == (None, True)
+        assert [entry["kind"] for entry in deleted["entries"]] == ["deleted", "evaluation_reset"]
+
+    def test_snapshots_bound_the_replayed_entries(self, api_client, settings):
+        """Test that reads start from the latest snapshot once the history is compacted."""
+        settings.DECISION_HISTORY_SNAPSHOT_INTERVAL = 2
+        decision = Decision.objects.create(title="Title 0", description="Description", measurable_goal="Goal")
+        for i in range(1, 6):
+            decision.title = f"Title {i}"
+            decision.save()
+        call_command("compact_decision_history", stdout=io.StringIO())
+        assert DecisionSnapshot.objects.filter(decision_id=decision.pk).count() == 3
+        # Compacting again writes nothing new
+        call_command("compact_decision_history", stdout=io.StringIO())
+        assert DecisionSnapshot.objects.filter(decision_id=decision.pk).count() == 3
+        # Only decisions written since the last run are looked at
+        assert list(history.needing_snapshots(2, after=HistoryCompaction.objects.get().last_entry_id)) == []
+        decision.title = "Title 6"
+        decision.save()
+        decision.title = "Title 7"
+        decision.save()
+        call_command("compact_decision_history", stdout=io.StringIO())
+        assert DecisionSnapshot.objects.filter(decision_id=decision.pk).count() == 4
+
+        # Entries folded into a snapshot are no longer read
+        latest = DecisionSnapshot.objects.filter(decision_id=decision.pk).order_by("-last_entry_id").first()
+        DecisionHistory.objects.filter(decision_id=decision.pk, id__lte=latest.last_entry_id).update(changes={"title": "Stale"})
+        assert self.history(api_client, decision.pk).json()["state"]["title"] == "Title 7"
+
+    def test_other_tenants_history_is_not_found(self, api_client):
+        """Test that a decision's history is only readable by its tenant."""
+        decision = Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", tenant="acme")
+        assert DecisionHistory.objects.filter(decision_id=decision.pk).exists()
+        assert self.history(api_client, decision.pk).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_invalid_parameters(self, api_client):
+        """Test that bad as_of and limit values are rejected."""
+        decision = Decision.objects.create(title="Title", description="Description", measurable_goal="Goal")
+        assert self.history(api_client, decision.pk, as_of="July").status_code == status.HTTP_400_BAD_REQUEST
+        assert self.history(api_client, decision.pk, limit="all").status_code == status.HTTP_400_BAD_REQUEST
+        assert self.history(api_client, "abc").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_bulk_writes_are_recorded(self, client, django_user_model):
+        """Test that write-behind creates and admin actions append their entries too."""
+        queue = intake.WriteBehindQueue(start_thread=False)
+        queue.submit("default", {"title": "Queued", "description": "Description", "measurable_goal": "Goal", "status": "Pending"})
+        queue.flush()
+        decision = Decision.objects.get(title="Queued")
+        assert DecisionHistory.objects.get(decision_id=decision.pk).kind == DecisionHistory.CREATED
+
+        client.force_login(django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password"))
+        client.post(reverse("admin:decisions_decision_changelist"), {"action": "mark_completed", "_selected_action": [decision.pk]})
+        entry = DecisionHistory.objects.filter(decision_id=decision.pk).latest("id")
+        assert (entry.kind, entry.changes["status"]) == (DecisionHistory.UPDATED, "Completed")
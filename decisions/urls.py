@@ -1,8 +1,19 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
+from rest_framework.routers import DefaultRouter, Route
 from .views import DecisionViewSet
 
-router = DefaultRouter(trailing_slash=False)
+
+class DecisionRouter(DefaultRouter):
+    """Also routes `DELETE` on the list to `bulk_destroy`, for viewsets which have it"""
+
+    routes = [
+        route._replace(mapping={**route.mapping, 'delete': 'bulk_destroy'})
+        if isinstance(route, Route) and route.name == '{basename}-list' else route
+        for route in DefaultRouter.routes
+    ]
+
+
+router = DecisionRouter(trailing_slash=False)
 router.register(r'decisions', DecisionViewSet, basename='decision')
 
 urlpatterns = [
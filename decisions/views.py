@@ -1,75 +1,297 @@
+import heapq
+from datetime import datetime, time
+from functools import cmp_to_key
+
+from django.conf import settings
+from django.core.validators import EMPTY_VALUES
+from django.db import transaction
+from django.db.models import F, Max
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import viewsets, status, filters
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAdminUser
-from decisions.models import Decision, Evaluation
-from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.reverse import reverse
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from decisions import analytics, history
+from decisions.archive import delete_archived, hydrate, restore, with_archive
+from decisions.autocomplete import suggest
+from decisions.idempotency import IdempotencyMixin
+from decisions.intake import CREATED, FAILED, PENDING, decision_intake
+from decisions.filters import DecisionFilter
+from decisions.changes import InvalidToken, TokenExpired, read_changes, serialize_change
+from decisions.models import ArchivedDecision, Decision, DecisionHistory, Evaluation, StaleVersion
+from decisions.pagination import DecisionPagination
+from decisions.sharding import current_shard, current_tenant, get_tenant, shard_for_tenant, tenant_for_user, use_shard
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.exceptions import APIException, MethodNotAllowed
 from decisions.serializers import DecisionSerializer, DecisionCreateUpdateSerializer, EvaluationCreateSerializer
-from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.utils import no_body, swagger_auto_schema
 from drf_yasg import openapi
+from enterpriseApi.metrics import EVALUATION_RESETS
+from enterpriseApi.streaming import StreamingJSONPageResponse
+from jobs.registry import enqueue
+from jobs.serializers import JobSerializer
+from jobs.views import job_accepted
+
+INCLUDE_ARCHIVED = openapi.Parameter(
+    'include_archived', openapi.IN_QUERY, description="Include archived decisions", type=openapi.TYPE_BOOLEAN
+)
+IDEMPOTENCY_KEY = openapi.Parameter(
+    'Idempotency-Key', openapi.IN_HEADER, description="Retries with the same key get the first response", type=openapi.TYPE_STRING
+)
+
+PREFER = openapi.Parameter(
+    'Prefer', openapi.IN_HEADER, description="respond-async to get 202 right away, the decision is inserted shortly after",
+    type=openapi.TYPE_STRING
+)
+
+IF_MATCH = openapi.Parameter(
+    'If-Match', openapi.IN_HEADER, description="ETag of the decision as last read, the write fails with 412 if it changed since",
+    type=openapi.TYPE_STRING
+)
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The decision was changed since it was read, fetch it again.'
+    default_code = 'precondition_failed'
+
+
+class PreconditionRequired(APIException):
+    status_code = status.HTTP_428_PRECONDITION_REQUIRED
+    default_detail = 'Send the ETag of the decision in the If-Match header.'
+    default_code = 'precondition_required'
+
 
-class DecisionViewSet(viewsets.ModelViewSet):
+def etag(version):
+    return f'"{version}"'
+
+
+class DecisionViewSet(IdempotencyMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing decisions.
+
+    POST actions are idempotent when sent with an `Idempotency-Key` header.
     """
 
     queryset = Decision.objects.all()
     serializer_class = DecisionSerializer
+    pagination_class = DecisionPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['status']
+    filterset_class = DecisionFilter
     search_fields = ['title', 'measurable_goal']
-    ordering_fields = ['title', 'status']
+    ordering_fields = ['title', 'status', 'is_evaluated', 'goal_met']
     ordering = ['title']
 
+    CHANGES_LIMIT = 100
+    CHANGES_MAX_LIMIT = 1000
+    AUTOCOMPLETE_LIMIT = 10
+    AUTOCOMPLETE_MAX_LIMIT = 50
+    ANALYTICS_MAX_BUCKETS = 260
+    HISTORY_LIMIT = 20
+    HISTORY_MAX_LIMIT = 100
+
     COMMON_RESPONSES = {
         401: openapi.Response(description="Unauthorized"),
         403: openapi.Response(description="Forbidden"),
         500: openapi.Response(description="Internal Server Error"),
     }
 
+    def initial(self, request, *args, **kwargs):
+        """Scope the request to the tenant of the user, on the shard holding it"""
+        super().initial(request, *args, **kwargs)
+        tenant = tenant_for_user(request.user)
+        self._tenant_tokens = (current_tenant.set(tenant), current_shard.set(shard_for_tenant(tenant)))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        tokens = getattr(self, '_tenant_tokens', None)
+        if tokens is not None:
+            current_tenant.reset(tokens[0])
+            current_shard.reset(tokens[1])
+            self._tenant_tokens = None
+        return response
+
+    def get_queryset(self):
+        return Decision.objects.filter(tenant=get_tenant()).select_related('evaluation')
+
+    def get_archived_queryset(self):
+        return ArchivedDecision.objects.filter(tenant=get_tenant()).select_related('evaluation')
+
+    def perform_create(self, serializer):
+        serializer.save(tenant=get_tenant())
+
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return DecisionCreateUpdateSerializer
         return DecisionSerializer
+
+    def get_permissions(self):
+        if self.action == 'bulk_destroy':
+            return [IsAdminUser()]
+        return super().get_permissions()
     
     @swagger_auto_schema(
         operation_description="Create a new decision",
+        manual_parameters=[IDEMPOTENCY_KEY, PREFER],
         responses={
             201: openapi.Response(description="Created", schema=DecisionSerializer),
+            202: openapi.Response(description="Accepted, poll the intake"),
             400: openapi.Response(description="Bad Request"),
             **COMMON_RESPONSES
     })
     def create(self, request, *args, **kwargs):
-        return super().create(request, *args, **kwargs)
+        """
+        Create a decision
+
+        With `Prefer: respond-async` the decision is validated, queued and
+        inserted in a batch shortly after, see `decisions.intake`. Returns
+        202 with the intake to poll, or 201 if the queue is full.
+        """
+        if not settings.DECISION_INTAKE_ENABLED or not self._prefers_async():
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        intake_id = decision_intake.submit(get_tenant(), serializer.validated_data)
+        if intake_id is None:
+            return super().create(request, *args, **kwargs)
+        url = reverse('decision-intake', args=[intake_id], request=request)
+        return Response(
+            {'intake_id': intake_id, 'status': PENDING, 'url': url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': url, 'Preference-Applied': 'respond-async'},
+        )
+
+    def _prefers_async(self):
+        preferences = self.request.headers.get('Prefer', '')
+        return any(preference.split(';')[0].strip().lower() == 'respond-async' for preference in preferences.split(','))
 
     @swagger_auto_schema(
         operation_description="Get a specific decision",
+        manual_parameters=[INCLUDE_ARCHIVED],
         responses={
             404: openapi.Response(description="Not Found"),
             **COMMON_RESPONSES
     })
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        try:
+            response = super().retrieve(request, *args, **kwargs)
+        except Http404:
+            if not self._flag('include_archived'):
+                raise
+            archived = get_object_or_404(self.get_archived_queryset(), pk=kwargs['pk'])
+            response = Response(DecisionSerializer(archived).data)
+        response['ETag'] = etag(response.data['version'])
+        return response
 
     @swagger_auto_schema(auto_schema=None)
     def partial_update(self, request, *args, **kwargs):
         raise MethodNotAllowed('PATCH', detail='Method "PATCH" not allowed.')
 
-    @swagger_auto_schema(operation_description="Destroy a decision", responses={**COMMON_RESPONSES})
+    @swagger_auto_schema(
+        operation_description="Destroy a decision",
+        manual_parameters=[IF_MATCH],
+        responses={
+            412: openapi.Response(description="Precondition Failed, the decision was changed"),
+            **COMMON_RESPONSES
+    })
     def destroy(self, request, *args, **kwargs):
-        return super().destroy(request, *args, **kwargs)
+        try:
+            with transaction.atomic():
+                return super().destroy(request, *args, **kwargs)
+        except Http404:
+            try:
+                deleted = delete_archived(kwargs['pk'], get_tenant(), self._if_match())
+            except StaleVersion:
+                raise PreconditionFailed()
+            if not deleted:
+                raise
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def perform_destroy(self, instance):
+        expected_version = self._if_match()
+        if expected_version is not None:
+            # The conditional UPDATE also locks the row until the delete commits
+            if not Decision.objects.filter(pk=instance.pk, version=expected_version).update(version=F('version') + 1):
+                raise PreconditionFailed()
+        instance.delete()
+
+    def _if_match(self):
+        """
+        Version the decision must have for the write to go through, from If-Match
+
+        None when there is no precondition. Without If-Match writes are
+        unconditional, unless `DECISION_REQUIRE_IF_MATCH` is set.
+        """
+        header = self.request.headers.get('If-Match')
+        if header is None:
+            if settings.DECISION_REQUIRE_IF_MATCH:
+                raise PreconditionRequired()
+            return None
+        header = header.strip()
+        if header == '*':
+            return None
+        try:
+            return int(header.removeprefix('W/').strip('"'))
+        except ValueError:
+            raise PreconditionFailed()
 
-    @swagger_auto_schema(operation_description="Get a list of decisions", responses={**COMMON_RESPONSES})
+    @swagger_auto_schema(
+        operation_description="Get a list of decisions",
+        manual_parameters=[
+            openapi.Parameter('stream', openapi.IN_QUERY, description="Stream the page item by item", type=openapi.TYPE_BOOLEAN),
+            INCLUDE_ARCHIVED,
+        ],
+        responses={**COMMON_RESPONSES})
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        """
+        List decisions
+
+        With `include_archived`, hot and archived decisions are paginated
+        together and each page is then loaded from its own table.
+        """
+        stream = self._flag('stream')
+        include_archived = self._flag('include_archived')
+        if not stream and not include_archived:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if include_archived:
+            archived = self.filter_queryset(self.get_archived_queryset())
+            ordering = filters.OrderingFilter().get_ordering(request, queryset, self)
+            queryset = with_archive(queryset, archived, ordering)
+
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            items, envelope = queryset.iterator(), None
+        else:
+            items, envelope = page, self.get_paginated_response([]).data
+            envelope.pop('results')
+        if include_archived:
+            items = hydrate(list(items))
+
+        if not stream:
+            return self.get_paginated_response(self.get_serializer(items, many=True).data)
+        return StreamingJSONPageResponse(request, envelope, items, self._serialize_one)
+
+    def _serialize_one(self, decision):
+        return self.get_serializer(decision).data
+
+    def _flag(self, name):
+        return self.request.query_params.get(name) in ('1', 'true')
 
     @swagger_auto_schema(
         operation_description="Update a specific decision",
+        manual_parameters=[IF_MATCH],
         responses={
             200: openapi.Response(description="OK", schema=DecisionSerializer),
             400: openapi.Response(description="Bad Request"),
             404: openapi.Response(description="Not Found"),
+            412: openapi.Response(description="Precondition Failed, the decision was changed"),
             **COMMON_RESPONSES
     })
     def update(self, request, *args, **kwargs):
@@ -79,19 +301,54 @@ class DecisionViewSet(viewsets.ModelViewSet):
         If the status of the decision is changed to 'Pending'
         or the measurable goal is changed,
         the evaluation for the decision is deleted.
+
+        With If-Match, the decision is only written if its version is
+        still the one in the header, else 412 is returned.
         """
-        decision = self.get_object()
-        old_status = decision.status
-        old_measurable_goal = decision.measurable_goal
+        with transaction.atomic():
+            try:
+                decision = self.get_object()
+            except Http404:
+                # Archived decisions move back to the hot table when written, in the transaction
+                # of the update so a rejected one (400, 412) leaves them archived
+                self.get_serializer(data=request.data).is_valid(raise_exception=True)
+                if restore(kwargs['pk'], get_tenant()) is None:
+                    raise
+                decision = self.get_object()
+            old_status = decision.status
+            old_measurable_goal = decision.measurable_goal
 
-        super().update(request, *args, **kwargs)
+            super().update(request, *args, **kwargs)
 
-        decision.refresh_from_db()
-        if self._should_delete_evaluation(old_status, old_measurable_goal, decision):
-            Evaluation.objects.filter(decision=decision).delete()
+            decision.refresh_from_db()
+            if self._should_delete_evaluation(old_status, old_measurable_goal, decision):
+                deleted, _ = Evaluation.objects.filter(decision=decision).delete()
+                if deleted:
+                    EVALUATION_RESETS.inc()
+                    # Cleared in the database by the evaluation signal
+                    decision.is_evaluated, decision.goal_met = False, None
 
         serializer = DecisionSerializer(decision)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_200_OK, headers={'ETag': etag(decision.version)})
+
+    def perform_update(self, serializer):
+        """Write the update with a single UPDATE, conditional on the If-Match version"""
+        decision = serializer.instance
+        for field, value in serializer.validated_data.items():
+            setattr(decision, field, value)
+        try:
+            # Only the fields sent, so the evaluation summary written by other requests is kept
+            decision.save(update_fields=[*serializer.validated_data, 'updated_at'], expected_version=self._if_match())
+        except StaleVersion:
+            raise PreconditionFailed()
+
+    @staticmethod
+    def _applied_filters(filterset):
+        """Query parameters of the filters with a value, those sent empty don't filter anything"""
+        return {
+            name: filterset.data[name] for name, value in filterset.form.cleaned_data.items()
+            if name in filterset.data and value not in EMPTY_VALUES
+        }
 
     @staticmethod
     def _should_delete_evaluation(old_status, old_measurable_goal, decision):
@@ -99,6 +356,7 @@ class DecisionViewSet(viewsets.ModelViewSet):
 
     @swagger_auto_schema(
         operation_description="Evaluate a decision",
+        manual_parameters=[IDEMPOTENCY_KEY],
         responses={
             201: openapi.Response(description="Created", schema=DecisionSerializer),
             400: openapi.Response(description="Bad Request"),
@@ -125,8 +383,384 @@ class DecisionViewSet(viewsets.ModelViewSet):
         
         serializer = EvaluationCreateSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(decision=decision)
+            with transaction.atomic():
+                serializer.save(decision=decision)
+                # Touch the decision so the evaluation shows up in the change feed
+                decision.save(update_fields=['updated_at'])
             decision.refresh_from_db()
             decision_serializer = DecisionSerializer(decision)
             return Response(decision_serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @swagger_auto_schema(
+        operation_description="Get decision changes since a token",
+        manual_parameters=[
+            openapi.Parameter('since', openapi.IN_QUERY, description="Token returned by the previous call", type=openapi.TYPE_STRING),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Maximum number of changes", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            400: openapi.Response(description="Bad Request"),
+            410: openapi.Response(description="Token expired, the mirror has to be rebuilt"),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def changes(self, request):
+        """
+        Incremental change feed
+
+        Returns created, updated and evaluated decisions and deletions
+        ordered by time of change, together with a token to resume from.
+        Tokens older than the tombstone retention get 410 Gone.
+        """
+        try:
+            limit = max(min(int(request.query_params.get('limit', self.CHANGES_LIMIT)), self.CHANGES_MAX_LIMIT), 1)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            changes, token = read_changes(self.get_queryset(), request.query_params.get('since'), limit, get_tenant())
+        except InvalidToken:
+            return Response({"error": "Invalid since token."}, status=status.HTTP_400_BAD_REQUEST)
+        except TokenExpired:
+            return Response({"error": "Token expired, fetch all decisions again."}, status=status.HTTP_410_GONE)
+
+        return Response({
+            'changes': [serialize_change(change) for change in changes],
+            'next': token,
+            'has_more': len(changes) == limit,
+        })
+
+    @swagger_auto_schema(
+        operation_description="Titles matching what was typed so far, for search-as-you-type",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Beginning of a title", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Number of suggestions, 10 by default and at most 50", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response(description="OK", schema=openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={
+                    'id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'title': openapi.Schema(type=openapi.TYPE_STRING),
+                }))),
+            400: openapi.Response(description="Bad Request"),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def autocomplete(self, request):
+        """
+        Title suggestions
+
+        Returns the ids and titles of the decisions whose title starts with
+        `q`, followed on PostgreSQL by titles with a word similar to `q`.
+        Doesn't scan the decisions, see `decisions.autocomplete`.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', self.AUTOCOMPLETE_LIMIT)), self.AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(suggest(self.get_queryset(), get_tenant(), query, max(limit, 1)))
+
+    @swagger_auto_schema(
+        operation_description="State of a decision create accepted with Prefer: respond-async",
+        responses={
+            200: openapi.Response(description="OK"),
+            404: openapi.Response(description="Not Found"),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=False, methods=['get'], url_path=r'intake/(?P<intake_id>[0-9a-f]{32})', url_name='intake')
+    def intake(self, request, intake_id):
+        """
+        Intake status
+
+        `pending` until the decision is inserted, then `created` with its
+        id, or `failed` with the error if it went to the dead letter file.
+        Pending and failed intakes are only known to the process which
+        accepted them.
+        """
+        # Looked up before the database, intakes stop being pending once their insert committed
+        known = decision_intake.status(intake_id)
+        if known is not None and known[0] == PENDING:
+            return Response({'intake_id': intake_id, 'status': PENDING})
+        pk = self.get_queryset().filter(intake_id=intake_id).values_list('pk', flat=True).first()
+        if pk is not None:
+            return Response({
+                'intake_id': intake_id, 'status': CREATED, 'id': pk,
+                'url': reverse('decision-detail', args=[pk], request=request),
+            })
+        if known is None:
+            raise Http404
+        return Response({'intake_id': intake_id, 'status': FAILED, 'error': known[1]})
+
+    @swagger_auto_schema(
+        operation_description="State of a decision at a point in time, with its latest changes until then",
+        manual_parameters=[
+            openapi.Parameter('as_of', openapi.IN_QUERY, description="Date or ISO 8601 datetime, now by default", type=openapi.TYPE_STRING),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Number of changes, 20 by default and at most 100", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response(description="OK"),
+            400: openapi.Response(description="Bad Request"),
+            404: openapi.Response(description="Not Found"),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=True, methods=['get'], pagination_class=None)
+    def history(self, request, pk=None):
+        """
+        Decision history
+
+        Returns the decision and its evaluation as they were at `as_of`,
+        `state` is null if the decision was deleted by then, and the
+        latest `limit` history entries recorded up to `as_of`, newest first.
+        A date as `as_of` means the end of that day. Deleted and archived
+        decisions keep their history. See `decisions.history`.
+        """
+        as_of = timezone.now()
+        if 'as_of' in request.query_params:
+            as_of = self._parse_as_of(request.query_params['as_of'])
+            if as_of is None:
+                return Response({"error": "as_of must be a date or an ISO 8601 datetime."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        try:
+            limit = min(int(request.query_params.get('limit', self.HISTORY_LIMIT)), self.HISTORY_MAX_LIMIT)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        tenant = get_tenant()
+        state, known = history.state_at(pk, tenant, as_of)
+        if not known:
+            raise Http404
+        entries = DecisionHistory.objects.filter(decision_id=pk, tenant=tenant, recorded_at__lte=as_of).order_by('-id')[:max(limit, 1)]
+        return Response({
+            'id': pk,
+            'as_of': as_of,
+            'state': state,
+            'deleted': state is None,
+            'entries': [
+                {'id': entry.pk, 'kind': entry.kind, 'changes': entry.changes, 'recorded_at': entry.recorded_at}
+                for entry in entries
+            ],
+        })
+
+    @staticmethod
+    def _parse_as_of(value):
+        try:
+            day = parse_date(value)
+            as_of = datetime.combine(day, time.max) if day is not None else parse_datetime(value)
+        except ValueError:
+            return None
+        if as_of is not None and timezone.is_naive(as_of):
+            as_of = timezone.make_aware(as_of)
+        return as_of
+
+    @swagger_auto_schema(
+        operation_description="Outcome trends per week or month",
+        manual_parameters=[
+            openapi.Parameter('bucket', openapi.IN_QUERY, description="week (default) or month", type=openapi.TYPE_STRING),
+            openapi.Parameter('since', openapi.IN_QUERY, description="First day, 12 buckets before until by default", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('until', openapi.IN_QUERY, description="Last day, today by default", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        ],
+        responses={
+            200: openapi.Response(description="OK"),
+            400: openapi.Response(description="Bad Request"),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def analytics(self, request):
+        """
+        Decision analytics
+
+        Per bucket: decisions created, by current status, decisions
+        completed, decisions evaluated with their goal-met rate and the
+        percentiles of the time from creation to evaluation, in hours.
+        Archived decisions are included. See `decisions.analytics`.
+        """
+        bucket = request.query_params.get('bucket', analytics.WEEK)
+        if bucket not in analytics.BUCKETS:
+            return Response({"error": "bucket must be week or month."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            until = parse_date(request.query_params['until']) if 'until' in request.query_params else timezone.now().date()
+            since = parse_date(request.query_params['since']) if 'since' in request.query_params else analytics.default_since(bucket, until)
+        except ValueError:
+            since = until = None
+        if since is None or until is None:
+            return Response({"error": "since and until must be dates, e.g. 2024-07-01."}, status=status.HTTP_400_BAD_REQUEST)
+        if since > until:
+            return Response({"error": "since must not be after until."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(analytics.edges(bucket, since, until)) - 1 > self.ANALYTICS_MAX_BUCKETS:
+            return Response({"error": f"At most {self.ANALYTICS_MAX_BUCKETS} buckets."}, status=status.HTTP_400_BAD_REQUEST)
+
+        querysets = [self.get_queryset().select_related(None), self.get_archived_queryset().select_related(None)]
+        return Response({
+            'bucket': bucket,
+            'since': since,
+            'until': until,
+            'buckets': analytics.bucket_analytics(get_tenant(), bucket, since, until, querysets),
+        })
+
+    @swagger_auto_schema(
+        operation_description="Export the decisions in the background, as a JSON file",
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, description="Only export decisions with this status", type=openapi.TYPE_STRING),
+            openapi.Parameter('created_after', openapi.IN_QUERY, description="Only export decisions created since, also "
+                              "created_before, updated_after/before and evaluated_after/before", type=openapi.TYPE_STRING),
+            IDEMPOTENCY_KEY,
+        ],
+        request_body=no_body,
+        responses={
+            202: openapi.Response(description="Accepted, poll the job", schema=JobSerializer),
+            400: openapi.Response(description="Bad Request"),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """
+        Export decisions asynchronously
+
+        Takes the filters of the list. Returns 202 with the job, its output
+        is downloaded from `GET /jobs/:id/download` once it has succeeded.
+        """
+        filterset = DecisionFilter(request.query_params, queryset=self.get_queryset())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        # The raw values, the worker validates them again with the same filters
+        params = self._applied_filters(filterset)
+        job = enqueue('decisions.export', {'tenant': get_tenant(), 'filters': params}, user=request.user)
+        return job_accepted(request, job)
+
+    @swagger_auto_schema(
+        operation_description="Delete the decisions matching the filters in the background",
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, description="Only delete decisions with this status", type=openapi.TYPE_STRING),
+            openapi.Parameter('created_before', openapi.IN_QUERY, description="Only delete decisions created before, also "
+                              "created_after, updated_after/before and evaluated_after/before", type=openapi.TYPE_STRING),
+        ],
+        responses={
+            202: openapi.Response(description="Accepted, poll the job", schema=JobSerializer),
+            400: openapi.Response(description="Bad Request"),
+            **COMMON_RESPONSES
+        }
+    )
+    def bulk_destroy(self, request):
+        """
+        Delete decisions by filter asynchronously
+
+        `DELETE` on the list, routed by `decisions.urls`. Takes the filters
+        of the list, at least one and no other parameter (not even
+        `search`), and deletes the matching hot and
+        archived decisions in chunks, see `decisions.bulk_delete`.
+        Decisions created after the request are kept. Returns 202 with the
+        job, its result is the number of decisions deleted.
+        """
+        filterset = DecisionFilter(request.query_params, queryset=self.get_queryset())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Ignoring one, e.g. `search`, would delete more than the list shows
+        unsupported = sorted(set(request.query_params) - set(filterset.filters))
+        if unsupported:
+            return Response(
+                {"error": f"Only the filters of the list can be used, not: {', '.join(unsupported)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        params = self._applied_filters(filterset)
+        if not params:
+            return Response({"error": "Give at least one filter of the list."}, status=status.HTTP_400_BAD_REQUEST)
+        until_id = max(
+            self.get_queryset().aggregate(until_id=Max('pk'))['until_id'] or 0,
+            self.get_archived_queryset().aggregate(until_id=Max('pk'))['until_id'] or 0,
+        )
+        job = enqueue('decisions.bulk_delete', {'tenant': get_tenant(), 'filters': params, 'until_id': until_id}, user=request.user)
+        return job_accepted(request, job)
+
+    @swagger_auto_schema(
+        operation_description="Recount the decisions per status in the background",
+        manual_parameters=[IDEMPOTENCY_KEY],
+        request_body=no_body,
+        responses={
+            202: openapi.Response(description="Accepted, poll the job", schema=JobSerializer),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=False, methods=['post'], url_path='rebuild-counts', permission_classes=[IsAdminUser])
+    def rebuild_counts(self, request):
+        """Rebuild the status counters of the tenant asynchronously, returns 202 with the job"""
+        job = enqueue('decisions.rebuild_counts', {'tenant': get_tenant()}, user=request.user)
+        return job_accepted(request, job)
+
+    @swagger_auto_schema(
+        operation_description="List the decisions of every tenant across all shards",
+        manual_parameters=[
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            400: openapi.Response(description="Bad Request"),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=False, methods=['get'], url_path='all-shards', permission_classes=[IsAdminUser], pagination_class=None)
+    def all_shards(self, request):
+        """
+        Cross-shard listing for administrators
+
+        Every shard returns its first `page * page_size` decisions in the
+        requested ordering and the sorted results are merged, so deeper
+        pages cost more. Filters, search and ordering work as on the list.
+        """
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            page = 0
+        if page < 1:
+            return Response({"error": "page must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        ordering = [*filters.OrderingFilter().get_ordering(request, self.queryset, self), 'id']
+        count, shard_results = 0, []
+        for shard in settings.DECISION_SHARDS:
+            with use_shard(shard):
+                queryset = self.filter_queryset(Decision.objects.select_related('evaluation')).order_by(*ordering)
+                count += queryset.count()
+                shard_results.append(list(queryset[:page * page_size]))
+
+        merged = heapq.merge(*shard_results, key=cmp_to_key(self._ordering_comparator(ordering)))
+        results = list(merged)[(page - 1) * page_size:page * page_size]
+
+        url = request.build_absolute_uri()
+        has_next = page * page_size < count
+        return Response({
+            'count': count,
+            'next': replace_query_param(url, 'page', page + 1) if has_next else None,
+            'previous': None if page == 1 else (
+                remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)
+            ),
+            'results': DecisionSerializer(results, many=True).data,
+        })
+
+    @staticmethod
+    def _ordering_comparator(ordering):
+        """
+        Compares decisions like `ORDER BY ordering` so shard results can be merged
+
+        NULLs sort after any value in ascending order, like on PostgreSQL.
+        """
+        fields = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+        def compare(a, b):
+            for field, descending in fields:
+                left, right = getattr(a, field), getattr(b, field)
+                left, right = (left is None, left), (right is None, right)
+                if left != right:
+                    return (left < right) - (left > right) if descending else (left > right) - (left < right)
+            return 0
+        return compare
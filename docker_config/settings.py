@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -46,10 +47,15 @@ INSTALLED_APPS = [
 
     'authentication',
     'decisions',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'enterpriseApi.metrics.MetricsMiddleware',
+    'enterpriseApi.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'enterpriseApi.admission.AdmissionControlMiddleware',
+    'enterpriseApi.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,9 +96,69 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('DB_NAME'),
+        'USER': os.getenv('DB_USER'),
+        'PASSWORD': os.getenv('DB_PASSWORD'),
+        'HOST': os.getenv('DB_REPLICA_HOST', os.getenv('DB_HOST')),
+        'PORT': os.getenv('DB_REPLICA_PORT', os.getenv('DB_PORT')),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Aliases of the databases safe requests may read from, e.g. DB_REPLICAS=replica
+DATABASE_REPLICAS = [alias for alias in os.getenv('DB_REPLICAS', '').split(',') if alias]
+
+# Tenants not given one at registration, and anonymous readers, use this tenant
+DEFAULT_TENANT = 'default'
+
+# Database aliases holding decisions, each tenant lives on one of them, e.g. DECISION_SHARDS=default,shard_1
+DECISION_SHARDS = os.getenv('DECISION_SHARDS', 'default').split(',')
+
+DATABASE_ROUTERS = [
+    'decisions.sharding.ShardRouter',
+    'enterpriseApi.db_router.PrimaryReplicaRouter',
+]
+
+# How long a client reads from the primary after writing
+REPLICA_STICKINESS_SECONDS = 5
+
+# How long a failing replica is skipped
+REPLICA_RETRY_AFTER = 30
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/ref/settings/#caches
+# Shared by the server and worker processes of the host through a SQLite file,
+# see enterpriseApi/cache.py. CACHE_LOCATION must be on a volume they all mount
+
+CACHES = {
+    'default': {
+        'BACKEND': 'enterpriseApi.cache.SQLiteCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', BASE_DIR / 'cache' / 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+        },
     }
 }
 
+# Concurrency limits per route class (see enterpriseApi/admission.py): requests
+# running at once, requests waiting for a slot, seconds they wait, extra slots
+# for priority requests and the Retry-After of shed requests
+ADMISSION_CONTROL = {
+    'search': {'limit': 4, 'queue': 8, 'timeout': 0.5, 'retry_after': 2},
+    'list': {'limit': 8, 'queue': 16, 'timeout': 1.0, 'retry_after': 1},
+    'write': {'limit': 8, 'queue': 16, 'timeout': 2.0, 'reserved': 2, 'retry_after': 1},
+    'auth': {'limit': 2, 'queue': 8, 'timeout': 2.0, 'retry_after': 2},
+    'batch': {'limit': 4, 'queue': 8, 'timeout': 1.0, 'retry_after': 1},
+}
+
+# Batches (see enterpriseApi/batch.py): most sub-requests per batch, and threads
+# running the reads of a concurrent batch
+BATCH_MAX_REQUESTS = 50
+BATCH_MAX_WORKERS = 4
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -104,9 +170,84 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': (
+        'enterpriseApi.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'enterpriseApi.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Keep datetimes as objects so the renderer encodes them natively
+    'DATETIME_FORMAT': None,
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
 
+# Tombstones of deleted decisions are kept this long in the change feed
+DECISION_TOMBSTONE_RETENTION_DAYS = 30
+
+# Reject decision updates and deletes without If-Match with 428
+DECISION_REQUIRE_IF_MATCH = False
+
+# History entries of a decision between the snapshots written by compact_decision_history,
+# the most a point-in-time read replays once compacted
+DECISION_HISTORY_SNAPSHOT_INTERVAL = 50
+
+# Bulk deletes by filter (DELETE /decisions?...) delete this many decisions per transaction,
+# and pause this many seconds between two to leave the database to live traffic
+DECISION_BULK_DELETE_CHUNK_SIZE = 1000
+DECISION_BULK_DELETE_PAUSE = 0.2
+
+# Write-behind decision creates (see decisions/intake.py): creates sent with
+# `Prefer: respond-async` are queued in process and inserted in batches of up to
+# DECISION_INTAKE_BATCH_SIZE, at most DECISION_INTAKE_MAX_DELAY seconds after they
+# were accepted. Creates beyond DECISION_INTAKE_QUEUE_SIZE are made synchronously,
+# decisions which can't be inserted are appended to the dead letter file
+DECISION_INTAKE_ENABLED = True
+DECISION_INTAKE_BATCH_SIZE = 500
+DECISION_INTAKE_MAX_DELAY = 0.1
+DECISION_INTAKE_QUEUE_SIZE = 10000
+DECISION_INTAKE_DEAD_LETTER_FILE = os.getenv('DECISION_INTAKE_DEAD_LETTER_FILE', BASE_DIR / 'decision_intake_dead_letters.jsonl')
+
+# Title autocomplete (see decisions/autocomplete.py): reload of the in-process index
+# of other databases than PostgreSQL, and shortest query searched by trigrams on PostgreSQL
+AUTOCOMPLETE_INDEX_TTL = 60
+AUTOCOMPLETE_TRIGRAM_MIN_LENGTH = 3
+
+# Server-sent decision events (see enterpriseApi/asgi.py)
+DECISION_EVENTS_POLL_INTERVAL = 1.0
+DECISION_EVENTS_BATCH_SIZE = 500
+DECISION_EVENTS_QUEUE_SIZE = 100
+DECISION_EVENTS_HEARTBEAT = 15
+
+# Responses to POSTs with an Idempotency-Key are replayed to retries for
+# IDEMPOTENCY_KEY_TTL seconds. Concurrent duplicates wait up to
+# IDEMPOTENCY_WAIT_TIMEOUT for the first request, a request which didn't
+# finish within IDEMPOTENCY_LOCK_TIMEOUT is considered dead
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Slow query log (see enterpriseApi/slow_queries.py): queries slower than the
+# threshold are kept in a per process ring buffer, their plan is captured once
+# per fingerprint and interval, with EXPLAIN ANALYZE for a sample of reads on PostgreSQL
+SLOW_QUERY_THRESHOLD_MS = 200
+SLOW_QUERY_LOG_SIZE = 1000
+SLOW_QUERY_EXPLAIN = True
+SLOW_QUERY_EXPLAIN_INTERVAL = 300
+SLOW_QUERY_ANALYZE_SAMPLE_RATE = 0.1
+
+# Background jobs (see jobs/ and `manage.py run_workers`)
+JOB_MAX_ATTEMPTS = 3
+# Seconds before the first retry of a failed job, doubled on every attempt
+JOB_RETRY_DELAY = 10
+# Running jobs not reporting progress for this long are given to another worker
+JOB_LEASE_SECONDS = 300
+JOB_POLL_INTERVAL = 1.0
+JOB_OUTPUT_DIR = os.getenv('JOB_OUTPUT_DIR', BASE_DIR / 'job_output')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -0,0 +1,139 @@
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from enterpriseApi.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Writes which go ahead of the queue of their class, evaluation is admin only
+PRIORITY_ROUTES = {'decision-evaluate'}
+
+
+class Limiter:
+    """
+    Bounds the requests of a route class running at the same time
+
+    Up to `limit` requests run, up to `queue` more wait at most `timeout`
+    seconds for a slot and anything beyond is rejected right away.
+    Priority requests may use `reserved` extra slots and are admitted
+    before the waiting requests, they are never rejected for a full queue.
+    """
+
+    def __init__(self, name, limit, queue=0, timeout=1.0, reserved=0):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.reserved = reserved
+        self.in_flight = 0
+        self.waiting = 0
+        self.waiting_priority = 0
+        self._condition = threading.Condition()
+
+    def _can_run(self, priority):
+        if priority:
+            return self.in_flight < self.limit + self.reserved
+        return self.in_flight < self.limit and not self.waiting_priority
+
+    def acquire(self, priority=False):
+        """Take a slot, returns the reason the request is shed instead, None once admitted"""
+        with self._condition:
+            if not self._can_run(priority):
+                if not priority and self.waiting >= self.queue:
+                    return 'queue_full'
+                if not self._wait(priority):
+                    return 'timeout'
+            self.in_flight += 1
+            ADMISSION_IN_FLIGHT.labels(self.name).set(self.in_flight)
+            return None
+
+    def _wait(self, priority):
+        deadline = time.monotonic() + self.timeout
+        self.waiting += 1
+        self.waiting_priority += priority
+        ADMISSION_QUEUE_DEPTH.labels(self.name).set(self.waiting)
+        try:
+            while not self._can_run(priority):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+        finally:
+            self.waiting -= 1
+            self.waiting_priority -= priority
+            ADMISSION_QUEUE_DEPTH.labels(self.name).set(self.waiting)
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            ADMISSION_IN_FLIGHT.labels(self.name).set(self.in_flight)
+            self._condition.notify_all()
+
+
+def route_class(request):
+    """
+    Class of the resolved route of `request`, None for routes which are never limited
+
+    - `auth`: login and registration, which hash passwords
+    - `batch`: batches, whose sub-requests don't go through the middleware
+    - `write`: any unsafe request
+    - `search`: safe requests with `?search=`
+    - `list`: other list requests
+    """
+    match = request.resolver_match
+    if match is None:
+        return None
+    if match.namespace == 'authentication':
+        return 'auth'
+    if match.url_name == 'batch':
+        return 'batch'
+    if request.method not in SAFE_METHODS:
+        return 'write'
+    if request.GET.get('search'):
+        return 'search'
+    if match.url_name and match.url_name.endswith(('-list', '-all-shards')):
+        return 'list'
+    return None
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds load per route class before it reaches the database
+
+    Every class configured in `ADMISSION_CONTROL` gets its own `Limiter`,
+    so a flood of searches can't starve retrieves or evaluations. Shed
+    requests get 503 with `Retry-After`. Limits apply per process.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limiters = {
+            name: Limiter(name, **{key: value for key, value in config.items() if key != 'retry_after'})
+            for name, config in settings.ADMISSION_CONTROL.items()
+        }
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            limiter = getattr(request, '_admission_limiter', None)
+            if limiter is not None:
+                limiter.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        limiter = self.limiters.get(route_class(request))
+        if limiter is None:
+            return None
+        reason = limiter.acquire(priority=request.resolver_match.url_name in PRIORITY_ROUTES)
+        if reason is not None:
+            ADMISSION_SHED.labels(limiter.name, reason).inc()
+            retry_after = settings.ADMISSION_CONTROL[limiter.name].get('retry_after', 1)
+            response = JsonResponse({"error": "The server is overloaded, retry later."}, status=503)
+            response['Retry-After'] = str(retry_after)
+            return response
+        request._admission_limiter = limiter
+        return None
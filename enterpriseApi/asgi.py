@@ -2,6 +2,9 @@
 ASGI config for enterpriseApi project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Decision events are served as server-sent events straight from ASGI, so
+idle connections don't hold a Django worker thread, everything else goes
+to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +16,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'enterpriseApi.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from decisions.events import DecisionEventsApp  # noqa: E402
+
+EVENTS_PATH = '/api/decisions/events'
+
+events_application = DecisionEventsApp()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        await events_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,160 @@
+"""
+Batches of API requests run in a single HTTP request
+
+`POST /api/batch` takes a list of sub-requests to routes under `/api/`,
+authenticates the client once and calls the views of the sub-requests
+in process, without going through the middleware again. Sub-requests
+run in order. With `concurrent`, consecutive reads run at the same time
+in threads, each with its own database connection, writes always run
+alone. Each sub-request succeeds or fails on its own, the batch is not
+a transaction.
+"""
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import copy_context
+
+import orjson
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework import serializers, status
+
+from enterpriseApi.renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PREFIX = '/api/'
+# Headers of sub-responses passed on to the client
+RETURNED_HEADERS = ('Location', 'ETag', 'Retry-After', 'Idempotent-Replayed')
+# Headers of the batch request which must not leak into the sub-requests
+# Accept-Encoding too: sub-responses are decoded into the batch response, which is compressed as a whole
+DROPPED_META = (
+    'CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_AUTHORIZATION', 'HTTP_IDEMPOTENCY_KEY', 'HTTP_IF_MATCH', 'HTTP_ACCEPT_ENCODING',
+)
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """Serializer for one request of a batch"""
+
+    id = serializers.CharField(required=False, help_text="Echoed in the response, defaults to the position in the batch")
+    method = serializers.ChoiceField(choices=['GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    path = serializers.CharField(help_text="Path under /api/, with its query string")
+    headers = serializers.DictField(child=serializers.CharField(), required=False, default=dict)
+    body = serializers.JSONField(required=False, allow_null=True, default=None)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Serializer for a batch of requests"""
+
+    requests = serializers.ListField(child=SubRequestSerializer(), allow_empty=False)
+    concurrent = serializers.BooleanField(default=False, help_text="Run consecutive reads at the same time")
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(f'Ensure this field has no more than {settings.BATCH_MAX_REQUESTS} elements.')
+        return value
+
+
+def _error(code, detail):
+    return code, {}, {'detail': detail}
+
+
+def sub_request(request, item):
+    """Django request for `item`, authenticated as the user of the batch `request`"""
+    path, _, query = item['path'].partition('?')
+    body = dumps(item['body']) if item['body'] is not None else b''
+    meta = {key: value for key, value in request.META.items() if key not in DROPPED_META}
+    meta.update({
+        'REQUEST_METHOD': item['method'],
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.url_scheme': request.scheme,
+    })
+    for name, value in item['headers'].items():
+        meta['HTTP_' + name.upper().replace('-', '_')] = value
+    sub = WSGIRequest(meta)
+    # Picked up by DRF instead of authenticating again
+    if request.user.is_authenticated:
+        sub._force_auth_user = request.user
+        sub._force_auth_token = request.auth
+    return sub
+
+
+def run_one(request, item):
+    """Run one sub-request, returns its status code, headers and body"""
+    path = item['path'].partition('?')[0]
+    if not path.startswith(PREFIX):
+        return _error(status.HTTP_400_BAD_REQUEST, f'Only paths under {PREFIX} can be batched.')
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return _error(status.HTTP_404_NOT_FOUND, 'Not found.')
+    if match.url_name == 'batch':
+        return _error(status.HTTP_400_BAD_REQUEST, 'Batches can not be nested.')
+
+    sub = sub_request(request, item)
+    sub.resolver_match = match
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+        headers = {name: response[name] for name in RETURNED_HEADERS if response.has_header(name)}
+        body = _body(response)
+    except Exception:
+        logger.exception('Batched %s %s failed', item['method'], item['path'])
+        return _error(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal server error.')
+    return response.status_code, headers, body
+
+
+def _body(response):
+    if hasattr(response, 'data'):
+        return response.data
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    if content and response.get('Content-Type', '').startswith('application/json'):
+        return orjson.loads(content)
+    return content.decode(errors='replace') or None
+
+
+def _run_in_thread(request, item):
+    try:
+        return run_one(request, item)
+    finally:
+        connections.close_all()
+
+
+def run_batch(request, items, concurrent=False):
+    """Run the sub-requests of a batch in order, returns their responses"""
+    results = [None] * len(items)
+    position = 0
+    with ThreadPoolExecutor(max_workers=settings.BATCH_MAX_WORKERS) if concurrent else nullcontext() as executor:
+        while position < len(items):
+            if items[position]['method'] not in SAFE_METHODS:
+                results[position] = run_one(request, items[position])
+                position += 1
+                continue
+            # Consecutive reads don't depend on each other
+            end = position
+            while end < len(items) and items[end]['method'] in SAFE_METHODS:
+                end += 1
+            if executor is None or end - position == 1:
+                for index in range(position, end):
+                    results[index] = run_one(request, items[index])
+            else:
+                futures = {
+                    index: executor.submit(copy_context().run, _run_in_thread, request, items[index])
+                    for index in range(position, end)
+                }
+                for index, future in futures.items():
+                    results[index] = future.result()
+            position = end
+
+    return [
+        {'id': item.get('id', str(index)), 'status': code, 'headers': headers, 'body': body}
+        for index, (item, (code, headers, body)) in enumerate(zip(items, results))
+    ]
@@ -0,0 +1,211 @@
+"""
+Cache backend shared by the processes of a host, stored in SQLite
+
+`LocMemCache` is per process: with several workers every process caches
+its own copy and `cache.incr` on a version key, which is how counts and
+other derived data are invalidated, only reaches the process doing it.
+This backend keeps the entries in one SQLite database in WAL mode, so
+every process on the host sees the same entries, readers never wait for
+writers and `incr` is atomic across processes.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'enterpriseApi.cache.SQLiteCache',
+            'LOCATION': '/var/cache/decisions/cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
+Expired entries are deleted, and beyond `MAX_ENTRIES` the least recently
+used `1 / CULL_FREQUENCY` of the entries are evicted, every
+`CULL_INTERVAL` writes of a process. Reads record the time of use at most
+every `LRU_RESOLUTION` seconds per entry, so hot entries don't turn every
+hit into a write. Values are pickled, like with the other Django backends
+the file must only be writable by the application.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS cache_entry ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed)',
+]
+# Live entries, `expires` is NULL for entries which never expire
+LIVE = '(expires IS NULL OR expires > ?)'
+
+
+class SQLiteCache(BaseCache):
+    """Django cache backend storing the entries in a SQLite database shared by the processes"""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = str(location)
+        self._cull_interval = int(options.get('CULL_INTERVAL', 100))
+        self._lru_resolution = float(options.get('LRU_RESOLUTION', 60))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._mmap_size = int(options.get('MMAP_SIZE', 64 * 1024 * 1024))
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _connection(self):
+        """Connection of the current thread, opened again in forked processes"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit, writes spanning statements open their transaction explicitly
+            connection = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # A crash may lose the last writes, never corrupt the database, fine for a cache
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA mmap_size={self._mmap_size}')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    @contextmanager
+    def _write(self):
+        """Transaction taking the write lock right away, so read-modify-writes are atomic"""
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._write() as connection:
+            cursor = connection.execute(
+                'INSERT INTO cache_entry (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, accessed = excluded.accessed '
+                # Only replaces an expired entry
+                'WHERE cache_entry.expires <= ?',
+                (key, self._dumps(value), self.get_backend_timeout(timeout), now, now),
+            )
+            added = cursor.rowcount > 0
+        self._wrote()
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        row = self._connection.execute(
+            f'SELECT value, accessed FROM cache_entry WHERE key = ? AND {LIVE}', (key, now),
+        ).fetchone()
+        if row is None:
+            return default
+        value, accessed = row
+        if now - accessed > self._lru_resolution:
+            self._connection.execute('UPDATE cache_entry SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._set_many([(key, self._dumps(value))], timeout)
+
+    def _set_many(self, entries, timeout):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        with self._write() as connection:
+            connection.executemany(
+                'INSERT INTO cache_entry (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, accessed = excluded.accessed',
+                [(key, value, expires, now) for key, value in entries],
+            )
+        self._wrote(len(entries))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection.execute(
+            f'UPDATE cache_entry SET expires = ?, accessed = ? WHERE key = ? AND {LIVE}',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection.execute('DELETE FROM cache_entry WHERE key = ?', (key,)).rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection.execute(f'SELECT 1 FROM cache_entry WHERE key = ? AND {LIVE}', (key, time.time())).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic across processes: the read and the write happen under the database write lock"""
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            row = connection.execute(f'SELECT value FROM cache_entry WHERE key = ? AND {LIVE}', (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute('UPDATE cache_entry SET value = ? WHERE key = ?', (self._dumps(value), key))
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._connection.execute(
+            f'SELECT key, value FROM cache_entry WHERE key IN ({", ".join("?" * len(keys))}) AND {LIVE}',
+            (*keys, time.time()),
+        ).fetchall()
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        entries = [(self.make_and_validate_key(key, version=version), self._dumps(value)) for key, value in data.items()]
+        if entries:
+            self._set_many(entries, timeout)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            self._connection.execute(f'DELETE FROM cache_entry WHERE key IN ({", ".join("?" * len(keys))})', keys)
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache_entry')
+
+    def close(self, **kwargs):
+        # Kept open across requests, like the connection of LocMemCache's dict
+        pass
+
+    def _wrote(self, count=1):
+        self._writes += count
+        if self._writes >= self._cull_interval:
+            self._writes = 0
+            self.cull()
+
+    def cull(self):
+        """Delete the expired entries, then the least recently used ones beyond `MAX_ENTRIES`"""
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache_entry WHERE expires <= ?', (time.time(),))
+            count = connection.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+            if count > self._max_entries:
+                evicted = count - self._max_entries
+                if self._cull_frequency:
+                    evicted = max(evicted, count // self._cull_frequency)
+                connection.execute(
+                    'DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry ORDER BY accessed LIMIT ?)', (evicted,),
+                )
@@ -0,0 +1,127 @@
+import hashlib
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Replica the current request reads from, None reads from the primary
+read_alias = ContextVar('read_alias', default=None)
+
+# Replica alias -> time until which it is skipped after failing
+_unhealthy_until = {}
+
+
+def mark_unhealthy(alias):
+    _unhealthy_until[alias] = time.monotonic() + settings.REPLICA_RETRY_AFTER
+
+
+def is_healthy(alias):
+    if _unhealthy_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except (OperationalError, InterfaceError):
+        mark_unhealthy(alias)
+        return False
+    _unhealthy_until.pop(alias, None)
+    return True
+
+
+def pick_replica():
+    """A random healthy replica, or None when all of them are down"""
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        if is_healthy(alias):
+            return alias
+    return None
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends the reads of safe requests to a replica, everything else to the primary
+
+    The replica is chosen once per request by `ReplicaRoutingMiddleware`,
+    so code running outside of a request (commands, workers) always uses
+    the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def _pin_keys(request):
+    """Cache keys identifying the client, by token or by address for anonymous clients"""
+    keys = []
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        keys.append('replica-pin:auth:' + hashlib.sha256(authorization.encode()).hexdigest())
+    keys.append('replica-pin:addr:' + request.META.get('REMOTE_ADDR', ''))
+    return keys
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Routes the reads of safe requests to a replica with read-your-writes
+
+    A client which just wrote is pinned to the primary for
+    `REPLICA_STICKINESS_SECONDS` so it sees its own writes despite the
+    replication lag. A request failing on a replica is retried once on
+    the primary and the replica is skipped for `REPLICA_RETRY_AFTER`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        alias = None
+        if request.method in SAFE_METHODS and settings.DATABASE_REPLICAS and not self._is_pinned(request):
+            alias = pick_replica()
+
+        token = read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+
+        if request.method not in SAFE_METHODS and settings.DATABASE_REPLICAS:
+            self._pin(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._replica_view = (view_func, view_args, view_kwargs)
+
+    def process_exception(self, request, exception):
+        alias = read_alias.get()
+        if alias is None or not isinstance(exception, (OperationalError, InterfaceError)):
+            return None
+        mark_unhealthy(alias)
+        read_alias.set(None)
+        view_func, view_args, view_kwargs = request._replica_view
+        return view_func(request, *view_args, **view_kwargs)
+
+    @staticmethod
+    def _is_pinned(request):
+        return bool(cache.get_many(_pin_keys(request)))
+
+    @staticmethod
+    def _pin(request):
+        keys = _pin_keys(request)
+        if len(keys) > 1:
+            # Authenticated clients are identified by their token alone
+            keys = keys[:1]
+        cache.set_many(dict.fromkeys(keys, True), settings.REPLICA_STICKINESS_SECONDS)
@@ -0,0 +1,127 @@
+"""
+Prometheus metrics of the API, served at `/metrics`
+
+When several server processes run, set `PROMETHEUS_MULTIPROC_DIR` to an
+empty directory shared by all of them before they start: every process
+then writes its samples to memory-mapped files in it and `/metrics`
+aggregates the files of all processes. Empty the directory on restarts.
+"""
+import os
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Seconds, from a cached retrieve up to a slow search or export
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+QUERY_DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+PAGE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 500, 1000)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', "Request latency by view, action and status code",
+    ['view', 'action', 'status'], buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', "Database queries per request by view and action",
+    ['view', 'action'], buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', "Time spent in the database per request by view and action",
+    ['view', 'action'], buckets=LATENCY_BUCKETS,
+)
+QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', "Duration of single database queries by database alias",
+    ['database'], buckets=QUERY_DURATION_BUCKETS,
+)
+PAGINATION_DEPTH = Histogram(
+    'decision_list_page', "Page number requested from the decision list", buckets=PAGE_BUCKETS,
+)
+COUNT_SOURCE = Counter(
+    'decision_list_count', "Where decision list counts came from: counters, exact, cache, estimate or full",
+    ['source'],
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests', "Cache lookups by cache and result, hit or miss", ['cache', 'result'],
+)
+EVALUATION_RESETS = Counter(
+    'decision_evaluation_resets', "Evaluations deleted because their decision was reopened or its goal changed",
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    'admission_in_flight_requests', "Requests being processed per route class", ['route_class'],
+    multiprocess_mode='livesum',
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'admission_queue_depth', "Requests waiting for a slot per route class", ['route_class'],
+    multiprocess_mode='livesum',
+)
+ADMISSION_SHED = Counter(
+    'admission_shed', "Requests rejected with 503 per route class and reason", ['route_class', 'reason'],
+)
+
+
+def metrics_view(request):
+    """Metrics in the Prometheus text exposition format, of every process in multiprocess mode"""
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def view_labels(request):
+    """
+    The view and action of a resolved request
+
+    The action is the viewset action, e.g. `list` or `evaluate`, and the
+    route name for other views, e.g. `login`.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', ''
+    view = match.func
+    cls = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+    action = (getattr(view, 'actions', None) or {}).get(request.method.lower())
+    return (cls or view).__name__, action or match.url_name or ''
+
+
+class QueryTimer:
+    """Database execution wrapper counting and timing the queries of a request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            QUERY_DURATION.labels(context['connection'].alias).observe(duration)
+
+
+class MetricsMiddleware:
+    """Records latency and database usage of every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        view, action = view_labels(request)
+        REQUEST_LATENCY.labels(view, action, str(response.status_code)).observe(time.perf_counter() - start)
+        REQUEST_QUERIES.labels(view, action).observe(timer.count)
+        REQUEST_DB_TIME.labels(view, action).observe(timer.duration)
+        return response
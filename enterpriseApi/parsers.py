@@ -0,0 +1,21 @@
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from enterpriseApi.renderers import ORJSONRenderer
+
+
+class ORJSONParser(JSONParser):
+    """
+    Parses JSON-serialized data using orjson.
+
+    JSON request bodies are always UTF-8, so the raw bytes are handed to
+    orjson directly instead of going through a decoding reader.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read() if stream is not None else b'')
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
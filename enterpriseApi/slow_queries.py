@@ -0,0 +1,174 @@
+"""
+Log of the slow database queries of the requests served by this process
+
+Queries slower than `SLOW_QUERY_THRESHOLD_MS` are kept in a ring buffer
+together with the view and action which ran them, their fingerprint and,
+once per fingerprint and `SLOW_QUERY_EXPLAIN_INTERVAL`, their plan.
+`GET /api/admin/slow-queries` aggregates them by fingerprint.
+"""
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from enterpriseApi.metrics import view_labels
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    Normalize `sql` so queries only differing by their values are grouped
+
+    Literals and placeholders become `?` and lists of them `(...)`.
+    Returns the normalized SQL and a short digest of it.
+    """
+    normalized = _STRING.sub('?', sql)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _LIST.sub('(...)', normalized)
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    return normalized, hashlib.md5(normalized.encode()).hexdigest()[:16]
+
+
+class SlowQueryLog:
+    """Thread safe ring buffer of slow queries, with the latest plan per fingerprint"""
+
+    def __init__(self, size=None):
+        self.entries = deque(maxlen=size or settings.SLOW_QUERY_LOG_SIZE)
+        # Fingerprint -> (monotonic time the plan was captured, plan)
+        self.plans = {}
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            self.entries.append(entry)
+
+    def needs_plan(self, digest):
+        captured = self.plans.get(digest)
+        return captured is None or time.monotonic() - captured[0] > settings.SLOW_QUERY_EXPLAIN_INTERVAL
+
+    def add_plan(self, digest, plan):
+        with self._lock:
+            self.plans[digest] = (time.monotonic(), plan)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.plans.clear()
+
+    def aggregate(self):
+        """Slow queries grouped by fingerprint, by total time descending"""
+        with self._lock:
+            entries = list(self.entries)
+            plans = dict(self.plans)
+        groups = {}
+        for entry in entries:
+            group = groups.setdefault(entry['fingerprint'], {
+                'fingerprint': entry['fingerprint'],
+                'sql': entry['sql'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'views': set(),
+                'last_seen': None,
+            })
+            group['count'] += 1
+            group['total_ms'] += entry['duration_ms']
+            group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+            group['views'].add(f"{entry['view']}.{entry['action']}" if entry['action'] else entry['view'])
+            group['last_seen'] = entry['at']
+        for group in groups.values():
+            group['mean_ms'] = group['total_ms'] / group['count']
+            group['views'] = sorted(group['views'])
+            group['plan'] = plans.get(group['fingerprint'], (None, None))[1]
+        return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+
+
+slow_query_log = SlowQueryLog()
+
+_explaining = threading.local()
+
+
+def explain(connection, sql, params, analyze=False):
+    """Plan of a read query as text, None if it can't be explained"""
+    prefix = connection.ops.explain_query_prefix(analyze=True) if analyze else connection.ops.explain_query_prefix()
+    _explaining.active = True
+    try:
+        # In a savepoint, so a failing EXPLAIN doesn't break the transaction of the request
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except (DatabaseError, ValueError):
+        logger.debug("Couldn't explain %s", sql, exc_info=True)
+        return None
+    finally:
+        _explaining.active = False
+
+
+class SlowQueryRecorder:
+    """Database execution wrapper recording the slow queries of a request"""
+
+    def __init__(self, request, log=slow_query_log):
+        self.request = request
+        self.log = log
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_explaining, 'active', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+            self.record(context['connection'], sql, params, many, duration_ms)
+        return result
+
+    def record(self, connection, sql, params, many, duration_ms):
+        normalized, digest = fingerprint(sql)
+        view, action = view_labels(self.request)
+        self.log.add({
+            'fingerprint': digest,
+            'sql': normalized,
+            'duration_ms': duration_ms,
+            'database': connection.alias,
+            'view': view,
+            'action': action,
+            'at': timezone.now(),
+        })
+        logger.warning("Slow query %s (%.1fms) in %s.%s: %s", digest, duration_ms, view, action, normalized)
+
+        is_read = not many and sql.lstrip()[:6].upper() == 'SELECT'
+        if settings.SLOW_QUERY_EXPLAIN and is_read and self.log.needs_plan(digest):
+            # ANALYZE runs the query again, so it is only sampled and only done for reads
+            analyze = connection.vendor == 'postgresql' and random.random() < settings.SLOW_QUERY_ANALYZE_SAMPLE_RATE
+            plan = explain(connection, sql, params, analyze)
+            if plan is not None:
+                self.log.add_plan(digest, plan)
+
+
+class SlowQueryMiddleware:
+    """Records the slow queries of every request in `slow_query_log`"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = SlowQueryRecorder(request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            return self.get_response(request)
@@ -0,0 +1,48 @@
+import re
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from enterpriseApi.renderers import dumps
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def accepts_gzip(request):
+    """Whether the client negotiated gzip through its Accept-Encoding header"""
+    return bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+def _json_page(envelope, items, serialize):
+    if envelope is None:
+        yield b'['
+    elif envelope:
+        yield dumps(envelope)[:-1] + b',"results":['
+    else:
+        yield b'{"results":['
+    for index, item in enumerate(items):
+        chunk = dumps(serialize(item))
+        yield b',' + chunk if index else chunk
+    yield b']' if envelope is None else b']}'
+
+
+class StreamingJSONPageResponse(StreamingHttpResponse):
+    """
+    Streams a paginated JSON page without building the whole body in memory.
+
+    `envelope` holds the pagination keys (count, next, previous, ...),
+    `items` are the page objects and `serialize` turns a single item into
+    primitive data. The body has the same shape as a regular paginated
+    response, or is a bare array when `envelope` is None. It is gzip compressed when the request accepts it.
+    """
+
+    def __init__(self, request, envelope, items, serialize, **kwargs):
+        content = _json_page(envelope, items, serialize)
+        compress = accepts_gzip(request)
+        if compress:
+            content = compress_sequence(content)
+        super().__init__(content, content_type='application/json', **kwargs)
+        patch_vary_headers(self, ('Accept-Encoding',))
+        if compress:
+            self['Content-Encoding'] = 'gzip'
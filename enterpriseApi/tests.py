@@ -0,0 +1,532 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+from django.db import OperationalError, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from decisions.models import Decision, DecisionStatusCount
+from decisions.pagination import DecisionPagination
+from enterpriseApi import db_router
+from enterpriseApi.admission import Limiter
+from enterpriseApi.cache import SQLiteCache
+from enterpriseApi.metrics import ADMISSION_SHED, EVALUATION_RESETS, REGISTRY
+from enterpriseApi.slow_queries import fingerprint, slow_query_log
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+class TestReplicaRouting:
+    @pytest.fixture(autouse=True)
+    def replicas(self, settings):
+        settings.DATABASE_REPLICAS = ["replica"]
+        cache.clear()
+        db_router._unhealthy_until.clear()
+
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def normal_user(self, django_user_model):
+        return django_user_model.objects.create_user(username="user", email="user@example.com", password="password")
+
+    @pytest.fixture
+    def decision_data(self):
+        return {"title": "Test Decision", "description": "Description", "measurable_goal": "Goal", "status": "Pending"}
+
+    def test_safe_requests_read_from_replica(self, api_client, decision_data):
+        """Test that list and retrieve read from the replica only."""
+        decision = Decision.objects.create(**decision_data)
+        DecisionStatusCount.rebuild("default")
+        with CaptureQueriesContext(connections["default"]) as primary, CaptureQueriesContext(connections["replica"]) as replica:
+            assert api_client.get(reverse("decision-list")).status_code == status.HTTP_200_OK
+            assert api_client.get(reverse("decision-detail", kwargs={"pk": decision.pk})).status_code == status.HTTP_200_OK
+        assert replica.captured_queries
+        assert not primary.captured_queries
+
+    def test_writer_reads_own_writes_from_primary(self, api_client, decision_data, normal_user):
+        """Test that a client is pinned to the primary right after writing."""
+        DecisionStatusCount.rebuild("default")
+        api_client.credentials(HTTP_AUTHORIZATION="Token abc")
+        api_client.force_authenticate(user=normal_user)
+        assert api_client.post(reverse("decision-list"), decision_data).status_code == status.HTTP_201_CREATED
+
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = api_client.get(reverse("decision-list"))
+        assert response.data["count"] == 1
+        assert not replica.captured_queries
+
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION="Token def")
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            other_client.get(reverse("decision-list"))
+        assert replica.captured_queries
+
+    def test_pin_expires(self, api_client, decision_data, normal_user, settings):
+        """Test that the pin to the primary only lasts for the stickiness window."""
+        settings.REPLICA_STICKINESS_SECONDS = 0.01
+        api_client.force_authenticate(user=normal_user)
+        api_client.post(reverse("decision-list"), decision_data)
+        time.sleep(0.02)
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            api_client.get(reverse("decision-list"))
+        assert replica.captured_queries
+
+    def test_failing_replica_falls_back_to_primary(self, api_client, decision_data, monkeypatch):
+        """Test that a replica which can't be reached is skipped."""
+        decision = Decision.objects.create(**decision_data)
+
+        def unreachable():
+            raise OperationalError("replica is down")
+
+        monkeypatch.setattr(connections["replica"], "ensure_connection", unreachable)
+        response = api_client.get(reverse("decision-detail", kwargs={"pk": decision.pk}))
+        assert response.status_code == status.HTTP_200_OK
+        assert not db_router.is_healthy("replica")
+
+    def test_replica_error_retried_on_primary(self, api_client, decision_data, monkeypatch):
+        """Test that a request failing on the replica is retried on the primary."""
+        decision = Decision.objects.create(**decision_data)
+        calls = []
+
+        def flaky_read(model, **hints):
+            alias = db_router.read_alias.get()
+            calls.append(alias)
+            if alias == "replica":
+                raise OperationalError("replica is down")
+            return alias
+
+        monkeypatch.setattr(db_router.PrimaryReplicaRouter, "db_for_read", lambda self, model, **hints: flaky_read(model))
+        response = api_client.get(reverse("decision-detail", kwargs={"pk": decision.pk}))
+        assert response.status_code == status.HTTP_200_OK
+        assert calls[0] == "replica" and calls[-1] is None
+        assert db_router.pick_replica() is None
+
+
+class TestLimiter:
+    def test_sheds_when_queue_is_full(self):
+        """Test that a request is rejected right away when all slots and the queue are taken."""
+        limiter = Limiter("test", limit=1, queue=0)
+        assert limiter.acquire() is None
+        assert limiter.acquire() == "queue_full"
+        limiter.release()
+        assert limiter.acquire() is None
+
+    def test_sheds_after_timeout(self):
+        """Test that a queued request is rejected once it waited for the timeout."""
+        limiter = Limiter("test", limit=1, queue=1, timeout=0.05)
+        limiter.acquire()
+        started = time.monotonic()
+        assert limiter.acquire() == "timeout"
+        assert time.monotonic() - started >= 0.05
+        assert limiter.waiting == 0
+
+    def test_queued_request_gets_released_slot(self):
+        """Test that a queued request runs as soon as a slot is released."""
+        limiter = Limiter("test", limit=1, queue=1, timeout=5)
+        limiter.acquire()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        waiter.start()
+        while not limiter.waiting:
+            time.sleep(0.001)
+        limiter.release()
+        waiter.join()
+        assert results == [None]
+        assert limiter.in_flight == 1
+
+    def test_priority_requests(self):
+        """Test that priority requests use the reserved slots and go ahead of queued requests."""
+        limiter = Limiter("test", limit=1, queue=1, timeout=0.05, reserved=1)
+        limiter.acquire()
+        assert limiter.acquire(priority=True) is None
+        assert limiter.acquire(priority=True) == "timeout"
+        limiter.release()
+
+        limiter.reserved = 0
+        limiter.timeout = 5
+        order = []
+        normal = threading.Thread(target=lambda: order.append(("normal", limiter.acquire())))
+        priority = threading.Thread(target=lambda: order.append(("priority", limiter.acquire(priority=True))))
+        normal.start()
+        while limiter.waiting < 1:
+            time.sleep(0.001)
+        priority.start()
+        while limiter.waiting < 2:
+            time.sleep(0.001)
+        limiter.release()
+        priority.join()
+        assert order == [("priority", None)]
+        limiter.release()
+        normal.join()
+        assert order[1] == ("normal", None)
+
+
+@pytest.mark.django_db
+class TestAdmissionControl:
+    @pytest.fixture(autouse=True)
+    def limits(self, settings):
+        settings.ADMISSION_CONTROL = {
+            "search": {"limit": 0, "queue": 0, "retry_after": 3},
+            "write": {"limit": 0, "queue": 0, "reserved": 1},
+        }
+
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    def test_saturated_class_is_shed(self, api_client):
+        """Test that requests of a saturated class get 503 with Retry-After."""
+        shed = ADMISSION_SHED.labels("search", "queue_full")._value.get()
+        response = api_client.get(reverse("decision-list"), {"search": "revenue"})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response["Retry-After"] == "3"
+        assert ADMISSION_SHED.labels("search", "queue_full")._value.get() == shed + 1
+
+    def test_other_classes_are_not_affected(self, api_client):
+        """Test that lists and retrieves keep working while searches are shed."""
+        decision = Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", status="Completed")
+        assert api_client.get(reverse("decision-list")).status_code == status.HTTP_200_OK
+        assert api_client.get(reverse("decision-detail", args=[decision.pk])).status_code == status.HTTP_200_OK
+
+    def test_evaluation_has_priority(self, api_client, admin_user):
+        """Test that evaluations are admitted on the reserved slots while other writes are shed."""
+        decision = Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", status="Completed")
+        api_client.force_authenticate(user=admin_user)
+        assert api_client.delete(reverse("decision-detail", args=[decision.pk])).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        response = api_client.post(reverse("decision-evaluate", args=[decision.pk]), {"goal_met": True, "comments": "Done"})
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_metrics(self, api_client):
+        """Test that shed requests and queue depths are exposed on /metrics."""
+        api_client.get(reverse("decision-list"), {"search": "revenue"})
+        response = api_client.get(reverse("metrics"))
+        assert response.status_code == status.HTTP_200_OK
+        body = response.content.decode()
+        assert 'admission_shed_total{reason="queue_full",route_class="search"}' in body
+        assert "admission_queue_depth" in body
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.django_db
+class TestMetrics:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    @pytest.fixture
+    def decision(self):
+        return Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", status="Completed")
+
+    def test_request_latency_and_queries(self, api_client, decision):
+        """Test that requests are timed and their queries counted by view, action and status code."""
+        labels = {"view": "DecisionViewSet", "action": "retrieve"}
+        requests = sample("http_request_duration_seconds_count", status="200", **labels)
+        queries = sample("http_request_db_queries_sum", **labels)
+        api_client.get(reverse("decision-detail", args=[decision.pk]))
+        api_client.get(reverse("decision-detail", args=[0]))
+
+        assert sample("http_request_duration_seconds_count", status="200", **labels) == requests + 1
+        assert sample("http_request_duration_seconds_count", status="404", **labels) >= 1
+        assert sample("http_request_db_queries_sum", **labels) > queries
+        assert sample("db_query_duration_seconds_count", database="default") > 0
+
+    def test_views_without_actions(self, api_client):
+        """Test that plain API views are labelled with their route name."""
+        api_client.post(reverse("authentication:login"), {"username": "nobody", "password": "password"})
+        assert sample("http_request_duration_seconds_count", view="UserLoginAPIView", action="login", status="400") >= 1
+
+    def test_pagination_and_count_cache(self, api_client, monkeypatch):
+        """Test that requested pages and count cache lookups are recorded."""
+        pages = sample("decision_list_page_bucket", le="5.0") - sample("decision_list_page_bucket", le="2.0")
+        Decision.objects.bulk_create([
+            Decision(title=f"Decision {i}", description="Description", measurable_goal="Goal", status="Pending") for i in range(40)
+        ])
+        api_client.get(reverse("decision-list"), {"page": 3})
+        assert sample("decision_list_page_bucket", le="5.0") - sample("decision_list_page_bucket", le="2.0") == pages + 1
+
+        monkeypatch.setattr(DecisionPagination, "exact_count_threshold", 10)
+        misses = sample("cache_requests_total", cache="decision_count", result="miss")
+        hits = sample("cache_requests_total", cache="decision_count", result="hit")
+        cache.clear()
+        api_client.get(reverse("decision-list"), {"search": "Decision"})
+        api_client.get(reverse("decision-list"), {"search": "Decision"})
+        assert sample("cache_requests_total", cache="decision_count", result="miss") == misses + 1
+        assert sample("cache_requests_total", cache="decision_count", result="hit") == hits + 1
+
+    def test_evaluation_resets(self, api_client, admin_user, decision):
+        """Test that evaluations deleted by an update are counted."""
+        api_client.force_authenticate(user=admin_user)
+        api_client.post(reverse("decision-evaluate", args=[decision.pk]), {"goal_met": True, "comments": "Done"})
+        resets = EVALUATION_RESETS._value.get()
+        data = {"title": "Title", "description": "Description", "measurable_goal": "Goal", "status": "Pending"}
+        api_client.put(reverse("decision-detail", args=[decision.pk]), data)
+        assert EVALUATION_RESETS._value.get() == resets + 1
+
+    def test_multiprocess_aggregation(self, api_client, tmp_path, monkeypatch):
+        """Test that /metrics sums the samples written by every process to the shared directory."""
+        script = "from enterpriseApi.metrics import EVALUATION_RESETS; EVALUATION_RESETS.inc(2)"
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+        for _ in range(3):
+            subprocess.run([sys.executable, "-c", script], env=env, check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+        response = api_client.get(reverse("metrics"))
+        assert "decision_evaluation_resets_total 6.0" in response.content.decode()
+
+
+class TestSQLiteCache:
+    @pytest.fixture
+    def path(self, tmp_path):
+        return tmp_path / "cache.sqlite3"
+
+    @pytest.fixture
+    def shared_cache(self, path):
+        return SQLiteCache(path, {"OPTIONS": {"MAX_ENTRIES": 10, "CULL_INTERVAL": 1, "LRU_RESOLUTION": 0}})
+
+    def test_operations(self, shared_cache):
+        """Test that the backend follows the Django cache API."""
+        shared_cache.set("a", {"value": 1})
+        assert shared_cache.get("a") == {"value": 1}
+        assert shared_cache.get("missing", "default") == "default"
+        assert not shared_cache.add("a", 2)
+        assert shared_cache.add("b", 2)
+        assert shared_cache.get_many(["a", "b", "missing"]) == {"a": {"value": 1}, "b": 2}
+        assert shared_cache.incr("b", 3) == 5
+        assert shared_cache.get_or_set("c", 3) == 3
+        with pytest.raises(ValueError):
+            shared_cache.incr("missing")
+        assert shared_cache.delete("a") and not shared_cache.has_key("a")
+        shared_cache.set_many({"d": 4, "e": 5})
+        shared_cache.delete_many(["d", "e"])
+        assert shared_cache.get_many(["d", "e"]) == {}
+        shared_cache.clear()
+        assert shared_cache.get("b") is None
+
+    def test_expiry(self, shared_cache):
+        """Test that expired entries are missed and can be added again."""
+        shared_cache.set("a", 1, 0.05)
+        shared_cache.set("b", 1, None)
+        assert shared_cache.touch("b", 0.05)
+        time.sleep(0.1)
+        assert shared_cache.get("a") is None
+        assert not shared_cache.has_key("b")
+        assert shared_cache.add("a", 2)
+        assert shared_cache.get("a") == 2
+
+    def test_least_recently_used_are_evicted(self, shared_cache):
+        """Test that beyond MAX_ENTRIES the entries read least recently are evicted first."""
+        for i in range(10):
+            shared_cache.set(f"key{i}", i)
+        shared_cache.get("key0")
+        shared_cache.set("key10", 10)
+        assert shared_cache.get("key0") == 0
+        assert shared_cache.get("key1") is None
+        assert shared_cache.get("key10") == 10
+
+    def test_shared_by_processes(self, shared_cache, path):
+        """Test that the entries are shared and increments atomic across processes."""
+        shared_cache.set("version", 0)
+        script = (
+            "import sys; from enterpriseApi.cache import SQLiteCache; cache = SQLiteCache(sys.argv[1], {}); "
+            "[cache.incr('version') for _ in range(50)]"
+        )
+        processes = [
+            subprocess.Popen([sys.executable, "-c", script, str(path)], cwd=os.path.dirname(os.path.dirname(__file__)))
+            for _ in range(4)
+        ]
+        assert all(process.wait() == 0 for process in processes)
+        assert shared_cache.get("version") == 200
+
+
+class TestFingerprint:
+    def test_values_are_normalized(self):
+        """Test that queries differing only by their values share a fingerprint."""
+        first = fingerprint("SELECT * FROM \"t\" WHERE \"title\" LIKE '%a%' AND \"id\" IN (1, 2, 3) LIMIT 21")
+        second = fingerprint("SELECT *  FROM \"t\" WHERE \"title\" LIKE '%bc%' AND \"id\" IN (4) LIMIT 10")
+        assert first == second
+        assert first[0] == 'SELECT * FROM "t" WHERE "title" LIKE ? AND "id" IN (...) LIMIT ?'
+
+    def test_placeholders_and_identifiers(self):
+        """Test that placeholders are normalized and digits in identifiers are kept."""
+        normalized, _ = fingerprint('SELECT "shard_1"."col2" FROM "t1" WHERE "a" = %s AND "b" IN (%s, %s)')
+        assert normalized == 'SELECT "shard_1"."col2" FROM "t1" WHERE "a" = ? AND "b" IN (...)'
+
+
+@pytest.mark.django_db
+class TestSlowQueryLog:
+    @pytest.fixture(autouse=True)
+    def log_every_query(self, settings):
+        settings.SLOW_QUERY_THRESHOLD_MS = 0
+        slow_query_log.clear()
+        yield
+        slow_query_log.clear()
+
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    def search(self, api_client, term):
+        api_client.get(reverse("decision-list"), {"search": term, "ordering": "status"})
+
+    def test_slow_queries_are_grouped_by_fingerprint(self, api_client, admin_user):
+        """Test that slow queries are aggregated by fingerprint with their view, action and plan."""
+        Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", status="Pending")
+        self.search(api_client, "Title")
+        self.search(api_client, "Goal")
+
+        api_client.force_authenticate(user=admin_user)
+        response = api_client.get(reverse("slow-queries"))
+        assert response.status_code == status.HTTP_200_OK
+        searches = [group for group in response.json() if "LIKE" in group["sql"] and "ORDER BY" in group["sql"]]
+        assert len(searches) == 1
+        search = searches[0]
+        assert search["count"] == 2
+        assert search["views"] == ["DecisionViewSet.list"]
+        assert "Title" not in search["sql"]
+        assert search["plan"]
+        totals = [group["total_ms"] for group in response.json()]
+        assert totals == sorted(totals, reverse=True)
+
+    def test_threshold(self, api_client, settings):
+        """Test that queries faster than the threshold are not recorded."""
+        settings.SLOW_QUERY_THRESHOLD_MS = 10 ** 6
+        self.search(api_client, "first")
+        assert slow_query_log.aggregate() == []
+
+    def test_requires_admin(self, api_client, django_user_model):
+        """Test that only administrators can read and clear the slow query log."""
+        user = django_user_model.objects.create_user(username="user", email="user@example.com", password="password")
+        api_client.force_authenticate(user=user)
+        assert api_client.get(reverse("slow-queries")).status_code == status.HTTP_403_FORBIDDEN
+        assert api_client.delete(reverse("slow-queries")).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_clear(self, api_client, admin_user):
+        """Test that administrators can clear the slow query log."""
+        self.search(api_client, "first")
+        api_client.force_authenticate(user=admin_user)
+        assert api_client.delete(reverse("slow-queries")).status_code == status.HTTP_204_NO_CONTENT
+        assert slow_query_log.aggregate() == []
+
+
+@pytest.mark.django_db
+class TestBatch:
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def normal_user(self, django_user_model):
+        return django_user_model.objects.create_user(username="user", email="user@example.com", password="password")
+
+    @pytest.fixture
+    def decision(self):
+        return Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", status="Pending")
+
+    def batch(self, api_client, requests, **options):
+        response = api_client.post(reverse("batch"), {"requests": requests, **options})
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()
+
+    def test_sub_requests_run_in_order(self, api_client, normal_user, decision):
+        """Test that sub-requests run in order with their own status codes, headers and bodies."""
+        api_client.force_authenticate(user=normal_user)
+        data = {"title": "Created", "description": "Description", "measurable_goal": "Goal"}
+        results = self.batch(api_client, [
+            {"method": "POST", "path": "/api/decisions", "body": data},
+            {"path": "/api/decisions?ordering=-title", "id": "list"},
+            {"path": f"/api/decisions/{decision.pk}"},
+            {"method": "PUT", "path": f"/api/decisions/{decision.pk}", "headers": {"If-Match": '"7"'}, "body": data},
+            {"path": "/api/unknown"},
+        ])
+        assert [result["status"] for result in results] == [201, 200, 200, 412, 404]
+        assert [result["id"] for result in results] == ["0", "list", "2", "3", "4"]
+        assert [decision["title"] for decision in results[1]["body"]["results"]] == ["Title", "Created"]
+        assert results[2]["headers"] == {"ETag": '"1"'}
+
+    def test_sub_requests_are_authorized(self, api_client, decision):
+        """Test that sub-requests get the authentication of the batch and their own permission checks."""
+        results = self.batch(api_client, [
+            {"path": f"/api/decisions/{decision.pk}"},
+            {"method": "DELETE", "path": f"/api/decisions/{decision.pk}"},
+        ])
+        assert [result["status"] for result in results] == [200, 401]
+        assert Decision.objects.filter(pk=decision.pk).exists()
+
+    def test_streamed_sub_request(self, api_client, decision):
+        """Test that a streamed read is decoded into the batch even when the batch accepts gzip, and an undecodable one fails alone."""
+        response = api_client.post(reverse("batch"), {"requests": [
+            {"path": "/api/decisions?stream=true"},
+            {"path": "/api/decisions?stream=true", "headers": {"Accept-Encoding": "gzip"}},
+            {"path": f"/api/decisions/{decision.pk}"},
+        ]}, HTTP_ACCEPT_ENCODING="gzip")
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()
+        assert [result["status"] for result in results] == [200, 500, 200]
+        assert [item["title"] for item in results[0]["body"]["results"]] == ["Title"]
+
+    def test_invalid_paths(self, api_client):
+        """Test that only API routes can be batched, and not the batch itself."""
+        results = self.batch(api_client, [{"path": "/metrics"}, {"method": "POST", "path": "/api/batch", "body": {"requests": []}}])
+        assert [result["status"] for result in results] == [400, 400]
+
+    def test_batch_size_is_capped(self, api_client, settings):
+        """Test that batches over the limit are rejected as a whole."""
+        settings.BATCH_MAX_REQUESTS = 2
+        response = api_client.post(reverse("batch"), {"requests": [{"path": "/api/decisions"}] * 3})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentBatch:
+    def test_reads_run_concurrently(self, django_user_model, monkeypatch):
+        """Test that consecutive reads run in threads while writes run alone and in order."""
+        from enterpriseApi import batch
+
+        decision = Decision.objects.create(title="Title", description="Description", measurable_goal="Goal", status="Pending")
+        user = django_user_model.objects.create_user(username="user", password="password")
+        threads = []
+        run_one = batch.run_one
+
+        def recording(request, item):
+            threads.append((item["method"], threading.current_thread().name))
+            return run_one(request, item)
+
+        monkeypatch.setattr(batch, "run_one", recording)
+        api_client = APIClient()
+        api_client.force_authenticate(user=user)
+        data = {"title": "Renamed", "description": "Description", "measurable_goal": "Goal", "status": "Pending"}
+        response = api_client.post(reverse("batch"), {"concurrent": True, "requests": [
+            {"path": f"/api/decisions/{decision.pk}"},
+            {"path": "/api/decisions"},
+            {"method": "PUT", "path": f"/api/decisions/{decision.pk}", "body": data},
+            {"path": f"/api/decisions/{decision.pk}"},
+        ]})
+        results = response.json()
+        assert [result["status"] for result in results] == [200, 200, 200, 200]
+        assert results[0]["body"]["title"] == "Title"
+        assert results[3]["body"]["title"] == "Renamed"
+        main = threading.current_thread().name
+        assert [thread != main for _, thread in threads] == [True, True, False, False]
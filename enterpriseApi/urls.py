@@ -14,10 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.contrib import admin
 from django.urls import path, include
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from enterpriseApi.metrics import metrics_view
+from enterpriseApi.views import BatchView, SlowQueryListView
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -33,10 +36,15 @@ schema_view = get_schema_view(
 api_urls = [
     path('', include('authentication.urls')),
     path('', include('decisions.urls')),
+    path('', include('jobs.urls')),
+    path('admin/slow-queries', SlowQueryListView.as_view(), name='slow-queries'),
+    path('batch', BatchView.as_view(), name='batch'),
 ]
 
 urlpatterns = [
     path('swagger<format>', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('api/', include(api_urls)),
+    path('metrics', metrics_view, name='metrics'),
+    path('admin/', admin.site.urls),
 ]
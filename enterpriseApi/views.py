@@ -0,0 +1,62 @@
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+
+from enterpriseApi.batch import BatchSerializer, run_batch
+from enterpriseApi.slow_queries import slow_query_log
+
+COMMON_RESPONSES = {
+    401: openapi.Response(description="Unauthorized"),
+    403: openapi.Response(description="Forbidden"),
+    500: openapi.Response(description="Internal Server Error"),
+}
+
+
+class SlowQueryListView(APIView):
+    """Slow queries of this server process, grouped by fingerprint"""
+
+    permission_classes = [IsAdminUser]
+
+    LIMIT = 50
+
+    @swagger_auto_schema(
+        operation_description="Slow queries grouped by fingerprint, by total time descending",
+        manual_parameters=[
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Maximum number of fingerprints", type=openapi.TYPE_INTEGER),
+        ],
+        responses={**COMMON_RESPONSES}
+    )
+    def get(self, request):
+        try:
+            limit = max(int(request.query_params.get('limit', self.LIMIT)), 1)
+        except ValueError:
+            limit = self.LIMIT
+        return Response(slow_query_log.aggregate()[:limit])
+
+    @swagger_auto_schema(operation_description="Clear the slow query log", responses={204: "Cleared", **COMMON_RESPONSES})
+    def delete(self, request):
+        slow_query_log.clear()
+        return Response(status=204)
+
+
+class BatchView(APIView):
+    """Runs several API requests in one, see `enterpriseApi.batch`"""
+
+    # Every sub-request is authorized by its own view
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Run up to BATCH_MAX_REQUESTS API requests in one, returns their responses in order",
+        request_body=BatchSerializer,
+        responses={
+            200: openapi.Response(description="Responses of the sub-requests, each with its own status code"),
+            400: openapi.Response(description="Bad Request"),
+            500: openapi.Response(description="Internal Server Error"),
+        }
+    )
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(run_batch(request, serializer.validated_data['requests'], serializer.validated_data['concurrent']))
@@ -0,0 +1,58 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.worker import requeue_stale, work, worker_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs. Workers are threads of this process, run more "
+        "processes, on any host, to scale out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help="Jobs run at the same time")
+        parser.add_argument('--poll-interval', type=float, default=None, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f"Released {requeued} jobs of stopped workers")
+
+        if options['concurrency'] <= 1:
+            try:
+                work(worker_name(), stop, options['poll_interval'], options['once'])
+            except KeyboardInterrupt:
+                pass
+            return
+
+        threads = [
+            threading.Thread(target=self.work, args=(worker_name(index), stop, options), daemon=True)
+            for index in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                stop.wait(settings.JOB_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            self.stdout.write("Finishing the running jobs")
+            stop.set()
+        for thread in threads:
+            thread.join()
+
+    @staticmethod
+    def work(worker, stop, options):
+        try:
+            work(worker, stop, options['poll_interval'], options['once'])
+        finally:
+            connections.close_all()
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+def default_max_attempts():
+    return settings.JOB_MAX_ATTEMPTS
+
+class Job(models.Model):
+    """
+    Model definition for Job.
+
+    A unit of background work, run by `manage.py run_workers` with the
+    handler registered for its `kind` and `payload` as keyword arguments.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='jobs')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=default_max_attempts)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Set by the worker running the job, refreshed on progress reports
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+    def output_path(self):
+        """File the job writes its output to, served by `GET /jobs/:id/download`"""
+        return Path(settings.JOB_OUTPUT_DIR) / f'job-{self.pk}.json'
+
+    def report_progress(self, done, total):
+        """Record that `done` of `total` steps are finished, extending the lease of the worker"""
+        self.progress = min(100, done * 100 // total) if total else 100
+        self.locked_at = timezone.now()
+        Job.objects.filter(pk=self.pk, status=Job.RUNNING).update(progress=self.progress, locked_at=self.locked_at)
+
+    def checkpoint(self, **state):
+        """Merge `state` into the payload, so an attempt after a failure is called with it and resumes from there"""
+        self.payload = {**self.payload, **state}
+        Job.objects.filter(pk=self.pk, status=Job.RUNNING).update(payload=self.payload)
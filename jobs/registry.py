@@ -0,0 +1,37 @@
+from jobs.models import Job
+
+# Job kind -> handler
+_handlers = {}
+
+
+class UnknownJobKind(Exception):
+    pass
+
+
+def task(kind):
+    """
+    Register the decorated function as the handler of `kind` jobs
+
+    Handlers are called with the job and its payload as keyword arguments,
+    their return value is stored as the result of the job and must be JSON
+    serializable. They may call `job.report_progress(done, total)`.
+    """
+    def register(handler):
+        _handlers[kind] = handler
+        return handler
+    return register
+
+
+def get_handler(kind):
+    try:
+        return _handlers[kind]
+    except KeyError:
+        raise UnknownJobKind(kind) from None
+
+
+def enqueue(kind, payload=None, user=None, **fields):
+    """Queue a `kind` job, to be picked up by `manage.py run_workers`"""
+    get_handler(kind)
+    if user is not None and not user.is_authenticated:
+        user = None
+    return Job.objects.create(kind=kind, payload=payload or {}, created_by=user, **fields)
@@ -0,0 +1,11 @@
+from rest_framework import serializers
+from jobs.models import Job
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for job"""
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'progress', 'attempts', 'max_attempts', 'result', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
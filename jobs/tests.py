@@ -0,0 +1,369 @@
+import io
+import json
+import threading
+import time
+import pytest
+from datetime import timedelta
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from decisions import archive, tasks
+from decisions.models import ArchivedDecision, Decision, DecisionHistory, DecisionStatusCount, DecisionTombstone, Evaluation
+from jobs.models import Job
+from jobs.registry import UnknownJobKind, enqueue, task
+from jobs.worker import claim, requeue_stale, run_job, work
+
+calls = []
+
+
+@task('tests.record')
+def record(job, value):
+    calls.append(value)
+    job.report_progress(1, 2)
+    return {'value': value}
+
+
+@task('tests.fail')
+def fail(job):
+    raise RuntimeError("Boom")
+
+
+@task('tests.slow')
+def slow(job, seconds):
+    time.sleep(seconds)
+    return {'requeued': requeue_stale()}
+
+
+@task('tests.resume')
+def resume(job, done=0):
+    calls.append(done)
+    if not done:
+        job.checkpoint(done=1)
+        raise RuntimeError("Boom")
+    return {'done': done}
+
+
+def run_workers():
+    call_command("run_workers", "--once", stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+class TestJobQueue:
+    @pytest.fixture(autouse=True)
+    def reset_calls(self):
+        calls.clear()
+
+    def test_enqueue_unknown_kind(self):
+        """Test that only jobs with a registered handler can be queued."""
+        with pytest.raises(UnknownJobKind):
+            enqueue('tests.unknown')
+
+    def test_run_job(self):
+        """Test that a worker runs a queued job and stores its result."""
+        job = enqueue('tests.record', {'value': 1})
+        run_workers()
+
+        job.refresh_from_db()
+        assert calls == [1]
+        assert job.status == Job.SUCCEEDED
+        assert job.result == {'value': 1}
+        assert job.progress == 100
+        assert job.attempts == 1
+        assert job.locked_by == ""
+
+    def test_claim_in_order(self):
+        """Test that jobs are claimed oldest first, each by one worker, and not before they are due."""
+        first = enqueue('tests.record', {'value': 1})
+        second = enqueue('tests.record', {'value': 2})
+        enqueue('tests.record', {'value': 3}, run_after=timezone.now() + timedelta(hours=1))
+
+        assert claim("a").pk == first.pk
+        claimed = claim("b")
+        assert claimed.pk == second.pk
+        assert claimed.status == Job.RUNNING
+        assert claimed.locked_by == "b"
+        assert claim("c") is None
+
+    def test_progress_is_reported(self):
+        """Test that a handler's progress reports are stored while the job runs."""
+        enqueue('tests.record', {'value': 1})
+        job = claim("worker")
+        job.report_progress(1, 4)
+        job.refresh_from_db()
+        assert job.progress == 25
+
+    def test_failed_job_is_retried_then_failed(self, settings):
+        """Test that a failing job is retried with backoff and fails after its last attempt."""
+        settings.JOB_RETRY_DELAY = 10
+        job = enqueue('tests.fail', max_attempts=2)
+
+        run_workers()
+        job.refresh_from_db()
+        assert job.status == Job.QUEUED
+        assert job.error == "RuntimeError: Boom"
+        assert job.run_after > timezone.now() + timedelta(seconds=5)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_workers()
+        job.refresh_from_db()
+        assert job.status == Job.FAILED
+        assert job.attempts == 2
+        assert job.finished_at is not None
+
+    def test_retry_resumes_from_checkpoint(self):
+        """Test that the next attempt of a failed job is called with the state it checkpointed."""
+        job = enqueue('tests.resume')
+        run_workers()
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_workers()
+
+        job.refresh_from_db()
+        assert calls == [0, 1]
+        assert job.status == Job.SUCCEEDED
+        assert job.payload == {'done': 1}
+
+    def test_stale_jobs_are_requeued(self, settings):
+        """Test that the jobs of a worker which stopped reporting are given to another worker."""
+        settings.JOB_LEASE_SECONDS = 60
+        retried = enqueue('tests.record', {'value': 1})
+        exhausted = enqueue('tests.record', {'value': 2}, max_attempts=1)
+        claim("dead")
+        claim("dead")
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+
+        assert requeue_stale() == 2
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        assert retried.status == Job.QUEUED
+        assert exhausted.status == Job.FAILED
+
+    def test_outcome_of_a_requeued_job_is_ignored(self):
+        """Test that a worker which lost its job doesn't overwrite the job's state."""
+        enqueue('tests.record', {'value': 1})
+        job = claim("slow")
+        Job.objects.filter(pk=job.pk).update(status=Job.QUEUED, locked_by="")
+        run_job(job)
+        assert Job.objects.get(pk=job.pk).status == Job.QUEUED
+
+    @pytest.mark.django_db(transaction=True)
+    def test_lease_is_kept_while_running(self, settings):
+        """Test that a job running longer than the lease without reporting progress is not requeued."""
+        settings.JOB_LEASE_SECONDS = 0.3
+        job = enqueue('tests.slow', {'seconds': 0.6})
+        run_workers()
+        job.refresh_from_db()
+        assert job.status == Job.SUCCEEDED
+        assert job.result == {'requeued': 0}
+        assert job.attempts == 1
+
+    @pytest.mark.django_db(transaction=True)
+    def test_worker_requeues_stale_jobs(self, settings):
+        """Test that a single worker picks up the jobs of a stopped worker once their lease expired."""
+        settings.JOB_LEASE_SECONDS = 0.2
+        job = enqueue('tests.record', {'value': 1})
+        claim("dead")
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+
+        stop = threading.Event()
+        thread = threading.Thread(target=work, args=("worker", stop, 0.01))
+        thread.start()
+        deadline = time.monotonic() + 5
+        while Job.objects.get(pk=job.pk).status != Job.SUCCEEDED and time.monotonic() < deadline:
+            time.sleep(0.05)
+        stop.set()
+        thread.join()
+        job.refresh_from_db()
+        assert (job.status, job.attempts) == (Job.SUCCEEDED, 2)
+        assert calls == [1]
+
+    def test_worker_survives_errors(self, monkeypatch):
+        """Test that a worker carries on with the next job when running one raises."""
+        def broken(job):
+            calls.append(job.pk)
+            raise RuntimeError("Database unavailable")
+
+        monkeypatch.setattr('jobs.worker.run_job', broken)
+        first = enqueue('tests.record', {'value': 1})
+        second = enqueue('tests.record', {'value': 2})
+        run_workers()
+        assert calls == [first.pk, second.pk]
+
+    def test_work_stops(self):
+        """Test that a worker exits once it is asked to stop."""
+        stop = threading.Event()
+        stop.set()
+        work("worker", stop)
+        assert calls == []
+
+
+@pytest.mark.django_db
+class TestJobAPI:
+    @pytest.fixture(autouse=True)
+    def job_output(self, settings, tmp_path):
+        settings.JOB_OUTPUT_DIR = tmp_path
+
+    @pytest.fixture
+    def api_client(self):
+        return APIClient()
+
+    @pytest.fixture
+    def admin_user(self, django_user_model):
+        return django_user_model.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+
+    @pytest.fixture
+    def normal_user(self, django_user_model):
+        return django_user_model.objects.create_user(username="user", email="user@example.com", password="password")
+
+    @pytest.fixture
+    def decisions(self):
+        for i in range(3):
+            Decision.objects.create(title=f"Decision {i}", description="Description", measurable_goal="Goal", status="Completed" if i else "Pending")
+
+    def test_job_status_requires_auth(self, api_client):
+        """Test that anonymous clients can't poll jobs."""
+        job = enqueue('decisions.rebuild_counts', {'tenant': 'default'})
+        response = api_client.get(reverse("job-detail", args=[job.pk]))
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_job_status_of_other_users(self, api_client, normal_user, admin_user):
+        """Test that users only see their own jobs and administrators see every job."""
+        job = enqueue('decisions.rebuild_counts', {'tenant': 'default'}, user=admin_user)
+        url = reverse("job-detail", args=[job.pk])
+
+        api_client.force_authenticate(user=normal_user)
+        assert api_client.get(url).status_code == status.HTTP_404_NOT_FOUND
+        api_client.force_authenticate(user=admin_user)
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["status"] == Job.QUEUED
+
+    def test_export(self, api_client, normal_user, decisions):
+        """Test that an export returns 202 with a job whose output can be downloaded once it has run."""
+        api_client.force_authenticate(user=normal_user)
+        response = api_client.post(reverse("decision-export") + "?status=Completed")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        job_url = response["Location"]
+        assert response.json()["url"] == job_url
+
+        download = reverse("job-download", args=[response.json()["id"]])
+        assert api_client.get(download).status_code == status.HTTP_409_CONFLICT
+
+        run_workers()
+        job = api_client.get(job_url).json()
+        assert job["status"] == Job.SUCCEEDED
+        assert job["result"]["count"] == 2
+
+        response = api_client.get(download)
+        assert response.status_code == status.HTTP_200_OK
+        exported = json.loads(b"".join(response.streaming_content))
+        assert sorted(decision["title"] for decision in exported) == ["Decision 1", "Decision 2"]
+
+    def test_export_invalid_status(self, api_client, normal_user):
+        """Test that an export with an unknown status is rejected."""
+        api_client.force_authenticate(user=normal_user)
+        response = api_client.post(reverse("decision-export") + "?status=Unknown")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not Job.objects.exists()
+
+    def test_rebuild_counts(self, api_client, admin_user, normal_user, decisions):
+        """Test that administrators can rebuild the status counters in the background."""
+        url = reverse("decision-rebuild-counts")
+        api_client.force_authenticate(user=normal_user)
+        assert api_client.post(url).status_code == status.HTTP_403_FORBIDDEN
+
+        DecisionStatusCount.objects.all().delete()
+        api_client.force_authenticate(user=admin_user)
+        assert api_client.post(url).status_code == status.HTTP_202_ACCEPTED
+        run_workers()
+        assert DecisionStatusCount.get_counts("default")["Completed"] == 2
+        assert Job.objects.get().result["Completed"] == 2
+
+    def old_decisions(self, count, status="Pending"):
+        decisions = [
+            Decision.objects.create(title=f"Old {i}", description="Description", measurable_goal="Goal", status=status)
+            for i in range(count)
+        ]
+        Decision.objects.filter(pk__in=[decision.pk for decision in decisions]).update(created_at=timezone.now() - timedelta(days=400))
+        return decisions
+
+    def test_bulk_delete(self, api_client, admin_user, normal_user, settings):
+        """Test that administrators can delete decisions by filter, in chunks, keeping the counters and feeds in sync."""
+        settings.DECISION_BULK_DELETE_CHUNK_SIZE = 2
+        settings.DECISION_BULK_DELETE_PAUSE = 0
+        old = self.old_decisions(4)
+        evaluated = self.old_decisions(2, status="Completed")
+        for decision in evaluated:
+            Evaluation.objects.create(decision=decision, goal_met=True)
+        archive.archive_batch(timezone.now() + timedelta(days=1), 1)
+        Decision.objects.create(title="New", description="Description", measurable_goal="Goal")
+        url = reverse("decision-list") + "?created_before=" + (timezone.now() - timedelta(days=365)).date().isoformat()
+
+        api_client.force_authenticate(user=normal_user)
+        assert api_client.delete(url).status_code == status.HTTP_403_FORBIDDEN
+        api_client.force_authenticate(user=admin_user)
+        assert api_client.delete(reverse("decision-list")).status_code == status.HTTP_400_BAD_REQUEST
+        response = api_client.delete(url)
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        # Created after the request, kept
+        late = self.old_decisions(1)[0]
+
+        run_workers()
+        job = Job.objects.get(pk=response.json()["id"])
+        assert (job.status, job.result, job.progress) == (Job.SUCCEEDED, {"deleted": 6}, 100)
+        assert list(Decision.objects.values_list("pk", flat=True).order_by("pk")) == [Decision.objects.get(title="New").pk, late.pk]
+        assert not ArchivedDecision.objects.exists()
+        assert not Evaluation.objects.exists()
+        assert DecisionStatusCount.get_counts("default") == {"Pending": 2, "Completed": 0}
+        deleted = {decision.pk for decision in old + evaluated}
+        assert set(DecisionTombstone.objects.values_list("decision_id", flat=True)) == deleted
+        assert set(DecisionHistory.objects.filter(kind=DecisionHistory.DELETED).values_list("decision_id", flat=True)) == deleted
+
+    def test_bulk_delete_ignores_empty_filters(self, api_client, admin_user):
+        """Test that filters sent without a value don't count as a filter, so they can't delete every decision."""
+        api_client.force_authenticate(user=admin_user)
+        self.old_decisions(2)
+        url = reverse("decision-list")
+        assert api_client.delete(f"{url}?status=").status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.delete(f"{url}?created_after=").status_code == status.HTTP_400_BAD_REQUEST
+        assert not Job.objects.exists()
+
+        response = api_client.delete(f"{url}?status=&created_after=2000-01-01")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert Job.objects.get(pk=response.json()["id"]).payload["filters"] == {"created_after": "2000-01-01"}
+
+    def test_bulk_delete_rejects_other_parameters(self, api_client, admin_user):
+        """Test that parameters the delete wouldn't apply, like a search, are rejected rather than ignored."""
+        api_client.force_authenticate(user=admin_user)
+        self.old_decisions(2)
+        url = reverse("decision-list")
+        response = api_client.delete(f"{url}?status=Pending&search=purge")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "search" in response.json()["error"]
+        assert api_client.delete(f"{url}?status=Pending&ordering=title").status_code == status.HTTP_400_BAD_REQUEST
+        assert not Job.objects.exists()
+
+    def test_bulk_delete_resumes(self, api_client, admin_user, settings, monkeypatch):
+        """Test that an interrupted bulk delete resumes after the last chunk it deleted."""
+        settings.DECISION_BULK_DELETE_CHUNK_SIZE = 2
+        settings.DECISION_BULK_DELETE_PAUSE = 0
+        self.old_decisions(5)
+        api_client.force_authenticate(user=admin_user)
+        job_id = api_client.delete(reverse("decision-list") + "?status=Pending").json()["id"]
+
+        def interrupt(seconds):
+            raise RuntimeError("Interrupted")
+
+        monkeypatch.setattr(tasks.time, "sleep", interrupt)
+        run_workers()
+        job = Job.objects.get(pk=job_id)
+        assert (job.status, job.payload["deleted"]) == (Job.QUEUED, 2)
+        assert Decision.objects.count() == 3
+
+        monkeypatch.undo()
+        Job.objects.filter(pk=job_id).update(run_after=timezone.now())
+        run_workers()
+        job.refresh_from_db()
+        assert (job.status, job.result) == (Job.SUCCEEDED, {"deleted": 5})
+        assert not Decision.objects.exists()
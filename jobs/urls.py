@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
+from .views import JobViewSet
+
+router = SimpleRouter(trailing_slash=False)
+router.register(r'jobs', JobViewSet, basename='job')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
@@ -0,0 +1,62 @@
+from django.http import FileResponse, Http404
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+
+from jobs.models import Job
+from jobs.serializers import JobSerializer
+
+COMMON_RESPONSES = {
+    401: openapi.Response(description="Unauthorized"),
+    404: openapi.Response(description="Not Found"),
+    500: openapi.Response(description="Internal Server Error"),
+}
+
+
+def job_accepted(request, job):
+    """202 response for an action handed over to a background job"""
+    data = JobSerializer(job).data
+    url = reverse('job-detail', args=[job.pk], request=request)
+    data['url'] = url
+    return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
+
+class JobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    A viewset for polling background jobs.
+
+    Users see the jobs they started, administrators see every job.
+    """
+
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(created_by=self.request.user)
+
+    @swagger_auto_schema(operation_description="Get the status of a job", responses={**COMMON_RESPONSES})
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @swagger_auto_schema(
+        operation_description="Download the output of a succeeded job",
+        responses={
+            409: openapi.Response(description="The job hasn't succeeded"),
+            **COMMON_RESPONSES
+        }
+    )
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != Job.SUCCEEDED:
+            return Response({"error": f"The job is {job.status}."}, status=status.HTTP_409_CONFLICT)
+        path = job.output_path()
+        if not path.exists():
+            raise Http404
+        return FileResponse(path.open('rb'), as_attachment=True, filename=path.name, content_type='application/json')
@@ -0,0 +1,149 @@
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.registry import UnknownJobKind, get_handler
+
+logger = logging.getLogger(__name__)
+
+# Queued jobs a worker tries to claim per poll when it can't lock rows
+CLAIM_CANDIDATES = 10
+
+
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def claim(worker):
+    """
+    Mark the next due job as running on `worker` and return it, None when the queue is empty
+
+    Rows are locked with `SELECT ... FOR UPDATE SKIP LOCKED` where the
+    database supports it, so concurrent workers never wait on each other.
+    Elsewhere (SQLite) a job is claimed by a conditional update of its
+    status, which only one worker can win.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'pk')
+    claimed = {'status': Job.RUNNING, 'locked_by': worker, 'locked_at': now, 'started_at': now}
+
+    if connections[DEFAULT_DB_ALIAS].features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = due.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(attempts=F('attempts') + 1, **claimed)
+    else:
+        for pk in due.values_list('pk', flat=True)[:CLAIM_CANDIDATES]:
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(attempts=F('attempts') + 1, **claimed):
+                break
+        else:
+            return None
+        job = Job(pk=pk)
+    job.refresh_from_db()
+    return job
+
+
+def requeue_stale():
+    """
+    Give back the jobs of workers which died, those which didn't report for `JOB_LEASE_SECONDS`
+
+    Returns the number of jobs requeued or failed.
+    """
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=settings.JOB_LEASE_SECONDS))
+    released = {'locked_by': '', 'locked_at': None, 'error': 'The worker running the job stopped responding.'}
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Job.FAILED, finished_at=timezone.now(), **released)
+    return failed + stale.update(status=Job.QUEUED, **released)
+
+
+@contextmanager
+def lease_kept(job):
+    """
+    Extend the lease of `job` from a thread while the block runs
+
+    Handlers report progress between steps, but a single step can take
+    longer than `JOB_LEASE_SECONDS`: without this the job would be given
+    to another worker while it still runs.
+    """
+    stop = threading.Event()
+
+    def renew():
+        try:
+            while not stop.wait(settings.JOB_LEASE_SECONDS / 3):
+                Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(locked_at=timezone.now())
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=renew, name=f'job-{job.pk}-lease', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome, retrying it later with backoff if it raises"""
+    now = timezone.now
+    try:
+        with lease_kept(job):
+            result = get_handler(job.kind)(job, **job.payload)
+    except UnknownJobKind:
+        outcome = {'status': Job.FAILED, 'finished_at': now(), 'error': f'Unknown job kind {job.kind!r}.'}
+    except Exception as error:
+        logger.exception("Job %s failed on attempt %s", job, job.attempts)
+        # Shown to the owner of the job, the traceback only goes to the log
+        outcome = {'error': f'{type(error).__name__}: {error}'}
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            outcome.update(status=Job.QUEUED, run_after=now() + timedelta(seconds=delay))
+        else:
+            outcome.update(status=Job.FAILED, finished_at=now())
+    else:
+        outcome = {'status': Job.SUCCEEDED, 'result': result, 'progress': 100, 'finished_at': now(), 'error': ''}
+
+    outcome.update(locked_by='', locked_at=None)
+    # A job requeued as stale meanwhile belongs to another worker now
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(**outcome)
+    for field, value in outcome.items():
+        setattr(job, field, value)
+    return job
+
+
+def work(worker, stop, poll_interval=None, once=False):
+    """
+    Run jobs until `stop` is set, or until the queue is empty with `once`
+
+    `stop` is a `threading.Event`, a job being run is always finished.
+    Every quarter of `JOB_LEASE_SECONDS` the jobs of stopped workers are
+    requeued, so one worker alone still picks them up.
+    """
+    poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+    requeued_at = time.monotonic()
+    while not stop.is_set():
+        close_old_connections()
+        if time.monotonic() - requeued_at >= settings.JOB_LEASE_SECONDS / 4:
+            requeue_stale()
+            requeued_at = time.monotonic()
+        job = claim(worker)
+        if job is None:
+            if once:
+                return
+            stop.wait(poll_interval)
+            continue
+        try:
+            run_job(job)
+        except Exception:
+            # Left running, the job is requeued once its lease expires
+            logger.exception("Worker %s could not run job %s", worker, job)